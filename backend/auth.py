@@ -15,6 +15,8 @@ SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 43200 # 30 days
 PASSWORD_RESET_EXPIRE_MINUTES = int(os.getenv("PASSWORD_RESET_EXPIRE_MINUTES", "30"))
+# Usernames allowed to read /metrics/* and /health/providers (comma separated); empty allows any logged-in user
+METRICS_ALLOWED_USERS = {name.strip() for name in os.getenv("METRICS_ALLOWED_USERS", "").split(",") if name.strip()}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -94,3 +96,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
         print(f"DEBUG AUTH: User '{token_data.username}' not found in database")
         raise credentials_exception
     return user
+
+async def get_metrics_user(current_user: models.User = Depends(get_current_user)):
+    if METRICS_ALLOWED_USERS and current_user.username not in METRICS_ALLOWED_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to read metrics")
+    return current_user
@@ -0,0 +1,265 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+
+class MemoryCache:
+    """
+    In-process LRU cache with optional per-entry TTL.
+    Values are kept as-is, so callers should not mutate what they get back.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: Optional[float] = None):
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self._entries: OrderedDict[str, tuple[Any, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._stats["sets"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "backend": "memory",
+            **self._stats,
+            "entries": len(self._entries),
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    JSON-valued cache stored in a SQLite file, shared by every process that opens the same path.
+    Eviction is least-recently-used once the table grows past max_entries.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: int = 10000, default_ttl: Optional[float] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max(1, max_entries)
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+        self._sets_since_prune = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table}(accessed_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        try:
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._stats["hits"] += 1
+            return json.loads(value)
+        except sqlite3.Error as e:
+            print(f"Cache read error ({self.table}): {e}")
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        try:
+            conn = self._connect()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            conn.commit()
+            self._stats["sets"] += 1
+            self._sets_since_prune += 1
+            if self._sets_since_prune >= 100:
+                self._prune(conn)
+        except sqlite3.Error as e:
+            print(f"Cache write error ({self.table}): {e}")
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        self._sets_since_prune = 0
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["evictions"] += overflow
+        conn.commit()
+
+    def delete(self, key: str) -> None:
+        try:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Cache delete error ({self.table}): {e}")
+
+    def clear(self) -> None:
+        conn = self._connect()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            **self._stats,
+            "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TieredCache:
+    """
+    Bounded in-process MemoryCache in front of a shared SQLiteCache. Reads try memory first and
+    promote shared hits into it; writes go to both, so one worker's miss warms every other worker.
+    Memory entries live at most memory_ttl so a worker never serves a copy much older than the shared one.
+    """
+
+    def __init__(self, memory: MemoryCache, shared: SQLiteCache, memory_ttl: Optional[float] = None):
+        self.memory = memory
+        self.shared = shared
+        self.memory_ttl = memory_ttl
+
+    def _memory_ttl(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.shared.default_ttl if ttl is None else ttl
+        if not self.memory_ttl:
+            return ttl
+        return min(ttl, self.memory_ttl) if ttl else self.memory_ttl
+
+    def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            self.memory.set(key, value, ttl=self._memory_ttl(None))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl=self._memory_ttl(ttl))
+        self.shared.set(key, value, ttl=ttl)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        self.shared.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.shared.clear()
+
+    def __len__(self) -> int:
+        return len(self.shared)
+
+    def stats(self) -> dict:
+        memory, shared = self.memory.stats(), self.shared.stats()
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + shared["hits"]
+        return {
+            "backend": "tiered",
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": memory,
+            "shared": shared,
+        }
+
+
+# Upper bound on how long a tiered cache's in-process copy may lag behind the shared tier
+TIERED_MEMORY_TTL_SECONDS = float(os.getenv("TIERED_MEMORY_TTL_SECONDS", "300"))
+
+
+def build_cache(backend: str, name: str, max_entries: int, default_ttl: Optional[float] = None, memory_entries: Optional[int] = None):
+    """
+    Returns a cache for the configured backend ("memory", "sqlite" or "tiered"), or None when disabled ("off").
+    SQLite caches live in CACHE_DIR/<name>.sqlite3 so every worker shares the same file; "tiered" puts
+    a MemoryCache of memory_entries (default max_entries) in front of it.
+    """
+    backend = (backend or "memory").strip().lower()
+    if backend in {"off", "none", "0", "false"}:
+        return None
+    if backend in {"sqlite", "tiered"}:
+        path = os.path.join(CACHE_DIR, f"{name}.sqlite3")
+        shared = SQLiteCache(path, table=name, max_entries=max_entries, default_ttl=default_ttl)
+        if backend == "sqlite":
+            return shared
+        memory = MemoryCache(max_entries=memory_entries or max_entries, default_ttl=default_ttl)
+        return TieredCache(memory, shared, memory_ttl=TIERED_MEMORY_TTL_SECONDS)
+    return MemoryCache(max_entries=max_entries, default_ttl=default_ttl)
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker: opens after `failure_threshold` consecutive failures,
+    lets a single probe through once `recovery_timeout` has passed (half-open),
+    and closes again on the first success. A probe that never reports back is
+    given up on after another `recovery_timeout`, so the breaker cannot stay stuck.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.time() >= self._opened_until:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        elif self._state == HALF_OPEN and self._probe_in_flight and time.time() - self._probe_started >= self.recovery_timeout:
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = time.time()
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._stats["successes"] += 1
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(self.recovery_timeout)
+
+    def trip(self, duration: Optional[float] = None) -> None:
+        with self._lock:
+            self._open(self.recovery_timeout if duration is None else duration)
+
+    def _open(self, duration: float) -> None:
+        if self._state != OPEN:
+            self._stats["opened"] += 1
+        self._state = OPEN
+        self._opened_until = time.time() + duration
+        self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_seconds": round(max(0.0, self._opened_until - time.time()), 2) if state == OPEN else 0.0,
+                **self._stats,
+            }
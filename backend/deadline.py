@@ -0,0 +1,48 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Request-scoped latency budget passed down through negotiator, food_data and llm_client.
+    Stages ask how much time is left, cap their own timeouts with it and record themselves
+    in `skipped` when they degrade instead of running.
+    """
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+        self.skipped: list[str] = []
+
+    def child(self) -> "Deadline":
+        """
+        Same expiry, separate skipped list; for branches whose skips only count if they win.
+        """
+        branch = Deadline(self.budget_seconds)
+        branch.expires_at = self.expires_at
+        return branch
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+    def cap(self, timeout: Optional[float]) -> float:
+        remaining = self.remaining()
+        return min(timeout, remaining) if timeout else remaining
+
+    def check(self, stage: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(f"Latency budget of {self.budget_seconds}s exhausted before '{stage}'")
+
+    def skip(self, stage: str) -> None:
+        if stage not in self.skipped:
+            self.skipped.append(stage)
@@ -1,54 +1,69 @@
 import requests
-import re
 import os
 import json
-from functools import lru_cache
-from typing import List, Dict
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Dict, Optional
+import numpy as np
 from llm_client import get_client_config, get_chat_completion
+from singleflight import SingleFlight
+from deadline import Deadline
+from cache_store import build_cache
+import nutrition_db
+import ingredient_parser
+import provider_health
 
 OPEN_FOOD_FACTS_URL = "https://world.openfoodfacts.org/cgi/search.pl"
 OFF_TIMEOUT_SECONDS = float(os.getenv("OFF_TIMEOUT_SECONDS", "1.5"))
 OFF_DEFAULT_PAGE_SIZE = int(os.getenv("OFF_DEFAULT_PAGE_SIZE", "3"))
 OFF_LOG_ERRORS = os.getenv("OFF_LOG_ERRORS", "0").strip() == "1"
+# Live OFF is only asked when the local nutrition DB (nutrition_db.py) has no match
+OFF_REMOTE_FALLBACK = os.getenv("OFF_REMOTE_FALLBACK", "1").strip() == "1"
+# Ingredient lookups of one recipe run concurrently and share this wall-clock budget
+FOOD_RESOLVE_MAX_CONCURRENCY = int(os.getenv("FOOD_RESOLVE_MAX_CONCURRENCY", "8"))
+FOOD_RESOLVE_BUDGET_SECONDS = float(os.getenv("FOOD_RESOLVE_BUDGET_SECONDS", "2.5"))
+# Lookups one call keeps in flight on that shared pool, so a long recipe or batch leaves workers for other requests
+FOOD_RESOLVE_PER_CALL_CONCURRENCY = int(os.getenv("FOOD_RESOLVE_PER_CALL_CONCURRENCY", "4"))
+FOOD_SEARCH_BATCH_MAX_ITEMS = int(os.getenv("FOOD_SEARCH_BATCH_MAX_ITEMS", "30"))
 
-# Fallback values for common staples if API fails (kcal/100g)
-COMMON_STAPLES = {
-    "azeite": 884, "oliva": 884, "mel": 304, "cebola": 40, "alho": 149,
-    "arroz": 130, "massa": 131, "espaguete": 158, "frango": 165,
-    "peru": 189, "salsicha": 250, "tomate": 18, "batata": 77,
-    "ovo": 155, "ovos": 155, "queijo": 402, "leite": 42,
-    "pao": 265, "pão": 265, "manteiga": 717,
-    "salmão": 208, "atum": 130, "carne": 250, "vaca": 250, "porco": 242,
-    "alface": 15, "cenoura": 41, "brócolos": 34, "espinafres": 23,
-    "maçã": 52, "banana": 89, "laranja": 47, "iogurte": 59, "pimento": 20
+_resolve_executor = ThreadPoolExecutor(max_workers=FOOD_RESOLVE_MAX_CONCURRENCY, thread_name_prefix="food-resolve")
+_resolve_stats = {
+    "batch_searches": 0, "runs": 0, "lookups": 0, "unresolved": 0, "off_timeouts": 0, "budget_hits": 0, "not_submitted": 0, "last_ms": None,
 }
 
+# OFF search results shared by every worker: bounded memory tier in front of a SQLite file (memory | sqlite | tiered | off)
+FOOD_SEARCH_CACHE_BACKEND = os.getenv("FOOD_SEARCH_CACHE_BACKEND", "tiered")
+FOOD_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("FOOD_SEARCH_CACHE_TTL_SECONDS", "86400"))
+FOOD_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("FOOD_SEARCH_CACHE_MAX_ENTRIES", "50000"))
+FOOD_SEARCH_CACHE_MEMORY_ENTRIES = int(os.getenv("FOOD_SEARCH_CACHE_MEMORY_ENTRIES", "1024"))
+# Empty answers and timeouts are cached too, but briefly
+FOOD_SEARCH_NEGATIVE_TTL_SECONDS = float(os.getenv("FOOD_SEARCH_NEGATIVE_TTL_SECONDS", "900"))
+FOOD_SEARCH_TIMEOUT_TTL_SECONDS = float(os.getenv("FOOD_SEARCH_TIMEOUT_TTL_SECONDS", "60"))
+
+_search_cache = build_cache(
+    FOOD_SEARCH_CACHE_BACKEND, "food_search", FOOD_SEARCH_CACHE_MAX_ENTRIES,
+    FOOD_SEARCH_CACHE_TTL_SECONDS, memory_entries=FOOD_SEARCH_CACHE_MEMORY_ENTRIES,
+)
+_search_cache_stats = {"negative_hits": 0, "empty_stored": 0, "timeouts_stored": 0}
+
+# The cache does not dedupe concurrent misses, so identical in-flight searches share one OFF call
+_search_flight = SingleFlight("off_search")
+
 def _safe_float(value, default: float = 0.0) -> float:
     try:
         return float(value)
     except (TypeError, ValueError):
         return default
 
-def _simplify_search_term(term: str) -> str:
-    # Lowercase first
-    term = term.lower()
-    # Remove "de", "da", "do", "ou", "sem", "com"
-    term = re.sub(r"\b(de|da|do|dos|das|ou|e|sem|com|fresco|natural|integral|magro|magra)\b", " ", term, flags=re.IGNORECASE)
-    # Remove punctuation
-    term = re.sub(r"[^\w\s]", "", term)
-    # Get first 1-2 significant words
-    words = term.split()
-    if not words:
-        return ""
-    # Use first two words if available (e.g. "salsicha peru"), else just one
-    return " ".join(words[:2])
-
-@lru_cache(maxsize=512)
-def _search_foods_cached(query: str, page_size: int) -> tuple[dict, ...]:
-    query = query.strip()
-    if not query:
-        return tuple()
-
+def _search_foods_remote(query: str, page_size: int) -> Optional[tuple[dict, ...]]:
+    """
+    Live OFF search. None means a transient failure (bad status, network error, OFF marked down)
+    that must not be cached. A malformed payload is recorded as a failure and re-raised.
+    """
+    if not provider_health.allow("openfoodfacts"):
+        # OFF is known to be down: answer right away instead of waiting for another timeout
+        return None
     try:
         response = requests.get(
             OPEN_FOOD_FACTS_URL,
@@ -65,7 +80,11 @@ def _search_foods_cached(query: str, page_size: int) -> tuple[dict, ...]:
         )
         
         if not response.ok:
-            return tuple()
+            if response.status_code >= 500:
+                provider_health.record_failure("openfoodfacts")
+            else:
+                provider_health.record_success("openfoodfacts")
+            return None
             
         data = response.json()
         products = data.get("products", [])
@@ -87,24 +106,134 @@ def _search_foods_cached(query: str, page_size: int) -> tuple[dict, ...]:
                 "fat_per_100g": _safe_float(nutriments.get("fat_100g", 0)),
                 "source": "openfoodfacts"
             })
-            
+        # Only a payload that parsed counts as OFF being up, so a half-open probe cannot close on garbage
+        provider_health.record_success("openfoodfacts")
         return tuple(results)
 
     except requests.exceptions.Timeout:
+        provider_health.record_failure("openfoodfacts")
         print(f"OFF Search Timeout for: {query}")
         raise requests.exceptions.Timeout(f"Timeout searching OFF for {query}")
+    except requests.exceptions.RequestException as e:
+        provider_health.record_failure("openfoodfacts")
+        if OFF_LOG_ERRORS:
+            print(f"OFF Search Error: {e}")
+        return None
     except Exception as e:
+        # Malformed payload (bad JSON, unexpected shape): still a failed call, and the probe must be released
+        provider_health.record_failure("openfoodfacts")
         if OFF_LOG_ERRORS:
             print(f"OFF Search Error: {e}")
+        raise
+
+def _search_foods_cached(query: str, page_size: int) -> tuple[dict, ...]:
+    query = query.strip()
+    if not query:
+        return tuple()
+    if _search_cache is None:
+        return _search_foods_remote(query, page_size) or tuple()
+
+    key = f"{query.lower()}|{page_size}"
+    cached = _search_cache.get(key)
+    # Negative entries carry their own expiry so a promoted in-memory copy cannot outlive it
+    if cached is not None and cached.get("until", float("inf")) > time.time():
+        if cached.get("timeout"):
+            _search_cache_stats["negative_hits"] += 1
+            raise requests.exceptions.Timeout(f"Timeout searching OFF for {query} (cached)")
+        return tuple(cached["results"])
+
+    try:
+        results = _search_foods_remote(query, page_size)
+    except requests.exceptions.Timeout:
+        until = time.time() + FOOD_SEARCH_TIMEOUT_TTL_SECONDS
+        _search_cache.set(key, {"timeout": True, "until": until}, ttl=FOOD_SEARCH_TIMEOUT_TTL_SECONDS)
+        _search_cache_stats["timeouts_stored"] += 1
+        raise
+    if results is None:
         return tuple()
+    if results:
+        _search_cache.set(key, {"results": list(results)})
+    else:
+        until = time.time() + FOOD_SEARCH_NEGATIVE_TTL_SECONDS
+        _search_cache.set(key, {"results": [], "until": until}, ttl=FOOD_SEARCH_NEGATIVE_TTL_SECONDS)
+        _search_cache_stats["empty_stored"] += 1
+    return results
 
-def search_foods(query: str, page_size: int = 10) -> List[Dict]:
+def search_foods(query: str, page_size: int = 10, remote: bool = True) -> List[Dict]:
     normalized_size = max(1, min(page_size or OFF_DEFAULT_PAGE_SIZE, 10))
-    return [dict(item) for item in _search_foods_cached(query.strip(), normalized_size)]
+    normalized_query = query.strip()
+    local_results = nutrition_db.search(normalized_query, normalized_size)
+    if local_results or not (remote and OFF_REMOTE_FALLBACK):
+        return local_results
+    results = _search_flight.do(
+        (normalized_query.lower(), normalized_size),
+        lambda: _search_foods_cached(normalized_query, normalized_size),
+    )
+    return [dict(item) for item in results]
 
-def estimate_recipe_calories_with_ai(ingredients: List[str]) -> int:
+def _map_bounded(fn: Callable, items: List[str], timeout: Optional[float]) -> tuple[Dict[Future, str], List[str]]:
+    """
+    Runs fn(item) on the shared resolve pool with at most FOOD_RESOLVE_PER_CALL_CONCURRENCY of these
+    items in flight. Nothing new is submitted once `timeout` has elapsed. Returns the finished
+    futures (-> item) and the items that never finished, whose futures are cancelled.
+    """
+    stop_at = None if timeout is None else time.monotonic() + timeout
+    queue = deque(items)
+    running: Dict[Future, str] = {}
+    finished: Dict[Future, str] = {}
+    while queue or running:
+        while queue and len(running) < max(1, FOOD_RESOLVE_PER_CALL_CONCURRENCY) and (stop_at is None or time.monotonic() < stop_at):
+            item = queue.popleft()
+            running[_resolve_executor.submit(fn, item)] = item
+        if not running:
+            break
+        done, _ = wait(running, timeout=None if stop_at is None else max(0.0, stop_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            finished[future] = running.pop(future)
+    for future in running:
+        future.cancel()
+    _resolve_stats["not_submitted"] += len(queue)
+    return finished, [*running.values(), *queue]
+
+def search_foods_batch(queries: List[str], page_size: int = OFF_DEFAULT_PAGE_SIZE) -> List[Dict]:
+    """
+    search_foods for several queries at once: duplicates are searched once, the rest concurrently
+    under FOOD_RESOLVE_BUDGET_SECONDS. Returns one {"query", "results", "error"} per input, in order.
+    """
+    unique: Dict[str, str] = {}
+    for query in queries:
+        if query.strip():
+            unique.setdefault(query.strip().lower(), query.strip())
+    done, not_done = _map_bounded(lambda key: search_foods(unique[key], page_size), list(unique), FOOD_RESOLVE_BUDGET_SECONDS)
+    outcomes: Dict[str, tuple] = {}
+    for future, key in done.items():
+        try:
+            outcomes[key] = (future.result(), None)
+        except requests.exceptions.Timeout:
+            outcomes[key] = ([], "Tempo esgotado na pesquisa deste alimento.")
+        except Exception as e:
+            outcomes[key] = ([], f"Erro na pesquisa deste alimento: {e}")
+    for key in not_done:
+        outcomes[key] = ([], "Tempo esgotado na pesquisa deste alimento.")
+
+    _resolve_stats["batch_searches"] += 1
+    items = []
+    for query in queries:
+        results, error = outcomes.get(query.strip().lower(), ([], "Pesquisa vazia."))
+        items.append({"query": query, "results": [dict(item) for item in results], "error": error})
+    return items
+
+# Least time worth spending on the LLM calorie estimate when running under a request deadline
+AI_CALORIES_MIN_SECONDS = float(os.getenv("AI_CALORIES_MIN_SECONDS", "2"))
+
+def estimate_recipe_calories_with_ai(ingredients: List[str], deadline: Optional[Deadline] = None) -> int:
     if not ingredients:
         return 0
+    if deadline is not None and not deadline.allows(AI_CALORIES_MIN_SECONDS):
+        deadline.skip("ai_calorie_estimate")
+        return 0
 
     try:
         joined = ", ".join(ingredients[:30])
@@ -121,7 +250,9 @@ def estimate_recipe_calories_with_ai(ingredients: List[str]) -> int:
             ],
             temperature=0.2,
             response_format={"type": "json_object"},
-            max_tokens=120
+            max_tokens=120,
+            profile="extract-json",
+            deadline=deadline
         )
         content = response.choices[0].message.content
         data = json.loads(content)
@@ -132,71 +263,91 @@ def estimate_recipe_calories_with_ai(ingredients: List[str]) -> int:
             print(f"AI Calories Fallback Error: {e}")
         return 0
 
-def calculate_recipe_calories(ingredients: List[str]) -> int:
-    total_calories = 0.0
-    off_available = True
+def _lookup_macros(term: str, remote: bool) -> Optional[np.ndarray]:
+    results = search_foods(term, page_size=3, remote=remote)
+    # Filter results that actually have calories
+    valid_results = [r for r in results if r["calories_per_100g"] > 0]
+    if not valid_results:
+        return None
+    best = valid_results[0]
+    return np.array([best["calories_per_100g"], best["protein_per_100g"], best["carbs_per_100g"], best["fat_per_100g"]], dtype=np.float64)
+
+def resolve_ingredient_macros(terms: List[str], deadline: Optional[Deadline] = None, remote: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Per-100g macro vector (see ingredient_parser.MACROS) for each distinct search term: staples
+    inline, everything else looked up concurrently (local nutrition DB, then OFF unless remote=False)
+    under one shared budget. Terms still unresolved when the budget runs out, or whose lookup
+    failed, are simply absent from the result.
+    """
+    resolved: Dict[str, np.ndarray] = {}
+    misses = []
+    for term in dict.fromkeys(t for t in terms if t):
+        staple = ingredient_parser.staple_macros(term)
+        if staple is not None:
+            resolved[term] = staple
+        else:
+            misses.append(term)
+    if not misses:
+        return resolved
+
+    started = time.perf_counter()
+    budget = deadline.cap(FOOD_RESOLVE_BUDGET_SECONDS) if deadline is not None else FOOD_RESOLVE_BUDGET_SECONDS
+    if remote and budget < OFF_TIMEOUT_SECONDS:
+        # Not enough budget left for an OFF round trip: local DB only
+        remote = False
+        if deadline is not None:
+            deadline.skip("off_lookup")
 
-    for ing in ingredients:
+    # Local-only lookups are fast and run to completion unless the request deadline is up
+    timeout = budget if remote else (deadline.remaining() if deadline is not None else None)
+    done, not_done = _map_bounded(lambda term: _lookup_macros(term, remote), misses, timeout)
+    timeouts = 0
+    for future, term in done.items():
         try:
-            # 1. Parse quantity
-            qty_match = re.search(r"(\d+(?:[.,]\d+)?)\s*(g|kg|ml|l|colher|unidade|chávena|dente|fatia|fatias|ovo|ovos)", ing.lower())
-            
-            multiplier = 1.0 # Default relative to 100g
-            raw_term = ing
-
-            if qty_match:
-                val = float(qty_match.group(1).replace(",", "."))
-                unit = qty_match.group(2)
-                raw_term = ing.replace(qty_match.group(0), "").strip()
-
-                if unit in ["kg", "l"]:
-                    multiplier = val * 10
-                elif unit in ["g", "ml"]:
-                    multiplier = val / 100.0
-                elif "colher" in unit:
-                    multiplier = (val * 15) / 100.0
-                elif "chávena" in unit or "xícara" in unit:
-                    multiplier = (val * 240) / 100.0
-                elif "dente" in unit:
-                    multiplier = (val * 5) / 100.0
-                else:
-                    multiplier = (val * 80) / 100.0
-            
-            # 2. Simplification strategy
-            simple_term = _simplify_search_term(raw_term)
-            
-            # Check hardcoded fallbacks first for super common low-error items
-            found_kcal = 0
-            found = False
-            
-            for key, val in COMMON_STAPLES.items():
-                if key in simple_term.lower():
-                    found_kcal = val
-                    found = True
-                    break
-            
-            if not found and off_available:
-                # Search OFF with simplified term
-                try:
-                    results = search_foods(simple_term, page_size=3)
-                    # Filter results that actually have calories
-                    valid_results = [r for r in results if r["calories_per_100g"] > 0]
-                    
-                    if valid_results:
-                        found_kcal = valid_results[0]["calories_per_100g"]
-                except requests.exceptions.Timeout:
-                    off_available = False # API is slow, don't try again for this recipe
-                except Exception:
-                    pass # Other errors, just skip this ingredient
-
-            total_calories += found_kcal * multiplier
-                
-        except Exception:
+            macros = future.result()
+        except requests.exceptions.Timeout:
+            timeouts += 1
             continue
+        except Exception:
+            continue # Other errors, just skip this ingredient
+        if macros is not None:
+            resolved[term] = macros
 
-    total_int = int(total_calories)
+    _resolve_stats["runs"] += 1
+    _resolve_stats["lookups"] += len(misses)
+    _resolve_stats["unresolved"] += len(misses) - sum(1 for term in misses if term in resolved)
+    _resolve_stats["off_timeouts"] += timeouts
+    _resolve_stats["budget_hits"] += int(bool(not_done))
+    _resolve_stats["last_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return resolved
+
+def calculate_nutrition_batch(lines: List[str], deadline: Optional[Deadline] = None, remote: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Macros for any number of ingredient lines (one recipe or thousands of rows of an analytics job).
+    Each distinct food term is resolved once. Returns "lines": (n, 4) macros per line,
+    "resolved": (n,) bool, "total": (4,) sums; columns follow ingredient_parser.MACROS.
+    """
+    parsed = [ingredient_parser.parse_line(line) for line in lines]
+    per_100g = resolve_ingredient_macros([item.term for item in parsed], deadline, remote=remote)
+    per_line = ingredient_parser.line_macros(parsed, per_100g)
+    resolved = np.fromiter((item.term in per_100g or item.to_taste for item in parsed), dtype=bool, count=len(parsed))
+    return {"lines": per_line, "resolved": resolved, "total": per_line.sum(axis=0)}
+
+def calculate_recipe_nutrition(ingredients: List[str], deadline: Optional[Deadline] = None) -> Dict[str, np.ndarray]:
+    return calculate_nutrition_batch([str(item) for item in ingredients if str(item).strip()], deadline)
+
+def calculate_recipe_calories(ingredients: List[str], deadline: Optional[Deadline] = None) -> int:
+    total_int = int(calculate_recipe_nutrition(ingredients, deadline)["total"][0])
     if total_int > 0:
         return total_int
 
     # Fallback final: if OFF/common staples failed and total is 0, ask LLM for an estimate.
-    return estimate_recipe_calories_with_ai(ingredients)
+    return estimate_recipe_calories_with_ai(ingredients, deadline)
+
+def get_food_stats() -> dict:
+    return {
+        "remote_fallback": OFF_REMOTE_FALLBACK,
+        "search_cache": {**_search_cache_stats, **(_search_cache.stats() if _search_cache is not None else {"backend": "off"})},
+        "resolver": dict(_resolve_stats),
+        "nutrition_db": nutrition_db.stats(),
+    }
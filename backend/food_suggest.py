@@ -0,0 +1,218 @@
+import os
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Iterable, Optional
+from cache_store import MemoryCache
+from meal_matcher import normalize_text, trigrams
+import food_data
+import nutrition_db
+
+# Most scanned OFF products indexed next to the PT generics (the generics are always included)
+FOOD_SUGGEST_POPULAR_LIMIT = int(os.getenv("FOOD_SUGGEST_POPULAR_LIMIT", "5000"))
+FOOD_SUGGEST_INDEX_TTL_SECONDS = float(os.getenv("FOOD_SUGGEST_INDEX_TTL_SECONDS", "3600"))
+# Share of the query trigrams a name must contain to count as a typo match ("frnago" -> "frango")
+FOOD_SUGGEST_MIN_SIMILARITY = float(os.getenv("FOOD_SUGGEST_MIN_SIMILARITY", "0.4"))
+# Remote search (full nutrition DB, then OFF) only starts at this many characters and is awaited
+# this long; a slower answer is merged into a later keystroke instead of blocking this one
+FOOD_SUGGEST_REMOTE_MIN_CHARS = int(os.getenv("FOOD_SUGGEST_REMOTE_MIN_CHARS", "3"))
+FOOD_SUGGEST_REMOTE_WAIT_SECONDS = float(os.getenv("FOOD_SUGGEST_REMOTE_WAIT_SECONDS", "0.15"))
+FOOD_SUGGEST_FAILURE_TTL_SECONDS = float(os.getenv("FOOD_SUGGEST_FAILURE_TTL_SECONDS", "30"))
+FOOD_SUGGEST_REMOTE_WORKERS = int(os.getenv("FOOD_SUGGEST_REMOTE_WORKERS", "4"))
+FOOD_SUGGEST_REMOTE_TTL_SECONDS = int(os.getenv("FOOD_SUGGEST_REMOTE_TTL_SECONDS", "300"))
+# Answers carry the user's history, which changes whenever a food is logged: always revalidate (ETag)
+CACHE_CONTROL = "private, no-cache"
+
+# A history match ranks above a popular one of the same kind, but never above a better kind of match
+_HISTORY_BOOST = 0.5
+_PREFIX_SCORE = 3.0
+_WORD_PREFIX_SCORE = 2.0
+
+_remote_executor = ThreadPoolExecutor(max_workers=FOOD_SUGGEST_REMOTE_WORKERS, thread_name_prefix="food-suggest")
+_remote_results = MemoryCache(max_entries=2048, default_ttl=FOOD_SUGGEST_REMOTE_TTL_SECONDS)
+_pending: dict[str, Future] = {}
+_pending_lock = threading.Lock()
+_index_lock = threading.Lock()
+_stats = {"requests": 0, "remote_started": 0, "remote_merged": 0, "remote_pending": 0, "remote_errors": 0, "last_local_ms": None}
+
+
+def _score(query: str, query_grams: frozenset[str], name: str, shared: int) -> Optional[float]:
+    if name.startswith(query):
+        return _PREFIX_SCORE
+    if f" {query}" in name:
+        return _WORD_PREFIX_SCORE
+    if len(query) < 3:
+        return None
+    similarity = shared / len(query_grams)
+    return similarity if similarity >= FOOD_SUGGEST_MIN_SIMILARITY else None
+
+
+class SuggestIndex:
+    """
+    Trigram inverted index over food names. Only names sharing trigrams with the query are scored,
+    so a few thousand foods answer in about a millisecond.
+    """
+
+    def __init__(self, foods: list[dict]):
+        self.foods = foods
+        self.names = [normalize_text(food["name"]) for food in foods]
+        self.postings: dict[str, list[int]] = {}
+        for position, name in enumerate(self.names):
+            for gram in trigrams(name):
+                self.postings.setdefault(gram, []).append(position)
+        self.built_at = time.time()
+
+    def search(self, query: str, query_grams: frozenset[str], limit: int) -> list[tuple[float, int, dict]]:
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        # A prefix or word-prefix match shares every query trigram but the last one or two
+        floor = min(len(query_grams) - 2, len(query_grams) * FOOD_SUGGEST_MIN_SIMILARITY)
+        scored = []
+        for position, count in shared.items():
+            if count < floor:
+                continue
+            score = _score(query, query_grams, self.names[position], count)
+            if score is not None:
+                # Foods come in popularity order, so the position breaks ties
+                scored.append((score, -position, self.foods[position]))
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return scored[:limit]
+
+
+_popular_index: Optional[SuggestIndex] = None
+
+
+def _get_popular_index() -> SuggestIndex:
+    global _popular_index
+    index = _popular_index
+    if index is not None and time.time() - index.built_at < FOOD_SUGGEST_INDEX_TTL_SECONDS:
+        return index
+    with _index_lock:
+        if _popular_index is None or time.time() - _popular_index.built_at >= FOOD_SUGGEST_INDEX_TTL_SECONDS:
+            started = time.perf_counter()
+            _popular_index = SuggestIndex(nutrition_db.popular_foods(FOOD_SUGGEST_POPULAR_LIMIT))
+            print(
+                f"Food suggest: índice com {len(_popular_index.foods)} alimentos "
+                f"em {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+        return _popular_index
+
+
+def _search_history(query: str, query_grams: frozenset[str], history: Iterable[dict]) -> list[tuple[float, int, dict]]:
+    # At most 50 entries per user, so a linear scan is cheaper than keeping an index in sync
+    scored = []
+    for position, food in enumerate(history):
+        name = normalize_text(food["name"])
+        score = _score(query, query_grams, name, len(query_grams & trigrams(name)))
+        if score is not None:
+            scored.append((score + _HISTORY_BOOST, -position, food))
+    return scored
+
+
+def _remote_lookup(key: str, query: str, limit: int) -> None:
+    try:
+        _remote_results.set(key, food_data.search_foods(query, page_size=limit))
+    except Exception as e:
+        _stats["remote_errors"] += 1
+        # Remembered briefly as empty so the following keystrokes do not retry and report pending forever
+        _remote_results.set(key, [], ttl=FOOD_SUGGEST_FAILURE_TTL_SECONDS)
+        print(f"Food suggest: pesquisa remota falhou para '{query}' ({e})")
+    finally:
+        with _pending_lock:
+            _pending.pop(key, None)
+
+
+def _remote_key(query: str, limit: int) -> str:
+    return f"{query}|{limit}"
+
+
+def _remote_foods(query: str, limit: int) -> Optional[list[dict]]:
+    """
+    Remote results for the query, or None while they are still being fetched in the background.
+    """
+    key = _remote_key(query, limit)
+    cached = _remote_results.get(key)
+    if cached is not None:
+        return cached
+    with _pending_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _remote_executor.submit(_remote_lookup, key, query, limit)
+            _pending[key] = future
+            _stats["remote_started"] += 1
+    wait([future], timeout=FOOD_SUGGEST_REMOTE_WAIT_SECONDS)
+    return _remote_results.get(key)
+
+
+def suggest(query: str, limit: int = 8, history: Iterable[dict] = (), remote: bool = True) -> dict:
+    """
+    Ranked, typo-tolerant matches for a partial query: the user's food history and popular foods
+    first (prefix, then word prefix, then trigram similarity), then remote search results when
+    they arrive in time. `remote_pending` tells the client a later request will have more.
+    """
+    _stats["requests"] += 1
+    limit = max(1, min(limit, 20))
+    normalized = normalize_text(query)
+    if not normalized:
+        return {"query": query, "items": [], "remote_pending": False}
+
+    started = time.perf_counter()
+    query_grams = trigrams(normalized)
+    scored = _search_history(normalized, query_grams, history)
+    scored.extend(_get_popular_index().search(normalized, query_grams, limit))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    _stats["last_local_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    items: list[dict] = []
+    seen: set[str] = set()
+    for _, _, food in scored:
+        name = normalize_text(food["name"])
+        if name not in seen:
+            seen.add(name)
+            items.append(food)
+
+    remote_pending = False
+    if remote and len(normalized) >= FOOD_SUGGEST_REMOTE_MIN_CHARS and len(items) < limit:
+        remote_items = _remote_foods(normalized, limit)
+        if remote_items is None:
+            remote_pending = True
+            _stats["remote_pending"] += 1
+        else:
+            _stats["remote_merged"] += 1
+            for food in remote_items:
+                name = normalize_text(food["name"])
+                if name not in seen:
+                    seen.add(name)
+                    items.append(food)
+
+    return {"query": query, "items": items[:limit], "remote_pending": remote_pending}
+
+
+def etag(query: str, limit: int, remote: bool, history_version) -> str:
+    """
+    Validator built from what an answer depends on (query, the user's history version, the popular
+    index build and whether remote results are in) rather than from the answer, so a matching
+    If-None-Match is answered before the history is loaded or anything is searched.
+    """
+    limit = max(1, min(limit, 20))
+    normalized = normalize_text(query)
+    remote_ready = (
+        remote and len(normalized) >= FOOD_SUGGEST_REMOTE_MIN_CHARS
+        and _remote_results.get(_remote_key(normalized, limit)) is not None
+    )
+    stamp = json.dumps([normalized, limit, remote, history_version, _get_popular_index().built_at, remote_ready], default=str)
+    return '"' + hashlib.sha1(stamp.encode("utf-8")).hexdigest() + '"'
+
+
+def get_stats() -> dict:
+    index = _popular_index
+    return {
+        **_stats,
+        "indexed_foods": len(index.foods) if index is not None else 0,
+        "index_age_seconds": round(time.time() - index.built_at, 1) if index is not None else None,
+        "remote_in_flight": len(_pending),
+    }
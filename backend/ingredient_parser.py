@@ -0,0 +1,165 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import numpy as np
+from meal_matcher import normalize_text
+
+# Column order of every macro vector: kcal, protein g, carbs g, fat g (per 100g or per line)
+MACROS = ("calories", "protein", "carbs", "fat")
+
+# Per 100g; kcal values are the ones calculate_recipe_calories always used for these staples
+STAPLE_MACROS = {
+    "azeite": (884, 0.0, 0.0, 100.0), "oliva": (884, 0.0, 0.0, 100.0), "mel": (304, 0.3, 82.4, 0.0),
+    "cebola": (40, 1.1, 9.3, 0.1), "alho": (149, 6.4, 33.1, 0.5), "arroz": (130, 2.7, 28.2, 0.3),
+    "massa": (131, 5.0, 25.0, 1.1), "espaguete": (158, 5.8, 30.9, 0.9), "frango": (165, 31.0, 0.0, 3.6),
+    "peru": (189, 29.0, 0.0, 7.4), "salsicha": (250, 12.0, 2.0, 22.0), "tomate": (18, 0.9, 3.9, 0.2),
+    "batata": (77, 2.0, 17.0, 0.1), "ovo": (155, 12.6, 1.1, 10.6), "queijo": (402, 25.0, 1.3, 33.0),
+    "leite": (42, 3.4, 5.0, 1.0), "pao": (265, 9.0, 49.0, 3.2), "manteiga": (717, 0.9, 0.1, 81.1),
+    "salmao": (208, 20.4, 0.0, 13.4), "atum": (130, 29.0, 0.0, 1.0), "carne": (250, 26.0, 0.0, 15.0),
+    "vaca": (250, 26.0, 0.0, 15.0), "porco": (242, 27.3, 0.0, 13.9), "alface": (15, 1.4, 2.9, 0.2),
+    "cenoura": (41, 0.9, 9.6, 0.2), "brocolos": (34, 2.8, 6.6, 0.4), "espinafres": (23, 2.9, 3.6, 0.4),
+    "maca": (52, 0.3, 13.8, 0.2), "banana": (89, 1.1, 22.8, 0.3), "laranja": (47, 0.9, 11.8, 0.1),
+    "iogurte": (59, 3.5, 4.7, 3.3), "pimento": (20, 0.9, 4.6, 0.2),
+}
+
+# Grams per unit; longer spellings first so "colher de sopa" wins over "colher"
+_UNIT_GRAMS = (
+    (r"colher(?:es)? de sopa|c\. ?sopa|tbsp|tblsp|tbls|tbs", 15.0),
+    (r"colher(?:es)? de sobremesa", 10.0),
+    (r"colher(?:es)? de ch[aá]|c\. ?ch[aá]|tsp|tspn", 5.0),
+    (r"colher(?:es)?", 15.0),
+    (r"ch[aá]venas?|x[ií]caras?|cups?", 240.0),
+    (r"copos?", 200.0),
+    (r"kg|quilos?|quilogramas?", 1000.0),
+    (r"mg", 0.001),
+    (r"gr|gramas?|g", 1.0),
+    (r"litros?|l", 1000.0),
+    (r"dl", 100.0),
+    (r"cl", 10.0),
+    (r"ml", 1.0),
+    (r"oz", 28.35),
+    (r"lbs?", 453.6),
+    (r"dentes?", 5.0),
+    (r"fatias?", 80.0),
+    (r"latas?", 120.0),
+    (r"pitadas?", 0.5),
+    (r"ovos?", 80.0),
+    (r"unidades?|un\.?", 80.0),
+)
+# Same weights calculate_recipe_calories always used: one egg, slice or unit is 80g, and a line
+# without a recognised unit ("2 bananas", "sal") counts as 100g in total, whatever the count
+DEFAULT_UNIT_GRAMS = 100.0
+
+_WORD_NUMBERS = {"meia": 0.5, "meio": 0.5, "um": 1.0, "uma": 1.0, "dois": 2.0, "duas": 2.0, "tres": 3.0, "três": 3.0}
+_UNICODE_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+
+_QUANTITY = r"\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?|[½¼¾⅓⅔]|meia|meio|uma|um|duas|dois|tr[eê]s"
+_UNIT = "|".join(f"(?:{pattern})" for pattern, _ in _UNIT_GRAMS)
+_UNIT_RES = tuple((re.compile(f"^(?:{pattern})$"), grams) for pattern, grams in _UNIT_GRAMS)
+
+# "2 x 100g iogurte" / "2x100g": the optional leading count multiplies the amount
+_AMOUNT_RE = re.compile(
+    rf"(?<![\w/])(?:(?P<count>\d+)\s*[x×]\s*)?(?P<qty>{_QUANTITY})\s*(?P<unit>{_UNIT})(?![\w])\.?(?:\s+(?:de|of)\b)?"
+)
+_LEADING_QTY_RE = re.compile(rf"^\s*(?P<qty>{_QUANTITY})(?![\w/])\s*(?:x\s+)?")
+_TO_TASTE_RE = re.compile(r"\bq\.?\s?b\.?(?!\w)|\ba gosto\b|\bto taste\b")
+_STOPWORDS_RE = re.compile(r"\b(?:de|da|do|dos|das|ou|e|sem|com|fresco|natural|integral|magro|magra)\b")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+_staple_vectors = {key: np.array(values, dtype=np.float64) for key, values in STAPLE_MACROS.items()}
+
+
+class ParsedIngredient(NamedTuple):
+    term: str
+    grams: float
+    to_taste: bool
+
+
+def _quantity(text: str) -> float:
+    text = text.strip()
+    if text in _UNICODE_FRACTIONS:
+        return _UNICODE_FRACTIONS[text]
+    if text in _WORD_NUMBERS:
+        return _WORD_NUMBERS[text]
+    if "/" in text:
+        whole, _, fraction = text.rpartition(" ")
+        numerator, denominator = fraction.split("/")
+        return (float(whole) if whole else 0.0) + float(numerator) / max(float(denominator), 1.0)
+    return float(text.replace(",", "."))
+
+
+def _unit_grams(unit: str) -> float:
+    for pattern, grams in _UNIT_RES:
+        if pattern.match(unit):
+            return grams
+    return DEFAULT_UNIT_GRAMS
+
+
+def simplify_term(text: str) -> str:
+    """
+    Search term for a food: connectors and descriptors removed, first two significant words.
+    """
+    text = _PUNCTUATION_RE.sub(" ", _STOPWORDS_RE.sub(" ", text.lower()))
+    return " ".join(text.split()[:2])
+
+
+@lru_cache(maxsize=8192)
+def parse_line(line: str) -> ParsedIngredient:
+    """
+    "1/2 chávena de leite" -> ("leite", 120.0); "sal q.b." -> ("sal", 0.0, to_taste); "2 ovos" -> ("ovos", 160.0);
+    "2 x 100g iogurte" -> ("iogurte", 200.0); "2 bananas" -> ("bananas", 100.0).
+    """
+    text = line.lower().strip()
+    to_taste = bool(_TO_TASTE_RE.search(text))
+    if to_taste:
+        return ParsedIngredient(simplify_term(_TO_TASTE_RE.sub(" ", text)), 0.0, True)
+
+    amount = _AMOUNT_RE.search(text)
+    if amount:
+        grams = _quantity(amount.group("qty")) * _unit_grams(amount.group("unit")) * int(amount.group("count") or 1)
+        food = text[:amount.start()] + " " + text[amount.end():]
+        # "2 ovos batidos": the unit is also the food
+        if amount.group("unit").startswith("ovo"):
+            food = f"{amount.group('unit')} {food}"
+        return ParsedIngredient(simplify_term(food), grams, False)
+
+    leading = _LEADING_QTY_RE.match(text)
+    if leading:
+        text = text[leading.end():]
+    return ParsedIngredient(simplify_term(text), DEFAULT_UNIT_GRAMS, False)
+
+
+def _token_stems(token: str) -> tuple[str, ...]:
+    # Plurals of the staples: ovos, cebolas, tomates, paes/limoes
+    stems = [token]
+    if token.endswith(("oes", "aes")):
+        stems.append(token[:-3] + "ao")
+    if token.endswith("es"):
+        stems.append(token[:-2])
+    if token.endswith("s"):
+        stems.append(token[:-1])
+    return tuple(stems)
+
+
+def staple_macros(term: str) -> Optional[np.ndarray]:
+    """
+    Per-100g macro vector of the longest staple that is a whole word of the term (or its singular),
+    so "mel" matches "mel de rosmaninho" but not "melancia".
+    """
+    found = [stem for token in normalize_text(term).split() for stem in _token_stems(token) if stem in _staple_vectors]
+    if not found:
+        return None
+    return _staple_vectors[max(found, key=len)]
+
+
+def line_macros(parsed: list[ParsedIngredient], per_100g: dict[str, np.ndarray]) -> np.ndarray:
+    """
+    (n, 4) matrix of macros per ingredient line; terms missing from per_100g contribute zeros.
+    """
+    table = np.zeros((len(parsed), len(MACROS)), dtype=np.float64)
+    if not parsed:
+        return table
+    zero = np.zeros(len(MACROS), dtype=np.float64)
+    table[:] = [per_100g.get(item.term, zero) for item in parsed]
+    grams = np.fromiter((item.grams for item in parsed), dtype=np.float64, count=len(parsed))
+    return table * (grams / 100.0)[:, None]
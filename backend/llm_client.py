@@ -1,26 +1,331 @@
 import os
-from openai import OpenAI
+import json
+import asyncio
+import hashlib
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
+from openai.types.chat import ChatCompletion
 import time
+from collections import deque
+from contextlib import contextmanager
+from cache_store import build_cache
+from singleflight import SingleFlight
+from model_router import ModelRouter, ModelsUnavailableError
+from deadline import DeadlineExceeded
+from urllib.parse import urlparse
+import provider_health
 
-def get_client_config():
-    api_key = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Connection pool settings shared by every pooled LLM client
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "50"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+LLM_POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Tokens reserved per image when checking the rate-limit budget (the base64 payload is not text)
+LLM_IMAGE_TOKEN_ESTIMATE = int(os.getenv("LLM_IMAGE_TOKEN_ESTIMATE", "1500"))
+
+# Response cache for (practically) deterministic prompts
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+# Calls above this temperature are creative and skip the cache unless they opt in
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+
+# Call-site profiles: which model tier, token cap and timeout each kind of call gets.
+# Overridable with a JSON file (LLM_PROFILES_FILE) or LLM_PROFILE_<NAME>_<FIELD> / LLM_TIER_<TIER>_MODEL env vars.
+LLM_PROFILES_FILE = os.getenv("LLM_PROFILES_FILE")
+DEFAULT_LLM_PROFILES = {
+    "classify": {"tier": "fast", "max_tokens": 16, "timeout": 10},
+    "extract-json": {"tier": "fast", "max_tokens": 900, "timeout": 20},
+    "creative-recipe": {"tier": "large", "max_tokens": 1000, "timeout": 45},
+    "chat": {"tier": "large", "max_tokens": 500, "timeout": 30},
+    "vision": {"tier": "vision", "max_tokens": 1200, "timeout": 60},
+}
+# Models per tier when talking to Groq; other providers use the configured model for every tier
+GROQ_MODEL_TIERS = {
+    "fast": "llama-3.1-8b-instant",
+    "vision": "meta-llama/llama-4-scout-17b-16e-instruct",
+}
+
+_response_cache = build_cache(LLM_CACHE_BACKEND, "llm_responses", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)
+_completion_flight = SingleFlight("llm_completions")
+_router = ModelRouter()
+
+# Long-lived clients keyed by (base_url, api_key), so every call reuses warm connections
+_client_registry: dict[tuple[str, str], OpenAI] = {}
+_async_client_registry: dict[tuple[str, str], AsyncOpenAI] = {}
+_registry_lock = threading.Lock()
+_client_stats = {
+    "clients_created": 0,
+    "client_reuses": 0,
+    "requests_sent": 0,
+    "connections_opened": 0,
+}
+
+
+def _trace_connection(event_name: str, info: dict) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        _client_stats["connections_opened"] += 1
+
+
+def _count_request(request: httpx.Request) -> None:
+    _client_stats["requests_sent"] += 1
+    # httpcore reports every new TCP connection through the trace extension
+    request.extensions["trace"] = _trace_connection
+
+
+async def _trace_connection_async(event_name: str, info: dict) -> None:
+    _trace_connection(event_name, info)
+
+
+async def _count_request_async(request: httpx.Request) -> None:
+    _client_stats["requests_sent"] += 1
+    request.extensions["trace"] = _trace_connection_async
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _pool_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+
+def _build_http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=_pool_limits(),
+        timeout=_pool_timeout(),
+        event_hooks={"request": [_count_request]},
+    )
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=_pool_limits(),
+        timeout=_pool_timeout(),
+        event_hooks={"request": [_count_request_async]},
+    )
+
+
+def _count_open_connections(http_client: httpx.Client) -> int:
+    pool = getattr(http_client._transport, "_pool", None)
+    return len(getattr(pool, "connections", []) or [])
+
+
+def get_client(api_key: str | None, base_url: str) -> OpenAI:
+    key = (base_url.rstrip("/"), api_key or "")
+    client = _client_registry.get(key)
+    if client is not None:
+        _client_stats["client_reuses"] += 1
+        return client
+
+    with _registry_lock:
+        client = _client_registry.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_build_http_client(),
+                max_retries=LLM_MAX_RETRIES,
+            )
+            _client_registry[key] = client
+            _client_stats["clients_created"] += 1
+        else:
+            _client_stats["client_reuses"] += 1
+    return client
+
+
+def get_async_client(api_key: str | None, base_url: str) -> AsyncOpenAI:
+    key = (base_url.rstrip("/"), api_key or "")
+    client = _async_client_registry.get(key)
+    if client is not None:
+        _client_stats["client_reuses"] += 1
+        return client
+
+    with _registry_lock:
+        client = _async_client_registry.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_build_async_http_client(),
+                max_retries=LLM_MAX_RETRIES,
+            )
+            _async_client_registry[key] = client
+            _client_stats["clients_created"] += 1
+        else:
+            _client_stats["client_reuses"] += 1
+    return client
+
+
+def get_client_stats() -> dict:
+    clients = list(_client_registry.values()) + list(_async_client_registry.values())
+    open_connections = sum(_count_open_connections(c._client) for c in clients)
+    return {
+        **_client_stats,
+        "connections_reused": max(0, _client_stats["requests_sent"] - _client_stats["connections_opened"]),
+        "pooled_clients": len(clients),
+        "open_connections": open_connections,
+    }
+
+
+def close_clients() -> None:
+    with _registry_lock:
+        for client in _client_registry.values():
+            client.close()
+        _client_registry.clear()
+
+
+async def close_async_clients() -> None:
+    with _registry_lock:
+        clients = list(_async_client_registry.values())
+        _async_client_registry.clear()
+    for client in clients:
+        await client.close()
+
+
+def resolve_llm_settings(api_key: str | None = None) -> tuple[str | None, str, str]:
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
     if api_key:
         api_key = api_key.strip()
-        
-    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+    base_url = os.getenv("OPENAI_BASE_URL", OPENAI_BASE_URL)
     model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
     if api_key and api_key.startswith("gsk_"):
-        base_url = "https://api.groq.com/openai/v1"
+        base_url = GROQ_BASE_URL
         # Primary model
         if not os.getenv("OPENAI_MODEL"):
             model = "llama-3.3-70b-versatile"
-            
-    return OpenAI(api_key=api_key, base_url=base_url), model
 
-def get_chat_completion(messages, temperature=0.3, response_format=None, max_tokens=500):
-    client, model = get_client_config()
-    
+    return api_key, base_url, model
+
+
+def get_client_config(api_key: str | None = None):
+    api_key, base_url, model = resolve_llm_settings(api_key)
+    return get_client(api_key, base_url), model
+
+
+def get_async_client_config(api_key: str | None = None):
+    api_key, base_url, model = resolve_llm_settings(api_key)
+    return get_async_client(api_key, base_url), model
+
+
+def _load_profiles() -> tuple[dict, dict]:
+    profiles = {name: dict(settings) for name, settings in DEFAULT_LLM_PROFILES.items()}
+    tiers: dict[str, str] = {}
+
+    if LLM_PROFILES_FILE:
+        try:
+            with open(LLM_PROFILES_FILE, encoding="utf-8") as f:
+                config = json.load(f)
+            for name, settings in (config.get("profiles") or {}).items():
+                profiles.setdefault(name, {}).update(settings)
+            tiers.update(config.get("tiers") or {})
+        except Exception as e:
+            print(f"LLM profiles file error ({LLM_PROFILES_FILE}): {e}")
+
+    for name, settings in profiles.items():
+        prefix = f"LLM_PROFILE_{name.upper().replace('-', '_')}_"
+        for field, cast in (("tier", str), ("model", str), ("max_tokens", int), ("timeout", float)):
+            value = os.getenv(prefix + field.upper())
+            if value:
+                settings[field] = cast(value)
+
+    for tier in {settings.get("tier") for settings in profiles.values()} | set(GROQ_MODEL_TIERS):
+        if tier and os.getenv(f"LLM_TIER_{tier.upper()}_MODEL"):
+            tiers[tier] = os.getenv(f"LLM_TIER_{tier.upper()}_MODEL")
+
+    return profiles, tiers
+
+
+_profiles, _tier_models = _load_profiles()
+_profile_stats: dict[str, dict] = {}
+_profile_lock = threading.Lock()
+
+
+def resolve_profile(profile: str, client, default_model: str) -> dict:
+    """
+    Returns {"model", "max_tokens", "timeout"} for a call-site profile on the given client.
+    Unknown profiles fall back to the default model with no cap.
+    """
+    settings = _profiles.get(profile, {})
+    tier = settings.get("tier")
+    model = settings.get("model") or _tier_models.get(tier)
+    if not model and tier and "groq" in client.base_url.host.lower():
+        model = GROQ_MODEL_TIERS.get(tier)
+    return {
+        "model": model or default_model,
+        "max_tokens": settings.get("max_tokens"),
+        "timeout": settings.get("timeout"),
+    }
+
+
+def get_profiles() -> dict:
+    return {"profiles": _profiles, "tiers": _tier_models}
+
+
+def record_profile_latency(profile: str | None, seconds: float, ok: bool = True, cached: bool = False) -> None:
+    name = profile or "default"
+    with _profile_lock:
+        stats = _profile_stats.get(name)
+        if stats is None:
+            stats = {"calls": 0, "errors": 0, "cache_hits": 0, "total_seconds": 0.0, "max_seconds": 0.0, "samples": deque(maxlen=200)}
+            _profile_stats[name] = stats
+        stats["calls"] += 1
+        if not ok:
+            stats["errors"] += 1
+        if cached:
+            stats["cache_hits"] += 1
+            return
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        stats["samples"].append(seconds)
+
+
+@contextmanager
+def profile_timer(profile: str | None):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        record_profile_latency(profile, time.perf_counter() - started, ok=False)
+        raise
+    record_profile_latency(profile, time.perf_counter() - started)
+
+
+def get_profile_stats() -> dict:
+    report = {}
+    with _profile_lock:
+        for name, stats in _profile_stats.items():
+            samples = sorted(stats["samples"])
+            upstream_calls = stats["calls"] - stats["cache_hits"]
+            report[name] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "cache_hits": stats["cache_hits"],
+                "avg_ms": round(stats["total_seconds"] / upstream_calls * 1000, 1) if upstream_calls else 0.0,
+                "p50_ms": round(samples[len(samples) // 2] * 1000, 1) if samples else 0.0,
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1) if samples else 0.0,
+                "max_ms": round(stats["max_seconds"] * 1000, 1),
+            }
+    return report
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    return "429" in str(error) or "rate_limit_exceeded" in str(error).lower()
+
+
+def _models_to_try(client, model: str) -> list[str]:
     # List of models to try in case of rate limits (especially for Groq)
     models_to_try = [model]
     if "groq" in client.base_url.host.lower():
@@ -29,27 +334,334 @@ def get_chat_completion(messages, temperature=0.3, response_format=None, max_tok
             models_to_try.append("mixtral-8x7b-32768")
         elif model != "llama-3.1-8b-instant":
             models_to_try.append("llama-3.1-8b-instant")
+    return models_to_try
+
+def _should_cache(temperature: float, cache: bool | None) -> bool:
+    if _response_cache is None or cache is False:
+        return False
+    if cache is True:
+        return True
+    return temperature <= LLM_CACHE_MAX_TEMPERATURE
+
+
+def _cache_key(model: str, messages, response_format, max_tokens, extra=None) -> str:
+    request = {"model": model, "messages": messages, "response_format": response_format, "max_tokens": max_tokens}
+    if extra:
+        request["extra"] = extra
+    payload = json.dumps(
+        request,
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_response(key: str) -> ChatCompletion | None:
+    data = _response_cache.get(key)
+    if data is None:
+        return None
+    try:
+        return ChatCompletion.model_validate(data)
+    except Exception:
+        _response_cache.delete(key)
+        return None
+
+
+def _store_response(key: str, response) -> None:
+    try:
+        _response_cache.set(key, response.model_dump(mode="json"))
+    except Exception as e:
+        print(f"LLM cache store error: {e}")
+
+
+def get_cache_stats() -> dict:
+    if _response_cache is None:
+        return {"backend": "off"}
+    return _response_cache.stats()
+
+
+def _flight_key(client, model: str, messages, temperature, response_format, max_tokens, extra=None) -> str:
+    return f"{client.base_url}|{temperature}|{_cache_key(model, messages, response_format, max_tokens, extra)}"
+
+
+def _is_image_part(part) -> bool:
+    return isinstance(part, dict) and part.get("type") == "image_url"
+
+
+def _count_images(messages) -> int:
+    return sum(
+        1 for message in messages if isinstance(message.get("content"), list)
+        for part in message["content"] if _is_image_part(part)
+    )
+
+
+def _estimate_tokens(messages, max_tokens) -> int:
+    # ~4 characters per token is close enough to reserve budget before the real usage is known.
+    # Images are billed per image, not per base64 character
+    text = [
+        {**message, "content": [part for part in message["content"] if not _is_image_part(part)]}
+        if isinstance(message.get("content"), list) else message
+        for message in messages
+    ]
+    images = _count_images(messages) * LLM_IMAGE_TOKEN_ESTIMATE
+    return len(json.dumps(text, ensure_ascii=False, default=str)) // 4 + images + (max_tokens or 0)
+
+
+def _error_headers(error: Exception):
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _provider_name(client) -> str:
+    return f"llm:{urlparse(str(client.base_url)).netloc}"
+
+
+def _route(client, model, messages, max_tokens) -> tuple[list[str], int, str]:
+    # While the base URL itself is marked down every model is unreachable, so fail fast instead of timing out
+    provider = _provider_name(client)
+    if not provider_health.allow(provider):
+        raise ModelsUnavailableError(f"LLM provider {provider} marked down")
+    estimated_tokens = _estimate_tokens(messages, max_tokens)
+    # The text-only fallback models cannot read images
+    models = [model] if _count_images(messages) else _models_to_try(client, model)
+    return _router.order(models, estimated_tokens), estimated_tokens, provider
+
+
+def _record_success(current_model: str, headers, provider: str) -> None:
+    _router.record_success(current_model, headers)
+    provider_health.record_success(provider)
+
+
+def _record_error(current_model: str, error: Exception, provider: str) -> bool:
+    """
+    Feeds an error into the router and provider health and returns True when the next model should be tried.
+    """
+    if _is_rate_limit_error(error):
+        _router.record_rate_limited(current_model, _error_headers(error))
+        provider_health.record_success(provider)
+        print(f"Rate limit hit for {current_model}, trying next model...")
+        return True
+    if _is_provider_failure(error):
+        _router.record_failure(current_model)
+        provider_health.record_failure(provider)
+    else:
+        # Request-level errors (bad JSON, invalid input) say nothing about the model's health
+        _router.record_success(current_model)
+        provider_health.record_success(provider)
+    return False
+
+
+def _create_with_fallback(client, model, messages, temperature, response_format, max_tokens, timeout=None):
+    candidates, estimated_tokens, provider = _route(client, model, messages, max_tokens)
 
     last_exception = None
-    for current_model in models_to_try:
+    for index, current_model in enumerate(candidates):
+        if not _router.acquire(current_model, estimated_tokens):
+            continue
+        # Let the SDK retry only on the last candidate; otherwise route to the next model right away
+        call_client = client if index == len(candidates) - 1 else client.with_options(max_retries=0)
         try:
-            response = client.chat.completions.create(
+            raw = call_client.chat.completions.with_raw_response.create(
                 model=current_model,
                 messages=messages,
                 temperature=temperature,
                 response_format=response_format,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                **({"timeout": timeout} if timeout else {})
             )
-            return response
+            _record_success(current_model, raw.headers, provider)
+            return raw.parse()
         except Exception as e:
             last_exception = e
-            # If it's a rate limit error (429), try the next model
-            if "429" in str(e) or "rate_limit_exceeded" in str(e).lower():
-                print(f"Rate limit hit for {current_model}, trying next model...")
+            if _record_error(current_model, e, provider):
                 continue
-            else:
-                # For other errors, raise immediately
-                raise e
-    
+            raise e
+
     # If all models failed
-    raise last_exception
+    raise last_exception or ModelsUnavailableError("No LLM model accepted the request")
+
+
+async def _create_with_fallback_async(client, model, messages, temperature, response_format, max_tokens, timeout=None, extra=None):
+    candidates, estimated_tokens, provider = _route(client, model, messages, max_tokens)
+
+    last_exception = None
+    for index, current_model in enumerate(candidates):
+        if not _router.acquire(current_model, estimated_tokens):
+            continue
+        call_client = client if index == len(candidates) - 1 else client.with_options(max_retries=0)
+        try:
+            raw = await call_client.chat.completions.with_raw_response.create(
+                model=current_model,
+                messages=messages,
+                temperature=temperature,
+                response_format=response_format,
+                max_tokens=max_tokens,
+                **({"timeout": timeout} if timeout else {}),
+                **(extra or {})
+            )
+            _record_success(current_model, raw.headers, provider)
+            return raw.parse()
+        except Exception as e:
+            last_exception = e
+            if _record_error(current_model, e, provider):
+                continue
+            raise e
+
+    raise last_exception or ModelsUnavailableError("No LLM model accepted the request")
+
+
+def get_router_stats() -> dict:
+    return _router.stats()
+
+
+def has_spare_capacity(min_requests: int, min_tokens: int) -> bool:
+    return _router.has_headroom(min_requests, min_tokens)
+
+
+def _prepare_call(client, model, profile, max_tokens, deadline=None):
+    timeout = None
+    if profile:
+        settings = resolve_profile(profile, client, model)
+        cap = settings["max_tokens"]
+        if cap and (not max_tokens or max_tokens > cap):
+            max_tokens = cap
+        model, timeout = settings["model"], settings["timeout"]
+    if deadline is not None:
+        deadline.check(profile or "llm")
+        timeout = deadline.cap(timeout)
+    return model, max_tokens, timeout
+
+
+def get_chat_completion(messages, temperature=0.3, response_format=None, max_tokens=500, cache=None, profile=None, api_key=None, deadline=None):
+    """
+    cache: None applies the temperature policy, True forces caching, False opts out.
+    profile: call-site profile name (see DEFAULT_LLM_PROFILES) selecting model tier, token cap and timeout.
+    deadline: optional request Deadline; the call timeout never exceeds what is left of it.
+    Identical calls already in flight are coalesced into one request either way.
+    """
+    started = time.perf_counter()
+    client, model = get_client_config(api_key)
+    model, max_tokens, timeout = _prepare_call(client, model, profile, max_tokens, deadline)
+    use_cache = _should_cache(temperature, cache)
+    cache_key = _cache_key(model, messages, response_format, max_tokens) if use_cache else None
+    if cache_key:
+        cached = _cached_response(cache_key)
+        if cached is not None:
+            record_profile_latency(profile, time.perf_counter() - started, cached=True)
+            return cached
+
+    with profile_timer(profile):
+        response = _completion_flight.do(
+            _flight_key(client, model, messages, temperature, response_format, max_tokens),
+            lambda: _create_with_fallback(client, model, messages, temperature, response_format, max_tokens, timeout),
+        )
+    if cache_key:
+        _store_response(cache_key, response)
+    return response
+
+
+async def get_chat_completion_async(messages, temperature=0.3, response_format=None, max_tokens=500, cache=None, profile=None, api_key=None, deadline=None, extra=None):
+    """
+    Async get_chat_completion. extra: further create() arguments (e.g. presence_penalty), part of the cache key.
+    """
+    started = time.perf_counter()
+    client, model = get_async_client_config(api_key)
+    model, max_tokens, timeout = _prepare_call(client, model, profile, max_tokens, deadline)
+    use_cache = _should_cache(temperature, cache)
+    cache_key = _cache_key(model, messages, response_format, max_tokens, extra) if use_cache else None
+    if cache_key:
+        cached = _cached_response(cache_key)
+        if cached is not None:
+            record_profile_latency(profile, time.perf_counter() - started, cached=True)
+            return cached
+
+    with profile_timer(profile):
+        call = _completion_flight.do_async(
+            _flight_key(client, model, messages, temperature, response_format, max_tokens, extra),
+            lambda: _create_with_fallback_async(client, model, messages, temperature, response_format, max_tokens, timeout, extra),
+        )
+        if deadline is not None:
+            # Per-attempt timeouts alone could add up across fallback models
+            try:
+                response = await asyncio.wait_for(call, deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"LLM call '{profile or 'llm'}' exceeded the request deadline")
+        else:
+            response = await call
+    if cache_key:
+        _store_response(cache_key, response)
+    return response
+
+
+async def _within_deadline(awaitable, deadline, profile):
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"LLM stream '{profile or 'llm'}' exceeded the request deadline")
+
+
+async def stream_chat_completion_async(messages, temperature=0.3, response_format=None, max_tokens=500, profile=None, deadline=None):
+    """
+    Yields content deltas as they arrive. Routing and rate-limit fallback only apply
+    before the first chunk; the response is not cached or coalesced.
+    deadline: optional request Deadline bounding the connection and every wait for the next chunk.
+    """
+    client, model = get_async_client_config()
+    model, max_tokens, timeout = _prepare_call(client, model, profile, max_tokens, deadline)
+    candidates, estimated_tokens, provider = _route(client, model, messages, max_tokens)
+
+    last_exception = None
+    for index, current_model in enumerate(candidates):
+        if not _router.acquire(current_model, estimated_tokens):
+            continue
+        call_client = client if index == len(candidates) - 1 else client.with_options(max_retries=0)
+        started = time.perf_counter()
+        try:
+            raw = await _within_deadline(call_client.chat.completions.with_raw_response.create(
+                model=current_model,
+                messages=messages,
+                temperature=temperature,
+                response_format=response_format,
+                max_tokens=max_tokens,
+                stream=True,
+                **({"timeout": timeout} if timeout else {})
+            ), deadline, profile)
+        except DeadlineExceeded:
+            record_profile_latency(profile, time.perf_counter() - started, ok=False)
+            raise
+        except Exception as e:
+            last_exception = e
+            if _record_error(current_model, e, provider):
+                continue
+            record_profile_latency(profile, time.perf_counter() - started, ok=False)
+            raise e
+
+        _record_success(current_model, raw.headers, provider)
+        stream = raw.parse()
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await _within_deadline(chunks.__anext__(), deadline, profile)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except BaseException:
+            record_profile_latency(profile, time.perf_counter() - started, ok=False)
+            raise
+        finally:
+            await stream.close()
+        record_profile_latency(profile, time.perf_counter() - started)
+        return
+
+    raise last_exception or ModelsUnavailableError("No LLM model accepted the request")
@@ -0,0 +1,275 @@
+import json
+import re
+from typing import Any, Iterable, Optional
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_WORD = re.compile(r"[^\W\d]\w*")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+# How many commas back a truncated document may be cut to find a parseable prefix
+_MAX_CUTS = 8
+
+_STEP_KEYS = ("acao", "ação", "passo", "step", "instruction", "instrucao", "descricao", "description", "text")
+_INGREDIENT_NAME_KEYS = ("nome", "name", "ingrediente", "ingredient", "item")
+_INGREDIENT_QUANTITY_KEYS = ("quantidade", "quantity", "amount", "medida", "measure")
+
+_stats: dict[str, dict[str, int]] = {}
+
+
+def _site_stats(site: str) -> dict[str, int]:
+    return _stats.setdefault(site, {"clean": 0, "repaired": 0, "unrepairable": 0, "retries": 0})
+
+
+def _strip_fences(text: str) -> str:
+    if "```" not in text:
+        return text
+    match = _FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def _read_string(text: str, start: int) -> tuple[str, int, bool]:
+    """
+    Reads a string literal opened at `start` with either quote type and returns it re-encoded
+    with double quotes, the index after it and whether it was closed. A single quote only closes
+    the string when followed by , : } ] or the end, so apostrophes ("d'avó") survive.
+    """
+    quote = text[start]
+    raw: list[str] = []
+    i, n = start + 1, len(text)
+    while i < n:
+        char = text[i]
+        if char == "\\" and i + 1 < n:
+            escaped = text[i + 1]
+            raw.append("'" if escaped == "'" else char + escaped)
+            i += 2
+            continue
+        if char == quote:
+            if quote == '"':
+                return f'"{"".join(raw)}"', i + 1, True
+            rest = text[i + 1:].lstrip()
+            if not rest or rest[0] in ",:}]":
+                return f'"{"".join(raw)}"', i + 1, True
+        raw.append('\\"' if char == '"' else char)
+        i += 1
+    return f'"{"".join(raw)}"', n, False
+
+
+def _drop_trailing_comma(out: list[str]) -> None:
+    k = len(out) - 1
+    while k >= 0 and out[k].isspace():
+        k -= 1
+    if k >= 0 and out[k] == ",":
+        del out[k]
+
+
+def _scan(text: str) -> tuple[list[str], list[str], list[tuple[int, tuple[str, ...]]]]:
+    """
+    One pass that normalizes quotes, Python literals and trailing commas. Returns the output
+    tokens, the brackets still open at the end and the comma positions a truncated document can be cut at.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    cuts: list[tuple[int, tuple[str, ...]]] = []
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if char in "\"'":
+            literal, i, closed = _read_string(text, i)
+            if not closed:
+                # A cut-off string is dropped rather than kept half-written (e.g. "50g fei")
+                break
+            out.append(literal)
+            continue
+        if char in "{[":
+            stack.append(_CLOSERS[char])
+            out.append(char)
+        elif char in "}]":
+            if stack:
+                _drop_trailing_comma(out)
+                out.append(stack.pop())
+                if not stack:
+                    break
+        elif char == ",":
+            cuts.append((len(out), tuple(stack)))
+            out.append(char)
+        elif char.isalpha() or char == "_":
+            # Unquoted words may be Portuguese ("Olá"); anything the pattern misses is kept as one character
+            match = _WORD.match(text, i)
+            word = match.group(0) if match else char
+            out.append(_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(char)
+        i += 1
+    return out, stack, cuts
+
+
+def _close(prefix: str, open_brackets: Iterable[str]) -> str:
+    prefix = prefix.rstrip()
+    if prefix.endswith(","):
+        prefix = prefix[:-1]
+    elif prefix.endswith(":"):
+        prefix += " null"
+    return prefix + "".join(reversed(list(open_brackets)))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort parse of model output: code fences, prose around the object, single quotes,
+    True/False/None, trailing commas and truncation (a cut-off string is dropped and open
+    brackets are closed, cutting back to an earlier comma if needed). Returns None when nothing parseable is left.
+    """
+    if not text:
+        return None
+    body = _strip_fences(text)
+    starts = [index for index in (body.find("{"), body.find("[")) if index >= 0]
+    if not starts:
+        return None
+    out, stack, cuts = _scan(body[min(starts):])
+
+    candidates = [_close("".join(out), stack)]
+    candidates.extend(_close("".join(out[:position]), snapshot) for position, snapshot in reversed(cuts[-_MAX_CUTS:]))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    return None
+
+
+def _repaired(text: Optional[str], site: str) -> Optional[dict]:
+    data = repair_json(text) if text else None
+    if isinstance(data, dict):
+        _site_stats(site)["repaired"] += 1
+        return data
+    _site_stats(site)["unrepairable"] += 1
+    return None
+
+
+def parse_object(text: Optional[str], site: str) -> Optional[dict]:
+    """
+    JSON object from a model reply, repaired locally if needed. None means the caller should retry.
+    """
+    try:
+        data = json.loads(text, strict=False)
+    except (TypeError, ValueError):
+        data = None
+    if isinstance(data, dict):
+        _site_stats(site)["clean"] += 1
+        return data
+    return _repaired(text, site)
+
+
+def failed_generation(error: Exception) -> Optional[str]:
+    # Groq rejects invalid JSON with json_validate_failed and echoes the output in failed_generation
+    body = getattr(error, "body", None)
+    if not isinstance(body, dict):
+        return None
+    nested = body.get("error")
+    value = body.get("failed_generation") or (nested.get("failed_generation") if isinstance(nested, dict) else None)
+    return value if isinstance(value, str) else None
+
+
+def parse_failed_generation(error: Exception, site: str) -> Optional[dict]:
+    text = failed_generation(error)
+    return _repaired(text, site) if text else None
+
+
+def record_retry(site: str) -> None:
+    _site_stats(site)["retries"] += 1
+
+
+def get_stats() -> dict:
+    result = {}
+    for site, counts in _stats.items():
+        total = counts["clean"] + counts["repaired"] + counts["unrepairable"]
+        result[site] = {
+            **counts,
+            "repair_rate": round(counts["repaired"] / total, 3) if total else 0.0,
+            "retry_rate": round(counts["retries"] / total, 3) if total else 0.0,
+        }
+    return result
+
+
+def _number(value: Any, default: float = 0.0) -> float:
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value or ""))
+    return float(match.group(0).replace(",", ".")) if match else default
+
+
+def _first_text(item: dict, keys: tuple[str, ...]) -> str:
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def coerce_text_list(value: Any, keys: tuple[str, ...] = ()) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [line.strip(" -•\t") for line in value.splitlines() if line.strip(" -•\t")]
+    if isinstance(value, dict):
+        value = list(value.values())
+    items = []
+    for item in value if isinstance(value, list) else [value]:
+        if isinstance(item, dict):
+            text = _first_text(item, keys) or " ".join(str(v) for v in item.values() if isinstance(v, (str, int, float)))
+        else:
+            text = str(item).strip()
+        if text:
+            items.append(text)
+    return items
+
+
+def _ingredient_list(value: Any) -> list[str]:
+    if not isinstance(value, list):
+        return coerce_text_list(value)
+    items = []
+    for item in value:
+        if isinstance(item, dict):
+            # {"nome": "arroz", "quantidade": "100g"} -> "100g arroz"
+            name = _first_text(item, _INGREDIENT_NAME_KEYS)
+            quantity = _first_text(item, _INGREDIENT_QUANTITY_KEYS)
+            text = f"{quantity} {name}".strip() if name else " ".join(str(v) for v in item.values() if v)
+        else:
+            text = str(item).strip()
+        if text:
+            items.append(text)
+    return items
+
+
+def coerce_recipe(raw: dict) -> dict:
+    """
+    Reshapes a model recipe into NegotiatorRecipe fields: numbers from strings ("450 kcal"),
+    step and ingredient objects flattened to strings.
+    """
+    recipe = dict(raw)
+    recipe["title"] = str(recipe.get("title") or recipe.get("name") or recipe.get("titulo") or "Receita").strip()
+    recipe["calories"] = max(0, int(round(_number(recipe.get("calories")))))
+    recipe["time_minutes"] = max(0, int(round(_number(recipe.get("time_minutes"), 30))))
+    recipe["ingredients"] = _ingredient_list(recipe.get("ingredients"))
+    recipe["steps"] = coerce_text_list(recipe.get("steps"), _STEP_KEYS)
+    if recipe.get("ingredients_en") is not None:
+        recipe["ingredients_en"] = coerce_text_list(recipe["ingredients_en"])
+    return recipe
+
+
+def coerce_nutrition(data: dict, default_name: str) -> dict:
+    """
+    NutritionAnalysisResponse fields from a model reply, clamped to non-negative numbers.
+    """
+    return {
+        "name": str(data.get("name") or default_name).strip(),
+        "calories": max(0, int(round(_number(data.get("calories"))))),
+        "protein": max(0.0, _number(data.get("protein"))),
+        "carbs": max(0.0, _number(data.get("carbs"))),
+        "fat": max(0.0, _number(data.get("fat"))),
+        "estimated_grams": max(0, int(round(_number(data.get("estimated_grams"))))),
+    }
@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 import json
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -8,10 +9,11 @@ import smtplib
 import uuid
 import time
 from datetime import datetime, timedelta, timezone
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse
 from email.message import EmailMessage
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, func
 from dotenv import load_dotenv
 from typing import List
 
@@ -19,7 +21,7 @@ from typing import List
 load_dotenv()
 
 # Use absolute imports
-import models, schemas, shops, negotiator, food_data, auth, vision, llm_client
+import models, schemas, shops, negotiator, food_data, food_suggest, auth, vision, llm_client, llm_json, provider_health, singleflight, sse, prewarm
 from database import SessionLocal, engine, get_db
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -125,6 +127,26 @@ def initialize_database(max_retries: int = 6, base_delay: float = 1.5) -> None:
 def on_startup() -> None:
     initialize_database()
 
+
+@app.on_event("startup")
+async def start_prewarm_worker() -> None:
+    if prewarm.can_start():
+        app.state.prewarm_task = asyncio.create_task(prewarm.run_forever())
+        app.state.prewarm_flush_task = asyncio.create_task(prewarm.flush_forever())
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    prewarm_task = getattr(app.state, "prewarm_task", None)
+    if prewarm_task:
+        prewarm_task.cancel()
+    flush_task = getattr(app.state, "prewarm_flush_task", None)
+    if flush_task:
+        flush_task.cancel()
+        await asyncio.gather(flush_task, return_exceptions=True)
+    llm_client.close_clients()
+    await llm_client.close_async_clients()
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     print(f"Incoming request: {request.method} {request.url.path}")
@@ -347,50 +369,99 @@ def login(request: schemas.LoginRequest, db: Session = Depends(get_db)):
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/assistant/chat", response_model=schemas.ChatResponse)
-def help_assistant_chat(request: schemas.ChatRequest, current_user: models.User = Depends(auth.get_current_user)):
-    system_prompt = (
-        "O teu nome é Nutra, a Assistente Inteligente Suprema da NutriVentures (PT-PT). "
-        "Quando o utilizador te perguntar o que sabes fazer, deves mencionar que podes: "
-        "1. Registar refeições e água; 2. Gerir o peso e diário; 3. Mudar temas; 4. Iniciar negociações de comida; "
-        "5. E as tuas novas funcionalidades interativas: Jogar Casino (Slots), fazer Quizzes de nutrição, usar o Conversor de Medidas e o Cronómetro de Jejum. "
-        "REGRAS CRÍTICAS: "
-        "1. Sê EXTREMAMENTE HONESTA. Se o utilizador pedir algo que não podes fazer (não está na lista de ações abaixo), diz explicitamente: 'Desculpa, ainda não tenho capacidade para fazer isso.' "
-        "2. NUNCA digas que fizeste algo se não incluíres a respetiva 'action' no JSON. "
-        "AÇÕES DISPONÍVEIS: "
-        "- Navegação: {'type': 'NAVIGATE', 'value': 'ID'} (inicio, tenhofome, gerarreceita, supermercados, diario, favoritos, historico, perfil, definicoes) "
-        "- Pesquisa Lojas/Produtos: {'type': 'FIND_SHOPS', 'value': 'produtos', 'mode': 'shop'|'restaurant'} (Usa isto se o user quiser saber onde comprar algo ou encontrar um restaurante) "
-        "- Registo Refeição: {'type': 'ADD_MEAL', 'value': 'texto', 'section': 'breakfast'|'lunch'|'snack'|'dinner'|'extras'} "
-        "- Limpar Diário: {'type': 'CLEAR_MEALS'} (Usa isto se o user pedir para apagar tudo o que comeu hoje) "
-        "- Casino (EASTER EGG): {'type': 'OPEN_CASINO'} (Abre um simulador de casino real para o user jogar.) "
-        "- Quiz Nutritivo: {'type': 'OPEN_QUIZ'} (Abre um jogo de perguntas e respostas sobre nutrição.) "
-        "- Conversor de Medidas: {'type': 'OPEN_CONVERTER'} (Abre uma ferramenta para converter colheres em gramas e calorias.) "
-        "- Cronómetro de Jejum: {'type': 'OPEN_FASTING_TIMER'} (Abre um temporizador de jejum intermitente.) "
-        "- Negociação/Receitas: {'type': 'START_NEGOTIATION', 'value': 'prato'} (Usa isto sempre que o utilizador pedir uma receita ou disser que quer comer algo específico) "
-        "- Tema: {'type': 'SET_THEME', 'value': 'light'|'dark'} "
-        "- Modo Daltonismo: {'type': 'SET_COLOR_MODE', 'value': 'none'|'protanopia'|'deuteranopia'|'tritanopia'|'achromatopsia'} "
-        "- Água: {'type': 'ADD_WATER', 'value': número_litros} | {'type': 'REMOVE_WATER', 'value': número_litros} (Se o user não disser a quantidade, não envies 'value') "
-        "- Peso: {'type': 'LOG_WEIGHT', 'value': número} "
-        "- Sessão: {'type': 'LOGOUT'} "
-        "\nRetorna SEMPRE JSON: { \"content\": \"...\", \"action\": { \"type\": \"...\", \"value\": \"...\" } ou null }"
-    )
+ASSISTANT_SYSTEM_PROMPT = (
+    "O teu nome é Nutra, a Assistente Inteligente Suprema da NutriVentures (PT-PT). "
+    "Quando o utilizador te perguntar o que sabes fazer, deves mencionar que podes: "
+    "1. Registar refeições e água; 2. Gerir o peso e diário; 3. Mudar temas; 4. Iniciar negociações de comida; "
+    "5. E as tuas novas funcionalidades interativas: Jogar Casino (Slots), fazer Quizzes de nutrição, usar o Conversor de Medidas e o Cronómetro de Jejum. "
+    "REGRAS CRÍTICAS: "
+    "1. Sê EXTREMAMENTE HONESTA. Se o utilizador pedir algo que não podes fazer (não está na lista de ações abaixo), diz explicitamente: 'Desculpa, ainda não tenho capacidade para fazer isso.' "
+    "2. NUNCA digas que fizeste algo se não incluíres a respetiva 'action' no JSON. "
+    "AÇÕES DISPONÍVEIS: "
+    "- Navegação: {'type': 'NAVIGATE', 'value': 'ID'} (inicio, tenhofome, gerarreceita, supermercados, diario, favoritos, historico, perfil, definicoes) "
+    "- Pesquisa Lojas/Produtos: {'type': 'FIND_SHOPS', 'value': 'produtos', 'mode': 'shop'|'restaurant'} (Usa isto se o user quiser saber onde comprar algo ou encontrar um restaurante) "
+    "- Registo Refeição: {'type': 'ADD_MEAL', 'value': 'texto', 'section': 'breakfast'|'lunch'|'snack'|'dinner'|'extras'} "
+    "- Limpar Diário: {'type': 'CLEAR_MEALS'} (Usa isto se o user pedir para apagar tudo o que comeu hoje) "
+    "- Casino (EASTER EGG): {'type': 'OPEN_CASINO'} (Abre um simulador de casino real para o user jogar.) "
+    "- Quiz Nutritivo: {'type': 'OPEN_QUIZ'} (Abre um jogo de perguntas e respostas sobre nutrição.) "
+    "- Conversor de Medidas: {'type': 'OPEN_CONVERTER'} (Abre uma ferramenta para converter colheres em gramas e calorias.) "
+    "- Cronómetro de Jejum: {'type': 'OPEN_FASTING_TIMER'} (Abre um temporizador de jejum intermitente.) "
+    "- Negociação/Receitas: {'type': 'START_NEGOTIATION', 'value': 'prato'} (Usa isto sempre que o utilizador pedir uma receita ou disser que quer comer algo específico) "
+    "- Tema: {'type': 'SET_THEME', 'value': 'light'|'dark'} "
+    "- Modo Daltonismo: {'type': 'SET_COLOR_MODE', 'value': 'none'|'protanopia'|'deuteranopia'|'tritanopia'|'achromatopsia'} "
+    "- Água: {'type': 'ADD_WATER', 'value': número_litros} | {'type': 'REMOVE_WATER', 'value': número_litros} (Se o user não disser a quantidade, não envies 'value') "
+    "- Peso: {'type': 'LOG_WEIGHT', 'value': número} "
+    "- Sessão: {'type': 'LOGOUT'} "
+    "\nRetorna SEMPRE JSON: { \"content\": \"...\", \"action\": { \"type\": \"...\", \"value\": \"...\" } ou null }"
+)
 
-    messages = [{"role": "system", "content": system_prompt}]
+
+def build_assistant_messages(request: schemas.ChatRequest) -> list[dict]:
+    messages = [{"role": "system", "content": ASSISTANT_SYSTEM_PROMPT}]
     for msg in request.messages:
         messages.append({"role": msg.role, "content": msg.content})
+    return messages
+
+
+def sse_response(events) -> StreamingResponse:
+    async def body():
+        try:
+            async for event, data in events:
+                yield sse.format_event(event, data)
+        except HTTPException as e:
+            yield sse.format_event("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            print(f"Stream Error: {e}")
+            yield sse.format_event("error", {"status_code": 500, "detail": "Erro durante o streaming da resposta."})
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers=sse.SSE_HEADERS)
+
+
+@app.post("/assistant/chat", response_model=schemas.ChatResponse)
+async def help_assistant_chat(request: schemas.ChatRequest, current_user: models.User = Depends(auth.get_current_user)):
+    messages = build_assistant_messages(request)
 
     try:
-        response = llm_client.get_chat_completion(
+        response = await llm_client.get_chat_completion_async(
             messages=messages,
             temperature=0.3,
             response_format={"type": "json_object"},
-            max_tokens=500
+            max_tokens=500,
+            cache=False,
+            profile="chat"
         )
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         print(f"Chat Error: {e}")
         raise HTTPException(status_code=500, detail="Erro ao comunicar com a Nutra.")
 
+
+async def assistant_chat_events(messages: list[dict]):
+    content_field = sse.PartialJsonField("content")
+    content = ""
+    try:
+        async for delta in llm_client.stream_chat_completion_async(
+            messages=messages,
+            temperature=0.3,
+            response_format={"type": "json_object"},
+            max_tokens=500,
+            profile="chat"
+        ):
+            content += delta
+            text = content_field.feed(delta)
+            if text:
+                yield "token", {"text": text}
+        result = schemas.ChatResponse(**json.loads(content))
+    except Exception as e:
+        print(f"Chat Stream Error: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao comunicar com a Nutra.")
+    yield "result", result.model_dump()
+
+
+@app.post("/assistant/chat/stream")
+async def help_assistant_chat_stream(request: schemas.ChatRequest, current_user: models.User = Depends(auth.get_current_user)):
+    return sse_response(assistant_chat_events(build_assistant_messages(request)))
+
 @app.get("/users/me", response_model=schemas.User)
 def read_user_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
@@ -622,15 +693,16 @@ def delete_diary_meal(meal_id: int, db: Session = Depends(get_db), current_user:
     return day
 
 @app.post("/negotiator/analyze-mood", response_model=schemas.MoodAnalysisResponse)
-def analyze_mood(request: schemas.NegotiatorRequest, current_user: models.User = Depends(auth.get_current_user)):
-    return negotiator.analyze_mood(request.craving, request.mood)
+async def analyze_mood(request: schemas.NegotiatorRequest, current_user: models.User = Depends(auth.get_current_user)):
+    return await negotiator.analyze_mood(request.craving, request.mood)
 
 @app.post("/negotiator/negotiate", response_model=schemas.NegotiatorResponse)
-def negotiate_craving(request: schemas.NegotiatorRequest, current_user: models.User = Depends(auth.get_current_user)):
+async def negotiate_craving(request: schemas.NegotiatorRequest, current_user: models.User = Depends(auth.get_current_user)):
     allergens = [a.name for a in current_user.allergens]
     meal_target = compute_recipe_target_calories(current_user, request.target_calories)
     daily_target = compute_daily_calorie_target(current_user)
-    return negotiator.negotiate_craving(
+    prewarm.record_request(request.craving, meal_target, current_user.goal, allergens, daily_target)
+    return await negotiator.negotiate_craving(
         request.craving,
         meal_target,
         request.mood,
@@ -640,20 +712,44 @@ def negotiate_craving(request: schemas.NegotiatorRequest, current_user: models.U
         daily_target_calories=daily_target
     )
 
+@app.post("/negotiator/negotiate/stream")
+async def negotiate_craving_stream(request: schemas.NegotiatorRequest, current_user: models.User = Depends(auth.get_current_user)):
+    # Load everything from the DB session before the response starts streaming
+    allergens = [a.name for a in current_user.allergens]
+    favorite_recipes = list(current_user.favorite_recipes)
+    meal_target = compute_recipe_target_calories(current_user, request.target_calories)
+    daily_target = compute_daily_calorie_target(current_user)
+    prewarm.record_request(request.craving, meal_target, current_user.goal, allergens, daily_target)
+    return sse_response(negotiator.negotiate_craving_events(
+        request.craving,
+        meal_target,
+        request.mood,
+        favorite_recipes=favorite_recipes,
+        allergens=allergens,
+        plan_goal=current_user.goal,
+        daily_target_calories=daily_target
+    ))
+
 @app.post("/negotiator/nutrition", response_model=schemas.NutritionAnalysisResponse)
-def analyze_nutrition_endpoint(request: schemas.NutritionAnalysisRequest, current_user: models.User = Depends(auth.get_current_user)):
-    return negotiator.analyze_nutrition(request.food_text)
+async def analyze_nutrition_endpoint(request: schemas.NutritionAnalysisRequest, current_user: models.User = Depends(auth.get_current_user)):
+    return await negotiator.analyze_nutrition(request.food_text)
+
+@app.post("/negotiator/nutrition/batch", response_model=schemas.NutritionBatchResponse)
+async def analyze_nutrition_batch_endpoint(request: schemas.NutritionBatchRequest, current_user: models.User = Depends(auth.get_current_user)):
+    if len(request.food_texts) > negotiator.NUTRITION_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {negotiator.NUTRITION_BATCH_MAX_ITEMS} itens por pedido.")
+    return await negotiator.analyze_nutrition_batch(request.food_texts)
 
 @app.post("/negotiator/nutrition-image", response_model=schemas.NutritionAnalysisResponse)
 async def analyze_nutrition_image_endpoint(file: UploadFile = File(...), current_user: models.User = Depends(auth.get_current_user)):
     contents = await file.read()
-    return vision.analyze_image_nutrition(contents)
+    return await vision.analyze_image_nutrition(contents)
 
 @app.post("/vision/analyze", response_model=schemas.VisionResponse)
 async def analyze_ingredients_photo(mode: str = "ingredients", file: UploadFile = File(...), current_user: models.User = Depends(auth.get_current_user)):
     contents = await file.read()
     allergens = [a.name for a in current_user.allergens]
-    return vision.analyze_image_ingredients(contents, mode=mode, favorite_recipes=current_user.favorite_recipes, allergens=allergens)
+    return await vision.analyze_image_ingredients(contents, mode=mode, favorite_recipes=current_user.favorite_recipes, allergens=allergens)
 
 @app.post("/shops/find", response_model=list[schemas.Shop])
 def find_shops(request: schemas.ShopSearchRequest, current_user: models.User = Depends(auth.get_current_user)):
@@ -681,6 +777,59 @@ def find_shops(request: schemas.ShopSearchRequest, current_user: models.User = D
 def search_foods(q: str, page_size: int = 10, current_user: models.User = Depends(auth.get_current_user)):
     return food_data.search_foods(q, page_size=page_size)
 
+@app.post("/foods/search/batch", response_model=schemas.FoodSearchBatchResponse)
+def search_foods_batch(request: schemas.FoodSearchBatchRequest, current_user: models.User = Depends(auth.get_current_user)):
+    if len(request.queries) > food_data.FOOD_SEARCH_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {food_data.FOOD_SEARCH_BATCH_MAX_ITEMS} pesquisas por pedido.")
+    return {"items": food_data.search_foods_batch(request.queries, page_size=request.page_size)}
+
+@app.get("/foods/suggest", response_model=schemas.FoodSuggestResponse)
+def suggest_foods(
+    q: str,
+    request: Request,
+    response: Response,
+    limit: int = 8,
+    remote: bool = True,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    # Count and newest id change whenever a food is logged or removed; far cheaper than loading the history
+    history_version = tuple(
+        db.query(func.count(models.FoodHistory.id), func.max(models.FoodHistory.id))
+        .filter(models.FoodHistory.user_id == current_user.id)
+        .one()
+    )
+    headers = {"ETag": food_suggest.etag(q, limit, remote, history_version), "Cache-Control": food_suggest.CACHE_CONTROL, "Vary": "Authorization"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    history = (
+        db.query(models.FoodHistory)
+        .filter(models.FoodHistory.user_id == current_user.id)
+        .order_by(models.FoodHistory.created_at.desc())
+        .all()
+    )
+    result = food_suggest.suggest(
+        q,
+        limit=limit,
+        history=[
+            {
+                "name": item.name,
+                "calories_per_100g": item.calories_per_100g,
+                "protein_per_100g": item.protein_per_100g,
+                "carbs_per_100g": item.carbs_per_100g,
+                "fat_per_100g": item.fat_per_100g,
+                "source": item.source or "search",
+            }
+            for item in history
+        ],
+        remote=remote,
+    )
+    # Remote results may have arrived during this request
+    headers["ETag"] = food_suggest.etag(q, limit, remote, history_version)
+    response.headers.update(headers)
+    return result
+
 @app.post("/users/me/food-history", response_model=schemas.FoodHistoryResponse)
 def add_food_history(
     item: schemas.FoodHistoryCreate, 
@@ -821,6 +970,36 @@ def remove_favorite_restaurant(restaurant_id: int, db: Session = Depends(get_db)
         pass
     return current_user
 
+@app.get("/metrics/llm")
+def get_llm_metrics(current_user: models.User = Depends(auth.get_metrics_user)):
+    return {
+        **llm_client.get_client_stats(),
+        "cache": llm_client.get_cache_stats(),
+        "router": llm_client.get_router_stats(),
+        "profiles": llm_client.get_profile_stats(),
+        "json_output": llm_json.get_stats(),
+    }
+
+@app.get("/health/providers")
+def get_provider_health(current_user: models.User = Depends(auth.get_metrics_user)):
+    return provider_health.get_health()
+
+@app.get("/metrics/coalescing")
+def get_coalescing_metrics(current_user: models.User = Depends(auth.get_metrics_user)):
+    return singleflight.get_stats()
+
+@app.get("/metrics/mealdb")
+def get_mealdb_metrics(current_user: models.User = Depends(auth.get_metrics_user)):
+    return negotiator.get_mealdb_stats()
+
+@app.get("/metrics/foods")
+def get_food_metrics(current_user: models.User = Depends(auth.get_metrics_user)):
+    return {**food_data.get_food_stats(), "suggest": food_suggest.get_stats()}
+
+@app.get("/metrics/negotiator")
+def get_negotiator_metrics(current_user: models.User = Depends(auth.get_metrics_user)):
+    return {**negotiator.get_negotiator_stats(), "nutrition": negotiator.get_nutrition_stats(), "prewarm": prewarm.get_stats()}
+
 @app.api_route("/", methods=["GET", "HEAD"])
 async def root():
     print("ROOT ENDPOINT CALLED")
@@ -0,0 +1,161 @@
+import re
+import unicodedata
+from collections import deque
+from typing import Iterable, Optional
+from cache_store import MemoryCache
+
+# Prepared meals are keyed by idMeal; MealDB recipes do not change, so no TTL
+_prepared_cache = MemoryCache(max_entries=4096)
+
+
+def normalize_text(value: str) -> str:
+    if not value:
+        return ""
+    normalized = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    return normalized.lower().strip()
+
+
+def trigrams(value: str) -> frozenset[str]:
+    padded = f"  {value} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def extract_meal_ingredients(meal: dict) -> list[str]:
+    ingredients: list[str] = []
+    for i in range(1, 21):
+        ingredient = str(meal.get(f"strIngredient{i}", "")).strip()
+        measure = str(meal.get(f"strMeasure{i}", "")).strip()
+        if not ingredient:
+            continue
+        if ingredient.lower() in {"none", "null"}:
+            continue
+        entry = f"{measure} {ingredient}".strip()
+        ingredients.append(entry)
+    return ingredients
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick automaton: finds which of many patterns occur as substrings of a text
+    in a single pass over the text, instead of one `in` check per pattern.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = [p for p in dict.fromkeys(patterns) if p]
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[set[int]] = [set()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> set[str]:
+        found: set[int] = set()
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return {self.patterns[i] for i in found}
+
+
+class PreparedMeal:
+    """
+    Everything ranking needs from a MealDB meal, computed once: the ingredient lines,
+    the normalized name and ingredient text, token set and name trigrams.
+    """
+
+    __slots__ = ("meal", "meal_id", "ingredients", "name", "ingredient_text", "tokens", "name_trigrams")
+
+    def __init__(self, meal: dict):
+        self.meal = meal
+        self.meal_id = str(meal.get("idMeal", "")).strip()
+        self.ingredients = extract_meal_ingredients(meal)
+        self.name = normalize_text(str(meal.get("strMeal", "")))
+        # One line per ingredient so a pattern never matches across two ingredients
+        self.ingredient_text = "\n".join(normalize_text(item) for item in self.ingredients)
+        self.tokens = frozenset(re.findall(r"[a-z0-9]+", f"{self.name} {self.ingredient_text}"))
+        self.name_trigrams = trigrams(self.name)
+
+
+def prepare_meal(meal: dict) -> PreparedMeal:
+    # Only numeric MealDB ids are cached; "recipe-<id>" rows come from the editable recipes table
+    meal_id = str(meal.get("idMeal", "")).strip()
+    cacheable = meal_id.isdigit()
+    if cacheable:
+        prepared = _prepared_cache.get(meal_id)
+        if prepared is not None:
+            return prepared
+    prepared = PreparedMeal(meal)
+    if cacheable:
+        _prepared_cache.set(meal_id, prepared)
+    return prepared
+
+
+def score_meals(
+    meals: Iterable[dict],
+    requested_terms: list[str],
+    allergens: list[str],
+    query: Optional[str] = None,
+    boosts: Optional[dict[str, float]] = None,
+) -> list[tuple[int, float, PreparedMeal]]:
+    """
+    Scores every candidate in one pass with a shared automaton for terms and allergens.
+    Meals containing an allergen or matching no term are dropped. Returns
+    (semantic_score, similarity, prepared) sorted best first; similarity (trigram overlap
+    with `query` plus any retrieval boost for the meal id) only breaks ties.
+    """
+    terms = [normalize_text(term) for term in requested_terms if term]
+    blocked = [normalize_text(item) for item in allergens if item]
+    if not terms:
+        return []
+    matcher = PatternMatcher(terms + blocked)
+    blocked_set = set(blocked)
+    term_set = set(terms)
+    query_trigrams = trigrams(normalize_text(query)) if query else frozenset()
+
+    scored: list[tuple[int, float, PreparedMeal]] = []
+    for meal in meals:
+        prepared = prepare_meal(meal)
+        ingredient_hits = matcher.find(prepared.ingredient_text)
+        if blocked_set and ingredient_hits & blocked_set:
+            continue
+        name_hits = matcher.find(prepared.name) & term_set
+        # Same weights as the original per-term loop: 10 per ingredient match, 3 per name match
+        score = len(ingredient_hits & term_set) * 10 + len(name_hits) * 3
+        if score <= 0:
+            continue
+        similarity = 0.0
+        if query_trigrams:
+            union = len(query_trigrams | prepared.name_trigrams)
+            similarity = len(query_trigrams & prepared.name_trigrams) / union if union else 0.0
+        if boosts:
+            similarity += boosts.get(prepared.meal_id, 0.0)
+        scored.append((score, similarity, prepared))
+
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return scored
@@ -0,0 +1,181 @@
+import os
+import json
+import sqlite3
+import string
+import sys
+import time
+from typing import Callable, Optional
+from urllib.request import urlopen
+from cache_store import CACHE_DIR
+from meal_matcher import normalize_text
+from sqlite_fts import LocalSearchDB, fts_match, like_clauses, search_tokens
+
+MEALDB_BASE_URL = os.getenv("MEALDB_BASE_URL", "https://www.themealdb.com/api/json/v1/1")
+MEALDB_MIRROR_PATH = os.getenv("MEALDB_MIRROR_PATH", os.path.join(CACHE_DIR, "mealdb_mirror.sqlite3"))
+MEALDB_MIRROR_MAX_RESULTS = int(os.getenv("MEALDB_MIRROR_MAX_RESULTS", "60"))
+
+_db = LocalSearchDB(MEALDB_MIRROR_PATH)
+
+
+def _meal_ingredients(meal: dict) -> list[str]:
+    ingredients = []
+    for i in range(1, 21):
+        ingredient = normalize_text(str(meal.get(f"strIngredient{i}") or ""))
+        if ingredient and ingredient not in {"none", "null"} and ingredient not in ingredients:
+            ingredients.append(ingredient)
+    return ingredients
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS meals ("
+        "id TEXT PRIMARY KEY, name TEXT NOT NULL, name_norm TEXT NOT NULL, data TEXT NOT NULL, synced_at REAL NOT NULL)"
+    )
+    # Inverted index: one row per (ingredient token, meal) so "chicken" also finds "chicken breast"
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS meal_ingredients ("
+        "token TEXT NOT NULL, meal_id TEXT NOT NULL, PRIMARY KEY (token, meal_id)) WITHOUT ROWID"
+    )
+    _db.create_fts(conn, "meals_fts", "meal_id UNINDEXED, name")
+    conn.commit()
+
+
+def is_available() -> bool:
+    return _db.has_rows("meals", _ensure_schema)
+
+
+def _rows_to_meals(rows) -> list[dict]:
+    return [json.loads(row[0]) for row in rows]
+
+
+def search_by_name(query: str, limit: int = MEALDB_MIRROR_MAX_RESULTS) -> list[dict]:
+    """
+    Local equivalent of search.php?s=<query>: meals whose name contains every word of the query.
+    """
+    tokens = search_tokens(query)
+    if not tokens:
+        return []
+    conn = _db.connect()
+    if _db.fts_enabled:
+        rows = conn.execute(
+            "SELECT m.data FROM meals_fts f JOIN meals m ON m.id = f.meal_id "
+            "WHERE meals_fts MATCH ? ORDER BY rank LIMIT ?",
+            (fts_match(tokens), limit),
+        ).fetchall()
+    else:
+        clauses, params = like_clauses("name_norm", tokens)
+        rows = conn.execute(f"SELECT data FROM meals WHERE {clauses} LIMIT ?", (*params, limit)).fetchall()
+    return _rows_to_meals(rows)
+
+
+def search_by_ingredient(term: str, limit: int = MEALDB_MIRROR_MAX_RESULTS) -> list[dict]:
+    """
+    Local equivalent of filter.php?i=<term>, but returning full meals so no lookup.php is needed.
+    Multi-word terms must match every word (e.g. "olive oil").
+    """
+    tokens = search_tokens(term)
+    if not tokens:
+        return []
+    placeholders = ",".join("?" for _ in tokens)
+    rows = _db.connect().execute(
+        f"SELECT m.data FROM meals m JOIN ("
+        f"SELECT meal_id FROM meal_ingredients WHERE token IN ({placeholders}) "
+        f"GROUP BY meal_id HAVING COUNT(DISTINCT token) = ?"
+        f") hits ON hits.meal_id = m.id LIMIT ?",
+        (*tokens, len(set(tokens)), limit),
+    ).fetchall()
+    return _rows_to_meals(rows)
+
+
+def get_meal(meal_id: str) -> Optional[dict]:
+    row = _db.connect().execute("SELECT data FROM meals WHERE id = ?", (str(meal_id),)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def iter_meals():
+    if not is_available():
+        return
+    for row in _db.connect().execute("SELECT data FROM meals ORDER BY id"):
+        yield json.loads(row[0])
+
+
+def _fetch_json(url: str) -> dict:
+    with urlopen(url, timeout=15) as response:
+        data = json.loads(response.read().decode("utf-8"))
+    return data if isinstance(data, dict) else {}
+
+
+def sync_mirror(fetch_json: Callable[[str], dict] = _fetch_json) -> int:
+    """
+    Downloads the whole MealDB catalogue (search.php?f=a..z) and replaces the local mirror
+    in a single transaction, so readers keep seeing the previous copy until it commits.
+    If any letter fails the sync is aborted and the existing mirror is kept untouched, since
+    replacing it would drop every meal of that letter. Returns the number of meals stored.
+    """
+    meals: dict[str, dict] = {}
+    failed: list[str] = []
+    for letter in string.ascii_lowercase:
+        try:
+            data = fetch_json(f"{MEALDB_BASE_URL}/search.php?f={letter}")
+        except Exception as e:
+            print(f"ERRO MealDB mirror ({letter}): {e}")
+            failed.append(letter)
+            continue
+        for meal in data.get("meals") or []:
+            meal_id = str(meal.get("idMeal", "")).strip()
+            if meal_id:
+                meals[meal_id] = meal
+
+    if failed:
+        print(f"MealDB mirror: falha nas letras {', '.join(failed)}, mirror existente mantido.")
+        return 0
+    if not meals:
+        print("MealDB mirror: nenhuma receita obtida, mirror existente mantido.")
+        return 0
+
+    conn = _db.connect()
+    _ensure_schema(conn)
+    now = time.time()
+    with conn:
+        conn.execute("DELETE FROM meals")
+        conn.execute("DELETE FROM meal_ingredients")
+        if _db.fts_enabled:
+            conn.execute("DELETE FROM meals_fts")
+        for meal_id, meal in meals.items():
+            name = str(meal.get("strMeal", "")).strip()
+            conn.execute(
+                "INSERT INTO meals (id, name, name_norm, data, synced_at) VALUES (?, ?, ?, ?, ?)",
+                (meal_id, name, normalize_text(name), json.dumps(meal, ensure_ascii=False), now),
+            )
+            if _db.fts_enabled:
+                conn.execute("INSERT INTO meals_fts (meal_id, name) VALUES (?, ?)", (meal_id, normalize_text(name)))
+            tokens = {token for ingredient in _meal_ingredients(meal) for token in search_tokens(ingredient)}
+            conn.executemany(
+                "INSERT OR IGNORE INTO meal_ingredients (token, meal_id) VALUES (?, ?)",
+                [(token, meal_id) for token in tokens],
+            )
+    print(f"MealDB mirror: {len(meals)} receitas sincronizadas em {MEALDB_MIRROR_PATH}")
+    return len(meals)
+
+
+def stats() -> dict:
+    if not is_available():
+        return {"available": False, "path": MEALDB_MIRROR_PATH}
+    conn = _db.connect()
+    count, synced_at = conn.execute("SELECT COUNT(*), MAX(synced_at) FROM meals").fetchone()
+    return {
+        "available": True,
+        "path": MEALDB_MIRROR_PATH,
+        "meals": count,
+        "fts5": bool(_db.fts_enabled),
+        "age_seconds": round(time.time() - synced_at, 1) if synced_at else None,
+    }
+
+
+if __name__ == "__main__":
+    # Uso: python mealdb_mirror.py [sync|stats]
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    if command == "stats":
+        print(json.dumps(stats(), indent=2))
+    else:
+        sync_mirror()
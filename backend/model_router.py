@@ -0,0 +1,207 @@
+import os
+import re
+import threading
+import time
+from typing import Mapping, Optional
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN
+
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("LLM_ROUTER_FAILURE_THRESHOLD", "3"))
+ROUTER_RECOVERY_SECONDS = float(os.getenv("LLM_ROUTER_RECOVERY_SECONDS", "30"))
+# Assumed wait when a 429 arrives without any reset/retry-after hint
+ROUTER_DEFAULT_COOLDOWN_SECONDS = float(os.getenv("LLM_ROUTER_DEFAULT_COOLDOWN_SECONDS", "20"))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class ModelsUnavailableError(RuntimeError):
+    pass
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses rate-limit reset values such as "7.66s", "2m59.56s", "1h2m" or "250ms" into seconds.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    factors = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(amount) * factors[unit] for amount, unit in parts)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelBudget:
+    """
+    Requests/tokens-per-minute budget for one model, refreshed from x-ratelimit-* response headers
+    and decremented locally between responses so concurrent calls do not all pick the same model.
+    """
+
+    def __init__(self):
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def has_budget(self, estimated_tokens: int) -> bool:
+        now = time.time()
+        if now < self.blocked_until:
+            return False
+        if self.remaining_requests is not None and self.remaining_requests <= 0 and now < self.requests_reset_at:
+            return False
+        if self.remaining_tokens is not None and self.remaining_tokens < estimated_tokens and now < self.tokens_reset_at:
+            return False
+        return True
+
+    def available_at(self) -> float:
+        return max(self.blocked_until, min(self.requests_reset_at, self.tokens_reset_at) or 0.0)
+
+    def reserve(self, estimated_tokens: int) -> None:
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= estimated_tokens
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        now = time.time()
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            self.remaining_requests = remaining_requests
+            self.requests_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-requests")) or 60.0)
+        if remaining_tokens is not None:
+            self.remaining_tokens = remaining_tokens
+            self.tokens_reset_at = now + (parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) or 60.0)
+
+    def block(self, headers: Mapping[str, str]) -> None:
+        wait = (
+            parse_reset_duration(headers.get("retry-after"))
+            or parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+            or parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            or ROUTER_DEFAULT_COOLDOWN_SECONDS
+        )
+        self.blocked_until = time.time() + wait
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        return {
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+            "requests_reset_in": round(max(0.0, self.requests_reset_at - now), 2),
+            "tokens_reset_in": round(max(0.0, self.tokens_reset_at - now), 2),
+            "blocked_for": round(max(0.0, self.blocked_until - now), 2),
+        }
+
+
+class ModelRouter:
+    """
+    Picks which model to call from a preference list, skipping models whose
+    rate-limit budget is spent or whose circuit breaker is open, instead of
+    discovering that through a failed 429 round trip.
+    """
+
+    def __init__(self, failure_threshold: int = ROUTER_FAILURE_THRESHOLD, recovery_timeout: float = ROUTER_RECOVERY_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._budgets: dict[str, ModelBudget] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._stats = {"routed": 0, "proactive_skips": 0, "rate_limited": 0}
+
+    def _state(self, model: str) -> tuple[ModelBudget, CircuitBreaker]:
+        if model not in self._budgets:
+            self._budgets[model] = ModelBudget()
+            self._breakers[model] = CircuitBreaker(model, self.failure_threshold, self.recovery_timeout)
+        return self._budgets[model], self._breakers[model]
+
+    def order(self, candidates: list[str], estimated_tokens: int) -> list[str]:
+        """
+        Returns the candidates worth trying, best first: models with budget in preference order,
+        then budget-exhausted ones by soonest reset. Models with an open breaker are left out.
+        """
+        with self._lock:
+            ready: list[str] = []
+            exhausted: list[tuple[float, str]] = []
+            for model in candidates:
+                budget, breaker = self._state(model)
+                if breaker.state == OPEN:
+                    continue
+                if budget.has_budget(estimated_tokens):
+                    ready.append(model)
+                else:
+                    exhausted.append((budget.available_at(), model))
+            if ready and ready[0] != candidates[0]:
+                self._stats["proactive_skips"] += 1
+            ordered = ready + [model for _, model in sorted(exhausted)]
+            if not ordered:
+                raise ModelsUnavailableError(f"No LLM model available (circuit open): {', '.join(candidates)}")
+            return ordered
+
+    def acquire(self, model: str, estimated_tokens: int) -> bool:
+        with self._lock:
+            budget, breaker = self._state(model)
+            if not breaker.allow_request():
+                return False
+            budget.reserve(estimated_tokens)
+            self._stats["routed"] += 1
+            return True
+
+    def record_success(self, model: str, headers: Optional[Mapping[str, str]] = None) -> None:
+        with self._lock:
+            budget, breaker = self._state(model)
+            if headers is not None:
+                budget.update_from_headers(headers)
+        breaker.record_success()
+
+    def record_rate_limited(self, model: str, headers: Optional[Mapping[str, str]] = None) -> None:
+        with self._lock:
+            budget, breaker = self._state(model)
+            headers = headers or {}
+            budget.update_from_headers(headers)
+            budget.block(headers)
+            self._stats["rate_limited"] += 1
+        # Out of quota is not a health problem, so release a half-open probe without counting a failure
+        breaker.record_success()
+
+    def record_failure(self, model: str) -> None:
+        with self._lock:
+            _, breaker = self._state(model)
+        breaker.record_failure()
+
+    def has_headroom(self, min_requests: int, min_tokens: int) -> bool:
+        """
+        True when no known model is blocked, tripped or below the given remaining budget.
+        Used by background work to stay out of the way of live traffic.
+        """
+        now = time.time()
+        with self._lock:
+            for model, budget in self._budgets.items():
+                if self._breakers[model].state != CLOSED or now < budget.blocked_until:
+                    return False
+                if budget.remaining_requests is not None and budget.remaining_requests < min_requests and now < budget.requests_reset_at:
+                    return False
+                if budget.remaining_tokens is not None and budget.remaining_tokens < min_tokens and now < budget.tokens_reset_at:
+                    return False
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "models": {
+                    model: {**self._budgets[model].snapshot(), "breaker": self._breakers[model].snapshot()}
+                    for model in self._budgets
+                },
+            }
@@ -1,14 +1,27 @@
+import asyncio
 import json
+import os
 import random
 import re
-import unicodedata
-from urllib.parse import quote_plus
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote_plus, urlparse
 from urllib.request import urlopen
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, List, Optional
 import schemas
 import food_data
+import mealdb_mirror
+import recipe_index
+import llm_json
+import provider_health
 from fastapi import HTTPException
-from llm_client import get_chat_completion
+from llm_client import get_chat_completion_async, stream_chat_completion_async
+from sse import PartialJsonField, run_with_events
+from singleflight import SingleFlight
+from cache_store import SQLiteCache, TieredCache, build_cache
+from deadline import Deadline, DeadlineExceeded
+from meal_matcher import extract_meal_ingredients, normalize_text, score_meals
 
 MEALDB_BASE_URL = "https://www.themealdb.com/api/json/v1/1"
 PT_STOPWORDS = {
@@ -39,16 +52,88 @@ PT_TO_EN_TERM_MAP = {
     "pimento": "pepper",
 }
 
+RECIPE_SYSTEM_PROMPT = (
+    "És um Chef Michelin e Nutricionista PT-PT que adora variedade alta, pouca repetição e quantidades realistas por ingrediente. Quinoa/qinoa é proibida."
+)
+STRICT_JSON_RULES = (
+    "\nREGRAS JSON ESTRITAS: "
+    "Retorna APENAS JSON válido, sem markdown e sem texto fora do objeto. "
+    "Em 'ingredients' e 'steps', cada item deve ser APENAS uma string simples. "
+    "NÃO uses quinoa/qinoa."
+)
+
+# Receives (event, data) pairs such as ("stage", {"stage": "translated"}) for streaming clients
+StageCallback = Callable[[str, Any], None]
+
+_mealdb_flight = SingleFlight("mealdb_fetch")
+
+# Live MealDB fan-out: parallel searches, pipelined lookups, one overall budget
+MEALDB_MAX_CONCURRENCY = int(os.getenv("MEALDB_MAX_CONCURRENCY", "4"))
+MEALDB_SEARCH_BUDGET_SECONDS = float(os.getenv("MEALDB_SEARCH_BUDGET_SECONDS", "5"))
+MEALDB_MAX_LOOKUPS = 14
+_mealdb_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="mealdb")
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+_fanout_stats = {"runs": 0, "deadline_hits": 0, "last": None}
+
+# Raw MealDB responses keyed by URL; sqlite by default so every worker shares it across restarts
+MEALDB_HTTP_CACHE_BACKEND = os.getenv("MEALDB_HTTP_CACHE_BACKEND", "sqlite")
+MEALDB_HTTP_LOOKUP_TTL_SECONDS = float(os.getenv("MEALDB_HTTP_LOOKUP_TTL_SECONDS", str(30 * 86400)))
+MEALDB_HTTP_SEARCH_TTL_SECONDS = float(os.getenv("MEALDB_HTTP_SEARCH_TTL_SECONDS", "86400"))
+MEALDB_HTTP_NEGATIVE_TTL_SECONDS = float(os.getenv("MEALDB_HTTP_NEGATIVE_TTL_SECONDS", "3600"))
+MEALDB_HTTP_STALE_SECONDS = float(os.getenv("MEALDB_HTTP_STALE_SECONDS", str(7 * 86400)))
+_http_cache = build_cache(MEALDB_HTTP_CACHE_BACKEND, "mealdb_http", 20000)
+_http_stats = {"fresh_hits": 0, "stale_hits": 0, "stored": 0, "negative_stored": 0, "revalidated": 0}
+_revalidating: set[str] = set()
+_revalidating_lock = threading.Lock()
+
+# End-to-end latency budget for one negotiation; stages degrade instead of overrunning it
+NEGOTIATOR_SLA_SECONDS = float(os.getenv("NEGOTIATOR_SLA_SECONDS", "15"))
+# Least time worth starting the translate-and-portion LLM call with
+NEGOTIATOR_TRANSLATE_MIN_SECONDS = float(os.getenv("NEGOTIATOR_TRANSLATE_MIN_SECONDS", "3"))
+
+# Speculative mode runs the MealDB path and LLM generation at once (costs one LLM call even when MealDB wins)
+NEGOTIATOR_SPECULATIVE = os.getenv("NEGOTIATOR_SPECULATIVE", "0") == "1"
+NEGOTIATOR_MEALDB_WINDOW_SECONDS = float(os.getenv("NEGOTIATOR_MEALDB_WINDOW_SECONDS", "4"))
+# Finished NegotiatorResponses, pooled per (craving, calorie bucket, goal, allergens, daily target bucket) so
+# repeats skip the pipeline. Off by default; requests with a mood or favourite recipes are never pooled
+NEGOTIATOR_CACHE_BACKEND = os.getenv("NEGOTIATOR_CACHE_BACKEND", "off")
+NEGOTIATOR_CACHE_TTL_SECONDS = float(os.getenv("NEGOTIATOR_CACHE_TTL_SECONDS", "21600"))
+NEGOTIATOR_CACHE_MAX_KEYS = int(os.getenv("NEGOTIATOR_CACHE_MAX_KEYS", "1000"))
+NEGOTIATOR_CACHE_VARIANTS = int(os.getenv("NEGOTIATOR_CACHE_VARIANTS", "3"))
+NEGOTIATOR_CACHE_CALORIE_BUCKET = int(os.getenv("NEGOTIATOR_CACHE_CALORIE_BUCKET", "100"))
+NEGOTIATOR_CACHE_DAILY_BUCKET = int(os.getenv("NEGOTIATOR_CACHE_DAILY_BUCKET", "250"))
+NEGOTIATOR_CACHE_ROTATION = os.getenv("NEGOTIATOR_CACHE_ROTATION", "round_robin")  # round_robin | random
+_result_cache = build_cache(NEGOTIATOR_CACHE_BACKEND, "negotiator_results", NEGOTIATOR_CACHE_MAX_KEYS, NEGOTIATOR_CACHE_TTL_SECONDS)
+_result_cache_stats = {"pool_hits": 0, "pool_misses": 0, "variants_stored": 0, "duplicates_skipped": 0, "personalised_bypass": 0}
+
+_speculation_stats = {
+    "runs": 0, "mealdb_wins": 0, "generated_wins": 0, "mealdb_timeouts": 0,
+    "cancelled_mealdb": 0, "cancelled_generated": 0, "last_ms": None,
+}
 
-def _normalize_text(value: str) -> str:
-    if not value:
-        return ""
-    normalized = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
-    return normalized.lower().strip()
+# /negotiator/nutrition answers per normalized food text, shared by the single and batch endpoints
+NUTRITION_CACHE_BACKEND = os.getenv("NUTRITION_CACHE_BACKEND", "tiered")
+NUTRITION_CACHE_TTL_SECONDS = float(os.getenv("NUTRITION_CACHE_TTL_SECONDS", str(7 * 86400)))
+NUTRITION_CACHE_MAX_ENTRIES = int(os.getenv("NUTRITION_CACHE_MAX_ENTRIES", "20000"))
+# Items packed into one prompt by /negotiator/nutrition/batch; larger batches run as concurrent chunks
+NUTRITION_BATCH_CHUNK_SIZE = int(os.getenv("NUTRITION_BATCH_CHUNK_SIZE", "10"))
+NUTRITION_BATCH_TOKENS_PER_ITEM = int(os.getenv("NUTRITION_BATCH_TOKENS_PER_ITEM", "90"))
+NUTRITION_BATCH_MAX_ITEMS = int(os.getenv("NUTRITION_BATCH_MAX_ITEMS", "30"))
+_nutrition_cache = build_cache(
+    NUTRITION_CACHE_BACKEND, "nutrition_analysis", NUTRITION_CACHE_MAX_ENTRIES, NUTRITION_CACHE_TTL_SECONDS,
+    memory_entries=1024,
+)
+_nutrition_stats = {"batches": 0, "llm_calls": 0, "unanswered": 0, "cache_hits": 0, "cache_misses": 0}
+
+# Translated + one-portion MealDB recipes, keyed by idMeal (the source recipe never changes)
+MEALDB_TRANSLATION_CACHE_BACKEND = os.getenv("MEALDB_TRANSLATION_CACHE_BACKEND", "sqlite")
+MEALDB_TRANSLATION_CACHE_TTL_SECONDS = float(os.getenv("MEALDB_TRANSLATION_CACHE_TTL_SECONDS", str(30 * 86400)))
+_translated_meal_cache = build_cache(MEALDB_TRANSLATION_CACHE_BACKEND, "mealdb_translations", 1024, MEALDB_TRANSLATION_CACHE_TTL_SECONDS)
 
 
 def _extract_query_terms(craving: str) -> list[str]:
-    normalized = _normalize_text(craving)
+    normalized = normalize_text(craving)
     tokens = re.findall(r"[a-z0-9]{3,}", normalized)
     terms = []
     for token in tokens:
@@ -60,13 +145,13 @@ def _extract_query_terms(craving: str) -> list[str]:
 
 
 def _to_en_term(term: str) -> str:
-    return PT_TO_EN_TERM_MAP.get(_normalize_text(term), _normalize_text(term))
+    return PT_TO_EN_TERM_MAP.get(normalize_text(term), normalize_text(term))
 
 
 def _expand_terms_for_api(terms: list[str]) -> list[str]:
     expanded: list[str] = []
     for term in terms:
-        normalized = _normalize_text(term)
+        normalized = normalize_text(term)
         translated = _to_en_term(term)
         if normalized and normalized not in expanded:
             expanded.append(normalized)
@@ -75,69 +160,94 @@ def _expand_terms_for_api(terms: list[str]) -> list[str]:
     return expanded
 
 
-def _safe_fetch_json(url: str) -> dict:
+def _fetch_json(url: str) -> dict:
+    with urlopen(url, timeout=6) as response:
+        payload = response.read().decode("utf-8")
+    data = json.loads(payload)
+    return data if isinstance(data, dict) else {}
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MEALDB_MAX_CONCURRENCY)
+        return _host_slots[host]
+
+
+def _is_mealdb_failure(error: Exception) -> bool:
+    # A 4xx or a malformed body means MealDB answered; only network errors and 5xx mark it down
+    status = getattr(error, "code", None)
+    return not isinstance(error, ValueError) and not (isinstance(status, int) and status < 500)
+
+
+def _fetch_json_limited(url: str) -> dict:
+    # Raises ProviderUnavailable right away while MealDB is marked down; callers already fall back on errors
+    with provider_health.guard("mealdb", _is_mealdb_failure), _host_slot(url):
+        return _fetch_json(url)
+
+
+def _http_ttl(url: str, data: dict) -> float:
+    if not data.get("meals"):
+        return MEALDB_HTTP_NEGATIVE_TTL_SECONDS
+    if "/lookup.php" in url:
+        return MEALDB_HTTP_LOOKUP_TTL_SECONDS
+    return MEALDB_HTTP_SEARCH_TTL_SECONDS
+
+
+def _fetch_and_store(url: str) -> dict:
     try:
-        with urlopen(url, timeout=6) as response:
-            payload = response.read().decode("utf-8")
-        data = json.loads(payload)
-        return data if isinstance(data, dict) else {}
+        data = _fetch_json_limited(url)
     except Exception:
+        # Network errors are not cached; only real (possibly empty) answers are
         return {}
+    if _http_cache is not None:
+        ttl = _http_ttl(url, data)
+        _http_stats["negative_stored" if not data.get("meals") else "stored"] += 1
+        # Kept on disk for the stale window too, so an expired entry can still be served while refreshing
+        _http_cache.set(url, {"data": data, "fetched_at": time.time(), "ttl": ttl}, ttl=ttl + MEALDB_HTTP_STALE_SECONDS)
+    return data
 
 
-def _get_meal_details(meal_id: str) -> Optional[dict]:
-    data = _safe_fetch_json(f"{MEALDB_BASE_URL}/lookup.php?i={quote_plus(str(meal_id))}")
-    meals = data.get("meals") if isinstance(data, dict) else None
-    if not meals:
-        return None
-    return meals[0]
-
-
-def _extract_meal_ingredients(meal: dict) -> list[str]:
-    ingredients: list[str] = []
-    for i in range(1, 21):
-        ingredient = str(meal.get(f"strIngredient{i}", "")).strip()
-        measure = str(meal.get(f"strMeasure{i}", "")).strip()
-        if not ingredient:
-            continue
-        if ingredient.lower() in {"none", "null"}:
-            continue
-        entry = f"{measure} {ingredient}".strip()
-        ingredients.append(entry)
-    return ingredients
-
-
-def _contains_allergen(ingredients: list[str], allergens: list[str]) -> bool:
-    if not allergens:
-        return False
-    normalized_ingredients = [_normalize_text(item) for item in ingredients]
-    normalized_allergens = [_normalize_text(item) for item in allergens if item]
-    for allergen in normalized_allergens:
-        if not allergen:
-            continue
-        for ingredient in normalized_ingredients:
-            if allergen in ingredient:
-                return True
-    return False
+def _revalidate(url: str) -> None:
+    try:
+        _mealdb_flight.do(url, lambda: _fetch_and_store(url))
+        _http_stats["revalidated"] += 1
+    finally:
+        with _revalidating_lock:
+            _revalidating.discard(url)
 
 
-def _score_meal_for_query(meal: dict, requested_terms: list[str]) -> int:
-    if not requested_terms:
-        return 0
+def _schedule_revalidate(url: str) -> None:
+    with _revalidating_lock:
+        if url in _revalidating:
+            return
+        _revalidating.add(url)
+    _mealdb_executor.submit(_revalidate, url)
 
-    meal_name = _normalize_text(str(meal.get("strMeal", "")))
-    ingredients = [_normalize_text(item) for item in _extract_meal_ingredients(meal)]
 
-    ingredient_matches = 0
-    name_matches = 0
+def _safe_fetch_json(url: str) -> dict:
+    entry = _http_cache.get(url) if _http_cache is not None else None
+    if entry:
+        if time.time() - entry["fetched_at"] < entry["ttl"]:
+            _http_stats["fresh_hits"] += 1
+        else:
+            _http_stats["stale_hits"] += 1
+            _schedule_revalidate(url)
+        return entry["data"]
+    return _mealdb_flight.do(url, lambda: _fetch_and_store(url))
 
-    for term in requested_terms:
-        if any(term in ingredient for ingredient in ingredients):
-            ingredient_matches += 1
-        if term in meal_name:
-            name_matches += 1
 
-    return ingredient_matches * 10 + name_matches * 3
+def _get_meal_details(meal_id: str) -> Optional[dict]:
+    if mealdb_mirror.is_available():
+        meal = mealdb_mirror.get_meal(meal_id)
+        if meal:
+            return meal
+    data = _safe_fetch_json(f"{MEALDB_BASE_URL}/lookup.php?i={quote_plus(str(meal_id))}")
+    meals = data.get("meals") if isinstance(data, dict) else None
+    if not meals:
+        return None
+    return meals[0]
 
 
 def _score_calorie_alignment(calories: int, target_calories: int, plan_goal: Optional[str]) -> int:
@@ -147,7 +257,7 @@ def _score_calorie_alignment(calories: int, target_calories: int, plan_goal: Opt
     diff = abs(calories - target_calories)
     score = max(0, 50 - (diff // 12))
 
-    goal = _normalize_text(plan_goal or "")
+    goal = normalize_text(plan_goal or "")
     if goal == "lose" and calories <= target_calories:
         score += 10
     elif goal == "lose" and calories > int(target_calories * 1.12):
@@ -170,8 +280,8 @@ def _split_steps(instructions: str) -> list[str]:
     return sentences[:12] if sentences else [instructions.strip()]
 
 
-def _build_negotiator_recipe_from_meal(meal: dict, target_calories: int) -> Optional[dict]:
-    ingredients = _extract_meal_ingredients(meal)
+def _build_negotiator_recipe_from_meal(meal: dict, target_calories: int, ingredients: Optional[list[str]] = None) -> Optional[dict]:
+    ingredients = ingredients if ingredients is not None else extract_meal_ingredients(meal)
     if not ingredients:
         return None
 
@@ -180,6 +290,7 @@ def _build_negotiator_recipe_from_meal(meal: dict, target_calories: int) -> Opti
         steps = ["Segue o modo de preparação tradicional do prato."]
 
     return {
+        "meal_id": str(meal.get("idMeal", "")).strip() or None,
         "title": str(meal.get("strMeal", "Receita sugerida")).strip(),
         "calories": max(250, target_calories),
         "time_minutes": 35,
@@ -188,7 +299,58 @@ def _build_negotiator_recipe_from_meal(meal: dict, target_calories: int) -> Opti
     }
 
 
-def _translate_recipe_to_pt(recipe: dict) -> dict:
+def _format_quantity(value: float) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def _parse_ingredient_quantities(items: list) -> list[dict]:
+    quantities: list[dict] = []
+    for item in items:
+        if isinstance(item, dict):
+            name = str(item.get("name") or "").strip()
+            if not name:
+                continue
+            try:
+                quantity = float(item["quantity"]) if item.get("quantity") not in (None, "") else None
+            except (TypeError, ValueError):
+                quantity = None
+            unit = str(item.get("unit") or "").strip() or None
+            quantities.append({"name": name, "quantity": quantity, "unit": unit})
+        elif str(item).strip():
+            quantities.append({"name": str(item).strip(), "quantity": None, "unit": None})
+    return quantities
+
+
+def _ingredient_line(item: dict) -> str:
+    # Same "<qty> <unit> <name>" shape calculate_recipe_calories parses; "sal q.b." when there is no amount
+    if item.get("quantity") is None:
+        return f"{item['name']} {item['unit']}" if item.get("unit") else item["name"]
+    parts = [_format_quantity(item["quantity"])]
+    if item.get("unit"):
+        parts.append(item["unit"])
+    parts.append(item["name"])
+    return " ".join(parts)
+
+
+async def _translate_and_portion_recipe(recipe: dict, meal_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> dict:
+    """
+    Translates a MealDB recipe to PT-PT and scales it to one portion in a single LLM call,
+    returning structured per-ingredient quantities as well. Results are cached per idMeal.
+    """
+    # Only MealDB ids are immutable; rows from the recipes table ("recipe-<id>") can be edited
+    cache_key = f"v1:{meal_id}" if meal_id and meal_id.isdigit() else None
+    if cache_key and _translated_meal_cache is not None:
+        cached = _translated_meal_cache.get(cache_key)
+        if cached:
+            return {**recipe, **cached}
+
+    if deadline is not None and not deadline.allows(NEGOTIATOR_TRANSLATE_MIN_SECONDS):
+        deadline.skip("translation")
+        deadline.skip("portion_normalization")
+        return recipe
+
     try:
         payload = {
             "title": recipe.get("title", ""),
@@ -196,127 +358,185 @@ def _translate_recipe_to_pt(recipe: dict) -> dict:
             "steps": recipe.get("steps", []),
         }
         prompt = (
-            "Traduz para português de Portugal (PT-PT) mantendo quantidades e sentido culinário. "
-            "Responde APENAS com JSON válido no mesmo formato, sem texto extra: "
-            "{ 'title': '...', 'ingredients': ['...'], 'steps': ['...'] }.\n\n"
+            "Traduz esta receita para português de Portugal (PT-PT) e ajusta-a para 1 pessoa (uma refeição individual). "
+            "Mantém o mesmo prato e técnica, apenas ajusta as quantidades para 1 porção realista, de preferência em g ou ml. "
+            "Responde APENAS com JSON válido, sem texto extra: "
+            "{ 'title': '...', 'ingredients': [ { 'name': 'frango', 'quantity': 150, 'unit': 'g' } ], 'steps': ['...'] }. "
+            "Usa 'quantity': null quando não houver quantidade (ex: sal q.b.).\n\n"
             f"DADOS:\n{json.dumps(payload, ensure_ascii=False)}"
         )
-        response = get_chat_completion(
+        response = await get_chat_completion_async(
             messages=[
-                {"role": "system", "content": "És um tradutor culinário PT-PT. Responde apenas JSON válido."},
+                {"role": "system", "content": "És um chef e tradutor culinário PT-PT. Responde apenas JSON válido."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.2,
             response_format={"type": "json_object"},
-            max_tokens=900
+            max_tokens=900,
+            profile="extract-json",
+            deadline=deadline
         )
-        translated = json.loads(response.choices[0].message.content)
+        result = llm_json.parse_object(response.choices[0].message.content, "translation") or {}
 
-        title = str(translated.get("title") or payload["title"]).strip()
-        ingredients = translated.get("ingredients") if isinstance(translated.get("ingredients"), list) else payload["ingredients"]
-        steps = translated.get("steps") if isinstance(translated.get("steps"), list) else payload["steps"]
+        quantities = _parse_ingredient_quantities(result.get("ingredients") if isinstance(result.get("ingredients"), list) else [])
+        steps = result.get("steps") if isinstance(result.get("steps"), list) else payload["steps"]
+        if not quantities:
+            return recipe
 
-        return {
-            **recipe,
-            "title": title or recipe.get("title", ""),
-            "ingredients": [str(item) for item in ingredients if str(item).strip()],
+        translated = {
+            "title": str(result.get("title") or "").strip() or payload["title"],
+            "ingredients": [_ingredient_line(item) for item in quantities],
+            "ingredient_quantities": quantities,
             "steps": [str(item) for item in steps if str(item).strip()],
         }
+        if cache_key and _translated_meal_cache is not None:
+            _translated_meal_cache.set(cache_key, translated)
+        return {**recipe, **translated}
     except Exception:
+        if deadline is not None:
+            deadline.skip("translation")
+            deadline.skip("portion_normalization")
         return recipe
 
 
-def _normalize_recipe_portion_one_person(recipe: dict) -> dict:
+def _local_candidate_meals(name_queries: list[str], api_terms: list[str]) -> tuple[list[dict], dict[str, float]]:
+    """
+    Candidates found without network I/O: mirror name/ingredient matches plus the TF-IDF index top-k.
+    Also returns the index similarity per meal id, used to break ties when ranking.
+    """
+    meals: dict[str, dict] = {}
+    similarities: dict[str, float] = {}
     try:
-        payload = {
-            "title": recipe.get("title", ""),
-            "ingredients": recipe.get("ingredients", []),
-            "steps": recipe.get("steps", []),
-        }
-        prompt = (
-            "Ajusta esta receita para 1 pessoa (uma refeição individual). "
-            "Mantém o mesmo prato e técnica, apenas ajusta quantidades dos ingredientes para 1 porção realista. "
-            "Responde APENAS com JSON válido no mesmo formato, sem texto extra: "
-            "{ 'title': '...', 'ingredients': ['...'], 'steps': ['...'] }.\n\n"
-            f"DADOS:\n{json.dumps(payload, ensure_ascii=False)}"
-        )
-        response = get_chat_completion(
-            messages=[
-                {"role": "system", "content": "És um chef PT-PT. Ajusta quantidades para 1 pessoa e retorna apenas JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"},
-            max_tokens=900
-        )
-        normalized = json.loads(response.choices[0].message.content)
+        if mealdb_mirror.is_available():
+            for query in name_queries:
+                for meal in mealdb_mirror.search_by_name(query):
+                    meals.setdefault(str(meal.get("idMeal", "")), meal)
+            for term in api_terms[:6]:
+                for meal in mealdb_mirror.search_by_ingredient(term):
+                    meals.setdefault(str(meal.get("idMeal", "")), meal)
+        for similarity, meal in recipe_index.search(" ".join(name_queries + api_terms)):
+            meal_id = str(meal.get("idMeal", ""))
+            meals.setdefault(meal_id, meal)
+            similarities[meal_id] = similarity
+    except Exception as e:
+        print(f"Erro MealDB mirror: {e}")
+        return [], {}
+    return list(meals.values()), similarities
+
+
+def _keep_best_rank(found: dict[str, tuple[tuple, dict]], meal_id: str, rank: tuple, meal: dict) -> None:
+    # Searches finish in any order; a meal keeps the rank the first search to list it sequentially would give
+    if meal_id not in found or rank < found[meal_id][0]:
+        found[meal_id] = (rank, meal)
+
+
+def _live_candidate_meals(name_queries: list[str], api_terms: list[str], deadline: Optional[Deadline] = None) -> list[dict]:
+    """
+    Runs the name and ingredient searches in parallel and starts lookup.php for filter hits as soon
+    as they arrive (search.php already returns full meals). Whatever has arrived when
+    MEALDB_SEARCH_BUDGET_SECONDS runs out is returned, in the same order the sequential search used.
+    """
+    started = time.perf_counter()
+    budget = deadline.cap(MEALDB_SEARCH_BUDGET_SECONDS) if deadline is not None else MEALDB_SEARCH_BUDGET_SECONDS
+    cutoff = started + budget
+    stage_timings: dict[str, dict] = {}
+    found: dict[str, tuple[tuple, dict]] = {}
+    lookup_ranks: dict[str, tuple] = {}
+    pending = {}
+
+    for index, query in enumerate(name_queries):
+        future = _mealdb_executor.submit(_safe_fetch_json, f"{MEALDB_BASE_URL}/search.php?s={quote_plus(query)}")
+        pending[future] = ("search", (0, index))
+    for index, term in enumerate(api_terms[:6]):
+        future = _mealdb_executor.submit(_safe_fetch_json, f"{MEALDB_BASE_URL}/filter.php?i={quote_plus(term)}")
+        pending[future] = ("filter", (1, index))
+
+    while pending:
+        remaining = cutoff - time.perf_counter()
+        if remaining <= 0:
+            break
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, rank = pending.pop(future)
+            timing = stage_timings.setdefault(stage, {"calls": 0, "last_ms": 0.0})
+            timing["calls"] += 1
+            timing["last_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            try:
+                result = future.result()
+            except Exception:
+                continue
+
+            if stage == "lookup":
+                if result:
+                    _keep_best_rank(found, str(result.get("idMeal", "")), rank, result)
+                continue
+
+            for position, meal in enumerate(result.get("meals") or []):
+                meal_id = str(meal.get("idMeal", "")).strip()
+                if not meal_id:
+                    continue
+                if stage == "search":
+                    _keep_best_rank(found, meal_id, rank + (position,), meal)
+                elif meal_id not in found and meal_id not in lookup_ranks and len(lookup_ranks) < MEALDB_MAX_LOOKUPS:
+                    lookup_ranks[meal_id] = rank + (position,)
+                    pending[_mealdb_executor.submit(_get_meal_details, meal_id)] = ("lookup", lookup_ranks[meal_id])
+
+    timed_out = bool(pending)
+    for future in pending:
+        future.cancel()
+
+    _fanout_stats["runs"] += 1
+    _fanout_stats["deadline_hits"] += int(timed_out)
+    _fanout_stats["last"] = {
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "timed_out": timed_out,
+        "unfinished": len(pending),
+        "stages": stage_timings,
+        "candidates": len(found),
+    }
+    if timed_out:
+        print(f"MealDB fan-out: orçamento de {budget:.1f}s esgotado, {len(pending)} pedidos por terminar")
+        if deadline is not None and budget < MEALDB_SEARCH_BUDGET_SECONDS:
+            deadline.skip("mealdb_search")
 
-        title = str(normalized.get("title") or payload["title"]).strip()
-        ingredients = normalized.get("ingredients") if isinstance(normalized.get("ingredients"), list) else payload["ingredients"]
-        steps = normalized.get("steps") if isinstance(normalized.get("steps"), list) else payload["steps"]
+    return [meal for _, meal in sorted(found.values(), key=lambda item: item[0])]
 
-        return {
-            **recipe,
-            "title": title or recipe.get("title", ""),
-            "ingredients": [str(item) for item in ingredients if str(item).strip()],
-            "steps": [str(item) for item in steps if str(item).strip()],
-        }
-    except Exception:
-        return recipe
+
+def get_mealdb_stats() -> dict:
+    return {
+        **_fanout_stats,
+        "http_cache": {**_http_stats, **(_http_cache.stats() if _http_cache is not None else {"backend": "off"})},
+        "mirror": mealdb_mirror.stats(),
+        "recipe_index": recipe_index.stats(),
+    }
 
 
-def _try_recipe_api_first(craving: str, target_calories: int, allergens: List[str], plan_goal: Optional[str]) -> Optional[schemas.NegotiatorResponse]:
+def _find_best_meal_recipe(craving: str, target_calories: int, allergens: List[str], plan_goal: Optional[str], deadline: Optional[Deadline] = None) -> Optional[dict]:
     requested_terms = _extract_query_terms(craving)
     if not requested_terms:
         return None
     api_terms = _expand_terms_for_api(requested_terms)
 
-    candidate_ids: dict[str, None] = {}
-
     name_queries = [craving.strip()]
     translated_query = " ".join([_to_en_term(t) for t in requested_terms]).strip()
     if translated_query and translated_query.lower() != craving.strip().lower():
         name_queries.append(translated_query)
 
-    for query in name_queries:
-        by_name = _safe_fetch_json(f"{MEALDB_BASE_URL}/search.php?s={quote_plus(query)}")
-        for meal in by_name.get("meals") or []:
-            meal_id = str(meal.get("idMeal", "")).strip()
-            if meal_id:
-                candidate_ids[meal_id] = None
-
-    for term in api_terms[:6]:
-        by_ingredient = _safe_fetch_json(f"{MEALDB_BASE_URL}/filter.php?i={quote_plus(term)}")
-        for meal in by_ingredient.get("meals") or []:
-            meal_id = str(meal.get("idMeal", "")).strip()
-            if meal_id:
-                candidate_ids[meal_id] = None
-
-    if not candidate_ids:
+    # Local mirror/index first (no network); live MealDB only when they are missing or have nothing
+    candidate_meals, similarities = _local_candidate_meals(name_queries, api_terms)
+    if not candidate_meals:
+        candidate_meals = _live_candidate_meals(name_queries, api_terms, deadline)
+    if not candidate_meals:
         return None
 
-    scored_meals: list[tuple[int, dict]] = []
-
-    for meal_id in list(candidate_ids.keys())[:14]:
-        meal = _get_meal_details(meal_id)
-        if not meal:
-            continue
-        ingredients = _extract_meal_ingredients(meal)
-        if _contains_allergen(ingredients, allergens):
-            continue
-        semantic_score = _score_meal_for_query(meal, requested_terms)
-        if semantic_score > 0:
-            scored_meals.append((semantic_score, meal))
-
+    scored_meals = score_meals(candidate_meals, requested_terms, allergens, query=craving, boosts=similarities)
     if not scored_meals:
         return None
 
-    scored_meals.sort(key=lambda x: x[0], reverse=True)
-
     best_raw_recipe = None
     best_total_score = -10_000
-    for semantic_score, meal in scored_meals[:6]:
-        raw_recipe = _build_negotiator_recipe_from_meal(meal, target_calories)
+    for semantic_score, _, prepared in scored_meals[:6]:
+        raw_recipe = _build_negotiator_recipe_from_meal(prepared.meal, target_calories, prepared.ingredients)
         if not raw_recipe:
             continue
         calories = int(raw_recipe.get("calories", 0) or 0)
@@ -326,14 +546,41 @@ def _try_recipe_api_first(craving: str, target_calories: int, allergens: List[st
             best_total_score = total_score
             best_raw_recipe = raw_recipe
 
+    return best_raw_recipe
+
+
+def _emit_stage(on_stage: Optional[StageCallback], stage: str, **info) -> None:
+    if on_stage:
+        on_stage("stage", {"stage": stage, **info})
+
+
+async def _try_recipe_api_first(
+    craving: str,
+    target_calories: int,
+    allergens: List[str],
+    plan_goal: Optional[str],
+    on_stage: Optional[StageCallback] = None,
+    deadline: Optional[Deadline] = None
+) -> Optional[schemas.NegotiatorResponse]:
+    # MealDB lookups use blocking urlopen, so keep them off the event loop
+    best_raw_recipe = await asyncio.to_thread(_find_best_meal_recipe, craving, target_calories, allergens, plan_goal, deadline)
     if not best_raw_recipe:
+        _emit_stage(on_stage, "mealdb_no_match")
         return None
-
-    best_raw_recipe = _translate_recipe_to_pt(best_raw_recipe)
-    best_raw_recipe = _normalize_recipe_portion_one_person(best_raw_recipe)
-    real_calories = food_data.calculate_recipe_calories(best_raw_recipe.get("ingredients", []))
+    _emit_stage(on_stage, "mealdb_match", title=best_raw_recipe.get("title", ""))
+
+    meal_id = best_raw_recipe.pop("meal_id", None)
+    best_raw_recipe = await _translate_and_portion_recipe(best_raw_recipe, meal_id, deadline)
+    # Structured quantities only exist when the fused call (or its cache) produced a translation
+    if best_raw_recipe.get("ingredient_quantities"):
+        _emit_stage(on_stage, "translated", title=best_raw_recipe.get("title", ""))
+        _emit_stage(on_stage, "portion_normalized")
+    else:
+        _emit_stage(on_stage, "translation_skipped")
+    real_calories = await asyncio.to_thread(food_data.calculate_recipe_calories, best_raw_recipe.get("ingredients", []), deadline)
     if real_calories > 0:
         best_raw_recipe["calories"] = real_calories
+    _emit_stage(on_stage, "calories_computed", calories=best_raw_recipe.get("calories", 0))
 
     return schemas.NegotiatorResponse(
         original_craving=craving,
@@ -342,7 +589,7 @@ def _try_recipe_api_first(craving: str, target_calories: int, allergens: List[st
         restaurant_search_term=craving
     )
 
-def analyze_mood(craving: str, mood: str) -> schemas.MoodAnalysisResponse:
+async def analyze_mood(craving: str, mood: str) -> schemas.MoodAnalysisResponse:
     prompt = (
         f"User craving: '{craving}', Mood: '{mood}'. "
         "Atua como um assistente de decisão alimentar inteligente e empático (PT-PT). "
@@ -350,30 +597,27 @@ def analyze_mood(craving: str, mood: str) -> schemas.MoodAnalysisResponse:
         "Retorna JSON: { 'mood_type': '...', 'empathy_message': '...', 'explanation': '...', 'eating_strategy': '...' }"
     )
     try:
-        response = get_chat_completion(
+        response = await get_chat_completion_async(
             messages=[{"role": "system", "content": "És um assistente sofisticado. Responde em PT-PT. Retorna APENAS JSON."},
                       {"role": "user", "content": prompt}],
             temperature=0.7,
             response_format={"type": "json_object"},
-            max_tokens=300
+            max_tokens=300,
+            profile="chat"
         )
         return schemas.MoodAnalysisResponse(**json.loads(response.choices[0].message.content))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def negotiate_craving(
+def _build_recipe_prompt(
     craving: str,
-    target_calories: int = 600,
-    mood: Optional[str] = None,
-    favorite_recipes: List[schemas.Recipe] = [],
-    allergens: List[str] = [],
-    plan_goal: Optional[str] = None,
-    daily_target_calories: Optional[int] = None
-) -> schemas.NegotiatorResponse:
-    api_recipe_response = _try_recipe_api_first(craving, target_calories, allergens, plan_goal)
-    if api_recipe_response:
-        return api_recipe_response
-
+    target_calories: int,
+    mood: Optional[str],
+    favorite_recipes: List[schemas.Recipe],
+    allergens: List[str],
+    plan_goal: Optional[str],
+    daily_target_calories: Optional[int]
+) -> str:
     cuisine_focus = random.choice(["mediterrânica", "asiática leve", "mexicana equilibrada", "portuguesa moderna", "levantina"])
     technique_focus = random.choice(["forno", "grelhar", "saltear rápido", "estufar leve", "air fryer"])
     format_focus = random.choice(["bowl", "wrap", "prato no prato", "salada morna", "tosta aberta"])
@@ -432,69 +676,92 @@ def negotiate_craving(
         "\nRetorna JSON:\n"
         "{ 'message': 'Texto conversacional aqui', 'recipe': { 'title': '...', 'calories': 0, 'time_minutes': 30, 'ingredients': ['...'], 'steps': [] } ou null, 'restaurant_search_term': '...' }"
     )
-
-    strict_json_rules = (
-        "\nREGRAS JSON ESTRITAS: "
-        "Retorna APENAS JSON válido, sem markdown e sem texto fora do objeto. "
-        "Em 'ingredients' e 'steps', cada item deve ser APENAS uma string simples. "
-        "NÃO uses quinoa/qinoa."
+    return prompt
+
+
+def _recipe_messages(prompt: str, strict_mode: bool = False) -> list[dict]:
+    return [
+        {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt + (STRICT_JSON_RULES if strict_mode else "")}
+    ]
+
+
+async def _request_recipe_response(prompt: str, temp: float, presence: float, frequency: float, strict_mode: bool = False, deadline: Optional[Deadline] = None) -> dict:
+    # Note: presence and frequency penalties are not currently supported by get_chat_completion helper, 
+    # but we prioritize resilience over these specific penalties for now.
+    response = await get_chat_completion_async(
+        messages=_recipe_messages(prompt, strict_mode),
+        temperature=temp,
+        response_format={"type": "json_object"},
+        max_tokens=1000,
+        profile="creative-recipe",
+        deadline=deadline
     )
+    return _parse_recipe_json(response.choices[0].message.content)
 
-    def request_recipe_response(temp: float, presence: float, frequency: float, strict_mode: bool = False):
-        system_content = (
-            "És um Chef Michelin e Nutricionista PT-PT que adora variedade alta, pouca repetição e quantidades realistas por ingrediente. Quinoa/qinoa é proibida."
-        )
-        user_content = prompt + (strict_json_rules if strict_mode else "")
-        # Note: presence and frequency penalties are not currently supported by get_chat_completion helper, 
-        # but we prioritize resilience over these specific penalties for now.
-        response = get_chat_completion(
-            messages=[
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=temp,
-            response_format={"type": "json_object"},
-            max_tokens=1000
-        )
-        return json.loads(response.choices[0].message.content)
 
+def _parse_recipe_json(content: Optional[str]) -> dict:
+    data = llm_json.parse_object(content, "negotiator")
+    if data is None:
+        # Same wording as the provider error so _generate_recipe_data falls back to the strict retry
+        raise ValueError("failed to generate json: resposta do modelo não é JSON reparável")
+    return data
+
+
+def _raise_if_deadline_exceeded(error: Exception, deadline: Optional[Deadline]) -> None:
+    if isinstance(error, DeadlineExceeded) or (deadline is not None and deadline.expired()):
+        print(f"Erro Negotiator (tempo limite): {error}")
+        raise HTTPException(status_code=504, detail="A receita demorou demasiado a ser gerada. Tenta novamente.")
+
+
+async def _generate_recipe_data(prompt: str, deadline: Optional[Deadline] = None) -> dict:
     try:
-        data = request_recipe_response(temp=1.08, presence=0.9, frequency=0.8, strict_mode=False)
+        return await _request_recipe_response(prompt, temp=1.08, presence=0.9, frequency=0.8, strict_mode=False, deadline=deadline)
     except Exception as first_error:
+        _raise_if_deadline_exceeded(first_error, deadline)
+        # Groq's json_validate_failed carries the rejected output; repairing it saves a full regeneration
+        repaired = llm_json.parse_failed_generation(first_error, "negotiator")
+        if repaired is not None:
+            return repaired
         error_text = str(first_error).lower()
         should_retry = "json_validate_failed" in error_text or "failed to generate json" in error_text
         if not should_retry:
             print(f"Erro Negotiator: {first_error}")
             raise HTTPException(status_code=500, detail="Erro ao processar receita personalizada.")
-        try:
-            data = request_recipe_response(temp=0.65, presence=0.35, frequency=0.35, strict_mode=True)
-        except Exception as retry_error:
-            print(f"Erro Negotiator (retry): {retry_error}")
-            raise HTTPException(status_code=500, detail="Erro ao processar receita personalizada.")
+        return await _retry_recipe_strict(prompt, deadline)
+
+
+async def _retry_recipe_strict(prompt: str, deadline: Optional[Deadline] = None) -> dict:
+    llm_json.record_retry("negotiator")
+    try:
+        return await _request_recipe_response(prompt, temp=0.65, presence=0.35, frequency=0.35, strict_mode=True, deadline=deadline)
+    except Exception as retry_error:
+        _raise_if_deadline_exceeded(retry_error, deadline)
+        print(f"Erro Negotiator (retry): {retry_error}")
+        raise HTTPException(status_code=500, detail="Erro ao processar receita personalizada.")
+
+
+async def _finalize_generated_recipe(craving: str, data: dict, on_stage: Optional[StageCallback] = None, deadline: Optional[Deadline] = None) -> schemas.NegotiatorResponse:
     try:
         
         # Calcular calorias reais via "food_data" (que usa a IA como DB)
         raw_recipe = data.get('recipe')
+        if isinstance(raw_recipe, dict) and raw_recipe:
+            # Steps/ingredients given as objects and numbers given as "450 kcal" are flattened here
+            raw_recipe = llm_json.coerce_recipe(raw_recipe)
+        else:
+            raw_recipe = None
         if raw_recipe:
-            # FIX: Ensure steps are always strings
-            if 'steps' in raw_recipe and isinstance(raw_recipe['steps'], list):
-                sanitized_steps = []
-                for step in raw_recipe['steps']:
-                    if isinstance(step, dict):
-                        # Convert dict to string (e.g. {'acao': '...', 'tempo': 1} -> '...')
-                        sanitized_steps.append(step.get('acao', str(step)))
-                    else:
-                        sanitized_steps.append(str(step))
-                raw_recipe['steps'] = sanitized_steps
-
-            raw_recipe = _normalize_recipe_portion_one_person(raw_recipe)
-            real_calories = food_data.calculate_recipe_calories(raw_recipe.get('ingredients', []))
+
+            # The generation prompt already asks for 1 portion, so no separate normalization pass here
+            real_calories = await asyncio.to_thread(food_data.calculate_recipe_calories, raw_recipe.get('ingredients', []), deadline)
             if real_calories > 0:
                 raw_recipe['calories'] = real_calories
+            _emit_stage(on_stage, "calories_computed", calories=raw_recipe.get('calories', 0))
 
         return schemas.NegotiatorResponse(
             original_craving=craving,
-            message=data.get('message', ''),
+            message=str(data.get('message') or ''),
             recipe=schemas.NegotiatorRecipe(**raw_recipe) if raw_recipe else None,
             restaurant_search_term=data.get('restaurant_search_term') or craving
         )
@@ -502,7 +769,334 @@ def negotiate_craving(
         print(f"Erro Negotiator: {e}")
         raise HTTPException(status_code=500, detail="Erro ao processar receita personalizada.")
 
-def analyze_nutrition(food_text: str) -> schemas.NutritionAnalysisResponse:
+async def _generate_recipe_response(
+    craving: str,
+    target_calories: int,
+    mood: Optional[str],
+    favorite_recipes: List[schemas.Recipe],
+    allergens: List[str],
+    plan_goal: Optional[str],
+    daily_target_calories: Optional[int],
+    deadline: Optional[Deadline] = None
+) -> schemas.NegotiatorResponse:
+    prompt = _build_recipe_prompt(craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories)
+    data = await _generate_recipe_data(prompt, deadline)
+    return await _finalize_generated_recipe(craving, data, deadline=deadline)
+
+
+def _retrieve_task_exception(task: asyncio.Task) -> None:
+    # The losing branch may fail after we stopped listening; mark its exception as seen
+    if not task.cancelled():
+        task.exception()
+
+
+async def _negotiate_speculative(
+    craving: str,
+    target_calories: int,
+    mood: Optional[str],
+    favorite_recipes: List[schemas.Recipe],
+    allergens: List[str],
+    plan_goal: Optional[str],
+    daily_target_calories: Optional[int],
+    deadline: Deadline
+) -> schemas.NegotiatorResponse:
+    """
+    Starts the MealDB path and LLM generation together. The MealDB recipe wins if it is found
+    within NEGOTIATOR_MEALDB_WINDOW_SECONDS; otherwise the generated one is used. The loser is cancelled.
+    """
+    started = time.perf_counter()
+    # Each branch degrades against its own copy so only the winner's skipped stages are reported
+    api_deadline, generation_deadline = deadline.child(), deadline.child()
+    api_task = asyncio.ensure_future(_try_recipe_api_first(craving, target_calories, allergens, plan_goal, deadline=api_deadline))
+    generation_task = asyncio.ensure_future(_generate_recipe_response(
+        craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories, generation_deadline
+    ))
+    api_task.add_done_callback(_retrieve_task_exception)
+    generation_task.add_done_callback(_retrieve_task_exception)
+    winner = None
+    try:
+        try:
+            api_response = await asyncio.wait_for(asyncio.shield(api_task), timeout=NEGOTIATOR_MEALDB_WINDOW_SECONDS)
+        except asyncio.TimeoutError:
+            _speculation_stats["mealdb_timeouts"] += 1
+            api_response = None
+        except Exception as e:
+            print(f"Erro Negotiator (MealDB): {e}")
+            api_response = None
+
+        if api_response:
+            winner, response, branch_deadline = "mealdb", api_response, api_deadline
+        else:
+            response = await generation_task
+            winner, branch_deadline = "generated", generation_deadline
+        for stage in branch_deadline.skipped:
+            deadline.skip(stage)
+        return response
+    finally:
+        for task, name in ((api_task, "mealdb"), (generation_task, "generated")):
+            if not task.done():
+                task.cancel()
+                _speculation_stats[f"cancelled_{name}"] += 1
+        _speculation_stats["runs"] += 1
+        if winner:
+            _speculation_stats[f"{winner}_wins"] += 1
+        _speculation_stats["last_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def result_cache_parts(
+    craving: str, target_calories: int, plan_goal: Optional[str], allergens: List[str], daily_target_calories: Optional[int] = None
+) -> tuple[str, int, str, str, int]:
+    craving_key = " ".join(re.findall(r"[a-z0-9]+", normalize_text(craving)))
+    bucket = int(round(target_calories / NEGOTIATOR_CACHE_CALORIE_BUCKET)) * NEGOTIATOR_CACHE_CALORIE_BUCKET
+    allergen_key = ",".join(sorted({normalize_text(item) for item in allergens if item}))
+    daily_bucket = int(round((daily_target_calories or 0) / NEGOTIATOR_CACHE_DAILY_BUCKET)) * NEGOTIATOR_CACHE_DAILY_BUCKET
+    return craving_key, bucket, normalize_text(plan_goal or "maintain"), allergen_key, daily_bucket
+
+
+def _result_cache_key(
+    craving: str, target_calories: int, plan_goal: Optional[str], allergens: List[str], daily_target_calories: Optional[int] = None
+) -> str:
+    return "|".join(str(part) for part in result_cache_parts(craving, target_calories, plan_goal, allergens, daily_target_calories))
+
+
+def _poolable_key(
+    craving: str, target_calories: int, mood: Optional[str], favorite_recipes: List[schemas.Recipe],
+    allergens: List[str], plan_goal: Optional[str], daily_target_calories: Optional[int]
+) -> Optional[str]:
+    # Mood and favourites shape the generated recipe for one user only, so those responses are never shared
+    if (mood and mood.strip()) or favorite_recipes:
+        _result_cache_stats["personalised_bypass"] += 1
+        return None
+    return _result_cache_key(craving, target_calories, plan_goal, allergens, daily_target_calories)
+
+
+def _variant_title(variant: dict) -> str:
+    return normalize_text((variant.get("recipe") or {}).get("title") or "")
+
+
+def _cached_negotiation(key: Optional[str], craving: str) -> Optional[schemas.NegotiatorResponse]:
+    """
+    Serves a pooled response only once the pool holds NEGOTIATOR_CACHE_VARIANTS distinct recipes;
+    until then every request generates a new one so users keep seeing variety.
+    """
+    pool = _result_cache.get(key) if _result_cache is not None and key else None
+    if not pool or len(pool["variants"]) < NEGOTIATOR_CACHE_VARIANTS:
+        _result_cache_stats["pool_misses"] += 1
+        return None
+    _result_cache_stats["pool_hits"] += 1
+    if NEGOTIATOR_CACHE_ROTATION == "random":
+        variant = random.choice(pool["variants"])
+    else:
+        variant = pool["variants"][pool["cursor"] % len(pool["variants"])]
+        remaining = pool["expires_at"] - time.time()
+        if remaining > 0:
+            _result_cache.set(key, {**pool, "cursor": pool["cursor"] + 1}, ttl=remaining)
+    return schemas.NegotiatorResponse(**{**variant, "original_craving": craving})
+
+
+def _remember_negotiation(key: Optional[str], response: schemas.NegotiatorResponse) -> None:
+    # Refusals, failures and deadline-degraded responses are not pooled, only complete recipes
+    if _result_cache is None or not key or response.recipe is None or response.skipped_stages:
+        return
+    pool = _result_cache.get(key) or {"variants": [], "cursor": 0, "expires_at": time.time() + NEGOTIATOR_CACHE_TTL_SECONDS}
+    if len(pool["variants"]) >= NEGOTIATOR_CACHE_VARIANTS:
+        return
+    # The MealDB path returns the same recipe every time; a repeat is not a new variant
+    if normalize_text(response.recipe.title) in {_variant_title(variant) for variant in pool["variants"]}:
+        _result_cache_stats["duplicates_skipped"] += 1
+        return
+    remaining = pool["expires_at"] - time.time()
+    if remaining <= 0:
+        return
+    _result_cache.set(key, {**pool, "variants": pool["variants"] + [response.model_dump()]}, ttl=remaining)
+    _result_cache_stats["variants_stored"] += 1
+
+
+def result_pool_shared() -> bool:
+    """
+    True when the result pool lives in a file every worker reads (sqlite or tiered backend).
+    """
+    return isinstance(_result_cache, (SQLiteCache, TieredCache))
+
+
+def cached_variant_count(
+    craving: str, target_calories: int, plan_goal: Optional[str], allergens: List[str], daily_target_calories: Optional[int] = None
+) -> int:
+    if _result_cache is None:
+        return 0
+    pool = _result_cache.get(_result_cache_key(craving, target_calories, plan_goal, allergens, daily_target_calories))
+    return len(pool["variants"]) if pool else 0
+
+
+async def _negotiate_uncached(
+    craving: str,
+    target_calories: int,
+    mood: Optional[str],
+    favorite_recipes: List[schemas.Recipe],
+    allergens: List[str],
+    plan_goal: Optional[str],
+    daily_target_calories: Optional[int],
+    deadline: Deadline
+) -> schemas.NegotiatorResponse:
+    if NEGOTIATOR_SPECULATIVE:
+        return await _negotiate_speculative(
+            craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories, deadline
+        )
+
+    api_recipe_response = await _try_recipe_api_first(craving, target_calories, allergens, plan_goal, deadline=deadline)
+    if api_recipe_response:
+        return api_recipe_response
+
+    return await _generate_recipe_response(
+        craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories, deadline
+    )
+
+
+def _with_skipped_stages(response: schemas.NegotiatorResponse, deadline: Deadline) -> schemas.NegotiatorResponse:
+    if not deadline.skipped:
+        return response
+    return response.model_copy(update={"skipped_stages": list(deadline.skipped)})
+
+
+async def negotiate_craving(
+    craving: str,
+    target_calories: int = 600,
+    mood: Optional[str] = None,
+    favorite_recipes: List[schemas.Recipe] = [],
+    allergens: List[str] = [],
+    plan_goal: Optional[str] = None,
+    daily_target_calories: Optional[int] = None,
+    deadline: Optional[Deadline] = None
+) -> schemas.NegotiatorResponse:
+    cache_key = _poolable_key(craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories)
+    cached = _cached_negotiation(cache_key, craving)
+    if cached:
+        return cached
+
+    deadline = deadline or Deadline(NEGOTIATOR_SLA_SECONDS)
+    response = await _negotiate_uncached(
+        craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories, deadline
+    )
+    response = _with_skipped_stages(response, deadline)
+    _remember_negotiation(cache_key, response)
+    return response
+
+
+def get_negotiator_stats() -> dict:
+    return {
+        "speculation": {"enabled": NEGOTIATOR_SPECULATIVE, "mealdb_window_seconds": NEGOTIATOR_MEALDB_WINDOW_SECONDS, **_speculation_stats},
+        "result_cache": {**_result_cache_stats, **(_result_cache.stats() if _result_cache is not None else {"backend": "off"})},
+    }
+
+
+async def negotiate_craving_events(
+    craving: str,
+    target_calories: int = 600,
+    mood: Optional[str] = None,
+    favorite_recipes: List[schemas.Recipe] = [],
+    allergens: List[str] = [],
+    plan_goal: Optional[str] = None,
+    daily_target_calories: Optional[int] = None
+) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Streaming variant of negotiate_craving. Yields ("stage", {...}) progress events,
+    ("token", {"text": ...}) chunks of the generated 'message' as they arrive and
+    finally ("result", NegotiatorResponse dict).
+    """
+    cache_key = _poolable_key(craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories)
+    cached = _cached_negotiation(cache_key, craving)
+    if cached:
+        yield "stage", {"stage": "cache_hit"}
+        yield "result", cached.model_dump()
+        return
+
+    deadline = Deadline(NEGOTIATOR_SLA_SECONDS)
+    yield "stage", {"stage": "searching_mealdb"}
+    api_recipe_response = None
+    async for event, data in run_with_events(
+        lambda emit: _try_recipe_api_first(craving, target_calories, allergens, plan_goal, on_stage=emit, deadline=deadline)
+    ):
+        if event == "result":
+            api_recipe_response = data
+        else:
+            yield event, data
+    if api_recipe_response:
+        api_recipe_response = _with_skipped_stages(api_recipe_response, deadline)
+        _remember_negotiation(cache_key, api_recipe_response)
+        yield "result", api_recipe_response.model_dump()
+        return
+
+    yield "stage", {"stage": "generating"}
+    prompt = _build_recipe_prompt(craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories)
+    message_field = PartialJsonField("message")
+    content = ""
+    try:
+        async for delta in stream_chat_completion_async(
+            messages=_recipe_messages(prompt),
+            temperature=1.08,
+            response_format={"type": "json_object"},
+            max_tokens=1000,
+            profile="creative-recipe",
+            deadline=deadline
+        ):
+            content += delta
+            text = message_field.feed(delta)
+            if text:
+                yield "token", {"text": text}
+        data = _parse_recipe_json(content)
+    except Exception as stream_error:
+        # Past the SLA there is no time for a strict retry: same 504 as the non-streaming path
+        _raise_if_deadline_exceeded(stream_error, deadline)
+        data = llm_json.parse_failed_generation(stream_error, "negotiator")
+        if data is None:
+            print(f"Erro Negotiator (stream): {stream_error}")
+            yield "stage", {"stage": "retrying"}
+            data = await _retry_recipe_strict(prompt, deadline)
+
+    yield "stage", {"stage": "generated"}
+    async for event, payload in run_with_events(lambda emit: _finalize_generated_recipe(craving, data, on_stage=emit, deadline=deadline)):
+        if event == "result":
+            payload = _with_skipped_stages(payload, deadline)
+            _remember_negotiation(cache_key, payload)
+            payload = payload.model_dump()
+        yield event, payload
+
+
+def _nutrition_response(food_text: str, entry: dict) -> schemas.NutritionAnalysisResponse:
+    if not entry["is_food"]:
+        raise HTTPException(status_code=400, detail=entry["error_message"] or "O item indicado não é um alimento válido.")
+    return schemas.NutritionAnalysisResponse(food_text=food_text, is_food=True, **entry["nutrition"])
+
+
+def _nutrition_entry(data: dict, food_text: str) -> dict:
+    # What is cached per food text: either the coerced macros or the reason it is not a food
+    if not data.get("is_food", True):
+        return {"is_food": False, "error_message": data.get("error_message"), "nutrition": None}
+    return {"is_food": True, "error_message": None, "nutrition": llm_json.coerce_nutrition(data, food_text)}
+
+
+def _nutrition_key(food_text: str) -> str:
+    return " ".join(normalize_text(food_text).split())
+
+
+def _cached_nutrition(food_text: str) -> Optional[dict]:
+    if _nutrition_cache is None:
+        return None
+    entry = _nutrition_cache.get(_nutrition_key(food_text))
+    _nutrition_stats["cache_hits" if entry is not None else "cache_misses"] += 1
+    return entry
+
+
+def _store_nutrition(food_text: str, entry: dict) -> None:
+    if _nutrition_cache is not None:
+        _nutrition_cache.set(_nutrition_key(food_text), entry)
+
+
+async def analyze_nutrition(food_text: str) -> schemas.NutritionAnalysisResponse:
+    cached = _cached_nutrition(food_text)
+    if cached is not None:
+        return _nutrition_response(food_text, cached)
+
     prompt = (
         f"Analisa a informação nutricional para: '{food_text}'. "
         "Estima as calorias e macronutrientes totais para a quantidade indicada. "
@@ -522,30 +1116,146 @@ def analyze_nutrition(food_text: str) -> schemas.NutritionAnalysisResponse:
     )
 
     try:
-        response = get_chat_completion(
+        response = await get_chat_completion_async(
             messages=[
                 {"role": "system", "content": "You are a nutritional expert API. Output valid JSON only."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            profile="extract-json"
         )
         content = response.choices[0].message.content
-        data = json.loads(content)
-        
-        if not data.get("is_food", True):
-            raise HTTPException(status_code=400, detail=data.get("error_message", "O item indicado não é um alimento válido."))
-        
-        return schemas.NutritionAnalysisResponse(
-            food_text=food_text,
-            is_food=True,
-            name=data.get("name", food_text),
-            calories=data.get("calories", 0),
-            protein=data.get("protein", 0),
-            carbs=data.get("carbs", 0),
-            fat=data.get("fat", 0),
-            estimated_grams=data.get("estimated_grams", 0)
-        )
+        data = llm_json.parse_object(content, "nutrition")
+        if data is None:
+            raise ValueError("resposta do modelo não é JSON reparável")
+
+        entry = _nutrition_entry(data, food_text)
+        _store_nutrition(food_text, entry)
+        return _nutrition_response(food_text, entry)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro na análise nutricional: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao analisar nutrição: {str(e)}")
+
+
+async def _analyze_nutrition_chunk(food_texts: list[str]) -> dict[str, dict]:
+    """
+    One LLM call for several food texts. Returns the entries the model answered, keyed by text;
+    texts it skipped are simply missing.
+    """
+    numbered = "\n".join(f"{index}. {text}" for index, text in enumerate(food_texts, start=1))
+    prompt = (
+        "Analisa a informação nutricional de cada item desta lista (um alimento ou prato por linha):\n"
+        f"{numbered}\n"
+        "Para cada item estima as calorias e macronutrientes totais para a quantidade indicada. "
+        "Se a quantidade não for explícita, assume uma porção padrão média (ex: 1 banana = 120g). "
+        "VALIDAÇÃO: Se um item NÃO for um alimento ou for algo impossível de comer (ex: pedras, objetos), define 'is_food' como false e fornece uma 'error_message' explicativa em PT-PT. "
+        "Responde APENAS com um objeto JSON com este formato (sem markdown), com um elemento por item e o mesmo 'index': "
+        "{ 'items': [ { "
+        "  'index': 1, "
+        "  'is_food': true, "
+        "  'error_message': null, "
+        "  'name': 'Nome curto e claro do alimento (PT-PT)', "
+        "  'calories': 0, "
+        "  'protein': 0.0, "
+        "  'carbs': 0.0, "
+        "  'fat': 0.0, "
+        "  'estimated_grams': 100 "
+        "} ] }"
+    )
+    response = await get_chat_completion_async(
+        messages=[
+            {"role": "system", "content": "You are a nutritional expert API. Output valid JSON only."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        response_format={"type": "json_object"},
+        max_tokens=NUTRITION_BATCH_TOKENS_PER_ITEM * len(food_texts) + 100,
+        profile="extract-json"
+    )
+    data = llm_json.parse_object(response.choices[0].message.content, "nutrition_batch")
+    if data is None:
+        raise ValueError("resposta do modelo não é JSON reparável")
+
+    entries: dict[str, dict] = {}
+    for item in data.get("items") or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("index"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= index <= len(food_texts) and food_texts[index - 1] not in entries:
+            food_text = food_texts[index - 1]
+            entries[food_text] = _nutrition_entry(item, food_text)
+    return entries
+
+
+def _batch_item(food_text: str, entry: Optional[dict], error: Optional[str] = None) -> schemas.NutritionBatchItem:
+    if entry is None:
+        return schemas.NutritionBatchItem(food_text=food_text, error=error or "Não foi possível analisar este item.")
+    if not entry["is_food"]:
+        return schemas.NutritionBatchItem(
+            food_text=food_text, error=entry["error_message"] or "O item indicado não é um alimento válido."
+        )
+    return schemas.NutritionBatchItem(
+        food_text=food_text,
+        result=schemas.NutritionAnalysisResponse(food_text=food_text, is_food=True, **entry["nutrition"]),
+    )
+
+
+async def analyze_nutrition_batch(food_texts: list[str]) -> schemas.NutritionBatchResponse:
+    """
+    Nutrition for several free-text items in one request. Repeated items are analysed once, cached
+    items skip the model, and the rest are packed NUTRITION_BATCH_CHUNK_SIZE per prompt with the
+    chunks running concurrently. Every item gets its own result or error.
+    """
+    _nutrition_stats["batches"] += 1
+    # Spelling variants of one food ("Banana", " banana ") are analysed once, as the first one seen
+    unique: dict[str, str] = {}
+    for text in food_texts:
+        if text.strip():
+            unique.setdefault(_nutrition_key(text), text.strip())
+
+    entries: dict[str, dict] = {}
+    errors: dict[str, str] = {}
+    misses: list[str] = []
+    for key, food_text in unique.items():
+        cached = _cached_nutrition(food_text)
+        if cached is not None:
+            entries[key] = cached
+        else:
+            misses.append(food_text)
+
+    chunks = [misses[i:i + NUTRITION_BATCH_CHUNK_SIZE] for i in range(0, len(misses), NUTRITION_BATCH_CHUNK_SIZE)]
+    results = await asyncio.gather(*(_analyze_nutrition_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    _nutrition_stats["llm_calls"] += len(chunks)
+    for chunk, result in zip(chunks, results):
+        for food_text in chunk:
+            key = _nutrition_key(food_text)
+            if isinstance(result, BaseException):
+                errors[key] = f"Erro ao analisar nutrição: {result}"
+            elif food_text in result:
+                entries[key] = result[food_text]
+                _store_nutrition(food_text, result[food_text])
+            else:
+                _nutrition_stats["unanswered"] += 1
+                errors[key] = "O modelo não devolveu resultado para este item."
+        if isinstance(result, BaseException):
+            print(f"Erro na análise nutricional em lote: {result}")
+
+    items = []
+    for text in food_texts:
+        key = _nutrition_key(text)
+        error = errors.get(key) if text.strip() else "Item vazio."
+        items.append(_batch_item(text, entries.get(key), error))
+    return schemas.NutritionBatchResponse(items=items)
+
+
+def get_nutrition_stats() -> dict:
+    return {
+        **_nutrition_stats,
+        "cache": _nutrition_cache.stats() if _nutrition_cache is not None else {"backend": "off"},
+    }
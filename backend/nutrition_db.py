@@ -0,0 +1,269 @@
+import os
+import csv
+import gzip
+import io
+import json
+import sqlite3
+import sys
+import time
+from typing import Iterator, Optional
+from cache_store import CACHE_DIR
+from meal_matcher import normalize_text
+from sqlite_fts import LocalSearchDB, fts_match, like_clauses, search_tokens
+
+NUTRITION_DB_PATH = os.getenv("NUTRITION_DB_PATH", os.path.join(CACHE_DIR, "nutrition.sqlite3"))
+PT_GENERIC_FOODS_PATH = os.getenv(
+    "PT_GENERIC_FOODS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pt_generic_foods.csv")
+)
+# Rows are written in batches so the multi-GB dump never sits in memory
+NUTRITION_IMPORT_BATCH = int(os.getenv("NUTRITION_IMPORT_BATCH", "5000"))
+NUTRITION_DB_CANDIDATES = int(os.getenv("NUTRITION_DB_CANDIDATES", "200"))
+
+GENERIC_SOURCE = "generico_pt"
+OFF_SOURCE = "openfoodfacts"
+
+_db = LocalSearchDB(NUTRITION_DB_PATH)
+
+
+def _safe_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS foods ("
+        "id INTEGER PRIMARY KEY, code TEXT, name TEXT NOT NULL, name_norm TEXT NOT NULL, brands TEXT NOT NULL DEFAULT '', "
+        "calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL, "
+        "source TEXT NOT NULL, popularity INTEGER NOT NULL DEFAULT 0, imported_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_foods_source ON foods(source)")
+    _db.create_fts(conn, "foods_fts", "name, brands")
+    conn.commit()
+
+
+def is_available() -> bool:
+    return _db.has_rows("foods", _ensure_schema)
+
+
+def _row_to_food(row) -> dict:
+    name, brands, calories, protein, carbs, fat, source = row
+    return {
+        "name": f"{name} ({brands})" if brands else name,
+        "calories_per_100g": calories,
+        "protein_per_100g": protein,
+        "carbs_per_100g": carbs,
+        "fat_per_100g": fat,
+        "source": source,
+    }
+
+
+def search(query: str, limit: int = 10) -> list[dict]:
+    """
+    Local equivalent of the OFF search: foods whose name (or brand) contains every word of the query,
+    Portuguese generics first, then by FTS rank and OFF scan count. Same dict shape as food_data.search_foods.
+    """
+    tokens = search_tokens(query)
+    if not tokens or not is_available():
+        return []
+    conn = _db.connect()
+    columns = "f.name, f.brands, f.calories, f.protein, f.carbs, f.fat, f.source"
+    if _db.fts_enabled:
+        # Re-ordering is done over the best FTS candidates only; a common word can match millions of products
+        rows = conn.execute(
+            f"SELECT {columns} FROM ("
+            "SELECT rowid, rank FROM foods_fts WHERE foods_fts MATCH ? ORDER BY rank LIMIT ?"
+            ") hits JOIN foods f ON f.id = hits.rowid ORDER BY f.source = ? DESC, hits.rank, f.popularity DESC LIMIT ?",
+            (fts_match(tokens), NUTRITION_DB_CANDIDATES, GENERIC_SOURCE, limit),
+        ).fetchall()
+    else:
+        clauses, params = like_clauses("f.name_norm", tokens)
+        rows = conn.execute(
+            f"SELECT {columns} FROM foods f WHERE {clauses} ORDER BY f.source = ? DESC, f.popularity DESC LIMIT ?",
+            (*params, GENERIC_SOURCE, limit),
+        ).fetchall()
+    return [_row_to_food(row) for row in rows]
+
+
+def popular_foods(limit: int) -> list[dict]:
+    """
+    Every Portuguese generic plus the `limit` most scanned OFF products, for in-memory indexes.
+    Without an imported DB the generics are read straight from the bundled CSV.
+    """
+    if not is_available():
+        try:
+            records = _read_generic_foods(PT_GENERIC_FOODS_PATH)
+        except OSError:
+            return []
+        return [
+            _row_to_food((name, brands, calories, protein, carbs, fat, GENERIC_SOURCE))
+            for _, name, brands, calories, protein, carbs, fat, _ in records
+        ]
+    rows = _db.connect().execute(
+        "SELECT name, brands, calories, protein, carbs, fat, source FROM foods WHERE source = ? "
+        "UNION ALL SELECT * FROM (SELECT name, brands, calories, protein, carbs, fat, source FROM foods "
+        "WHERE source != ? ORDER BY popularity DESC LIMIT ?)",
+        (GENERIC_SOURCE, GENERIC_SOURCE, limit),
+    ).fetchall()
+    return [_row_to_food(row) for row in rows]
+
+
+def _open_text(path: str) -> io.TextIOBase:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def _off_record(code, names: list, brands, nutriments: dict, popularity) -> Optional[tuple]:
+    name = next((str(item).strip() for item in names if item and str(item).strip()), "")
+    calories = _safe_float(nutriments.get("energy-kcal_100g"))
+    if calories <= 0:
+        # Some products only carry kJ
+        calories = _safe_float(nutriments.get("energy_100g")) / 4.184
+    if not name or calories <= 0 or calories > 900:
+        return None
+    return (
+        str(code or "").strip() or None,
+        name,
+        str(brands or "").split(",")[0].strip(),
+        round(calories, 1),
+        _safe_float(nutriments.get("proteins_100g")),
+        _safe_float(nutriments.get("carbohydrates_100g")),
+        _safe_float(nutriments.get("fat_100g")),
+        int(_safe_float(popularity)),
+    )
+
+
+def _iter_off_jsonl(handle, country: Optional[str]) -> Iterator[tuple]:
+    for line in handle:
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue
+        if country and f"en:{country}" not in (product.get("countries_tags") or []):
+            continue
+        record = _off_record(
+            product.get("code"),
+            [product.get("product_name_pt"), product.get("product_name")],
+            product.get("brands"),
+            product.get("nutriments") or {},
+            product.get("unique_scans_n"),
+        )
+        if record:
+            yield record
+
+
+def _iter_off_csv(handle, country: Optional[str]) -> Iterator[tuple]:
+    # The official dump is tab-separated with very long text fields
+    csv.field_size_limit(sys.maxsize)
+    for row in csv.DictReader(handle, delimiter="\t", quoting=csv.QUOTE_NONE):
+        if country and f"en:{country}" not in (row.get("countries_tags") or "").split(","):
+            continue
+        record = _off_record(
+            row.get("code"),
+            [row.get("product_name_pt"), row.get("product_name")],
+            row.get("brands"),
+            row,
+            row.get("unique_scans_n"),
+        )
+        if record:
+            yield record
+
+
+def _insert_batch(conn: sqlite3.Connection, records: list[tuple], source: str, now: float) -> None:
+    for code, name, brands, calories, protein, carbs, fat, popularity in records:
+        cursor = conn.execute(
+            "INSERT INTO foods (code, name, name_norm, brands, calories, protein, carbs, fat, source, popularity, imported_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (code, name, normalize_text(name), brands, calories, protein, carbs, fat, source, popularity, now),
+        )
+        if _db.fts_enabled:
+            conn.execute(
+                "INSERT INTO foods_fts (rowid, name, brands) VALUES (?, ?, ?)",
+                (cursor.lastrowid, normalize_text(name), normalize_text(brands)),
+            )
+
+
+def _replace_source(records: Iterator[tuple], source: str) -> int:
+    """
+    Replaces every row of `source` in one transaction, so readers keep seeing the previous
+    data until the import commits. Records are consumed in batches.
+    """
+    conn = _db.connect()
+    _ensure_schema(conn)
+    now = time.time()
+    count = 0
+    with conn:
+        if _db.fts_enabled:
+            conn.execute("DELETE FROM foods_fts WHERE rowid IN (SELECT id FROM foods WHERE source = ?)", (source,))
+        conn.execute("DELETE FROM foods WHERE source = ?", (source,))
+        batch: list[tuple] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= NUTRITION_IMPORT_BATCH:
+                _insert_batch(conn, batch, source, now)
+                count += len(batch)
+                batch = []
+                print(f"Nutrition DB: {count} produtos importados...")
+        _insert_batch(conn, batch, source, now)
+        count += len(batch)
+    return count
+
+
+def _read_generic_foods(path: str) -> list[tuple]:
+    with open(path, encoding="utf-8", newline="") as f:
+        return [
+            (None, row["name"].strip(), "", _safe_float(row["calories"]), _safe_float(row["protein"]),
+             _safe_float(row["carbs"]), _safe_float(row["fat"]), 0)
+            for row in csv.DictReader(f)
+            if row.get("name")
+        ]
+
+
+def import_generic_foods(path: str = PT_GENERIC_FOODS_PATH) -> int:
+    records = _read_generic_foods(path)
+    count = _replace_source(iter(records), GENERIC_SOURCE)
+    print(f"Nutrition DB: {count} alimentos genéricos PT importados")
+    return count
+
+
+def import_off_dump(path: str, country: Optional[str] = None) -> int:
+    """
+    Streams an Open Food Facts export (.csv / .jsonl, optionally .gz) into the local store,
+    keeping only products with a name and per-100g energy. `country` (e.g. "portugal")
+    keeps only products sold there.
+    """
+    is_jsonl = path.removesuffix(".gz").endswith((".jsonl", ".json"))
+    with _open_text(path) as handle:
+        records = _iter_off_jsonl(handle, country) if is_jsonl else _iter_off_csv(handle, country)
+        count = _replace_source(records, OFF_SOURCE)
+    print(f"Nutrition DB: {count} produtos Open Food Facts importados em {NUTRITION_DB_PATH}")
+    return count
+
+
+def stats() -> dict:
+    if not is_available():
+        return {"available": False, "path": NUTRITION_DB_PATH}
+    conn = _db.connect()
+    counts = dict(conn.execute("SELECT source, COUNT(*) FROM foods GROUP BY source").fetchall())
+    imported_at = conn.execute("SELECT MAX(imported_at) FROM foods").fetchone()[0]
+    return {
+        "available": True,
+        "path": NUTRITION_DB_PATH,
+        "foods": counts,
+        "fts5": bool(_db.fts_enabled),
+        "age_seconds": round(time.time() - imported_at, 1) if imported_at else None,
+    }
+
+
+if __name__ == "__main__":
+    # Uso: python nutrition_db.py generics | import <dump.csv|.jsonl[.gz]> [pais] | stats
+    command = sys.argv[1] if len(sys.argv) > 1 else "generics"
+    if command == "stats":
+        print(json.dumps(stats(), indent=2))
+    elif command == "import" and len(sys.argv) > 2:
+        import_off_dump(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        import_generic_foods()
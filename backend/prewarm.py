@@ -0,0 +1,232 @@
+import os
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+import llm_client
+import negotiator
+from cache_store import CACHE_DIR
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0") == "1"
+PREWARM_DB_PATH = os.getenv("PREWARM_DB_PATH", os.path.join(CACHE_DIR, "prewarm.sqlite3"))
+# Local hours during which warming may run, "start-end" (wraps past midnight, e.g. "23-6")
+PREWARM_OFFPEAK_HOURS = os.getenv("PREWARM_OFFPEAK_HOURS", "2-7")
+PREWARM_INTERVAL_SECONDS = float(os.getenv("PREWARM_INTERVAL_SECONDS", "600"))
+PREWARM_PACE_SECONDS = float(os.getenv("PREWARM_PACE_SECONDS", "5"))
+PREWARM_LOOKBACK_DAYS = float(os.getenv("PREWARM_LOOKBACK_DAYS", "7"))
+PREWARM_TOP_CRAVINGS = int(os.getenv("PREWARM_TOP_CRAVINGS", "100"))
+PREWARM_TOP_PROFILES = int(os.getenv("PREWARM_TOP_PROFILES", "3"))
+# Warming pauses while any model has less than this left in its rate-limit window
+PREWARM_MIN_REMAINING_REQUESTS = int(os.getenv("PREWARM_MIN_REMAINING_REQUESTS", "10"))
+PREWARM_MIN_REMAINING_TOKENS = int(os.getenv("PREWARM_MIN_REMAINING_TOKENS", "6000"))
+
+# Requests are buffered in memory and written in one batch, so handlers never wait on SQLite
+PREWARM_FLUSH_SECONDS = float(os.getenv("PREWARM_FLUSH_SECONDS", "10"))
+PREWARM_BUFFER_MAX = int(os.getenv("PREWARM_BUFFER_MAX", "10000"))
+
+_LEASE_SECONDS = 900
+_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_local = threading.local()
+_buffer: deque = deque(maxlen=PREWARM_BUFFER_MAX)
+_stats = {"recorded": 0, "flushes": 0, "rounds": 0, "warmed": 0, "skipped_full": 0, "paused_for_budget": 0, "errors": 0, "last_round_at": None}
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(PREWARM_DB_PATH)), exist_ok=True)
+        conn = sqlite3.connect(PREWARM_DB_PATH, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS negotiate_requests ("
+            "craving_key TEXT NOT NULL, craving TEXT NOT NULL, bucket INTEGER NOT NULL, "
+            "goal TEXT NOT NULL, allergens TEXT NOT NULL, requested_at REAL NOT NULL)"
+        )
+        try:
+            # Logs written before the daily target became part of the pool key
+            conn.execute("ALTER TABLE negotiate_requests ADD COLUMN daily_bucket INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_negotiate_requests_at ON negotiate_requests(requested_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def record_request(
+    craving: str, target_calories: int, plan_goal: Optional[str], allergens: List[str], daily_target_calories: Optional[int] = None
+) -> None:
+    """
+    Queues one /negotiator/negotiate request for the popularity log. No I/O; never raises.
+    """
+    if not PREWARM_ENABLED or not negotiator.result_pool_shared():
+        return
+    craving_key, bucket, goal, allergen_key, daily_bucket = negotiator.result_cache_parts(
+        craving, target_calories, plan_goal, allergens, daily_target_calories
+    )
+    if craving_key:
+        _buffer.append((craving_key, craving.strip(), bucket, goal, allergen_key, daily_bucket, time.time()))
+
+
+def flush_requests() -> int:
+    """
+    Writes the queued requests in one transaction. Blocking: call it off the event loop.
+    """
+    rows = []
+    while _buffer:
+        rows.append(_buffer.popleft())
+    if not rows:
+        return 0
+    try:
+        conn = _connect()
+        conn.executemany(
+            "INSERT INTO negotiate_requests (craving_key, craving, bucket, goal, allergens, daily_bucket, requested_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Prewarm: erro ao registar {len(rows)} pedidos ({e})")
+        return 0
+    _stats["recorded"] += len(rows)
+    _stats["flushes"] += 1
+    return len(rows)
+
+
+async def flush_forever() -> None:
+    try:
+        while True:
+            await asyncio.sleep(PREWARM_FLUSH_SECONDS)
+            await asyncio.to_thread(flush_requests)
+    finally:
+        # Shutdown: keep what is still buffered
+        await asyncio.to_thread(flush_requests)
+
+
+def _is_offpeak(now: Optional[datetime] = None) -> bool:
+    try:
+        start, end = (int(part) for part in PREWARM_OFFPEAK_HOURS.split("-", 1))
+    except ValueError:
+        return False
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def _acquire_lease() -> bool:
+    # Only one uvicorn worker warms at a time; the lease expires if that worker dies
+    now = time.time()
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES ('prewarm', ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+            (_owner, now + _LEASE_SECONDS, now),
+        )
+    row = conn.execute("SELECT owner FROM leases WHERE name = 'prewarm'").fetchone()
+    return bool(row and row[0] == _owner)
+
+
+def popular_targets() -> list[dict]:
+    """
+    Top cravings from the log crossed with the most common (calorie bucket, goal, allergens) profiles.
+    """
+    flush_requests()
+    conn = _connect()
+    since = time.time() - PREWARM_LOOKBACK_DAYS * 86400
+    conn.execute("DELETE FROM negotiate_requests WHERE requested_at < ?", (since,))
+    conn.commit()
+    cravings = conn.execute(
+        "SELECT craving_key, MAX(craving), COUNT(*) AS hits FROM negotiate_requests WHERE requested_at >= ? "
+        "GROUP BY craving_key ORDER BY hits DESC LIMIT ?",
+        (since, PREWARM_TOP_CRAVINGS),
+    ).fetchall()
+    profiles = conn.execute(
+        "SELECT bucket, goal, allergens, daily_bucket, COUNT(*) AS hits FROM negotiate_requests WHERE requested_at >= ? "
+        "GROUP BY bucket, goal, allergens, daily_bucket ORDER BY hits DESC LIMIT ?",
+        (since, PREWARM_TOP_PROFILES),
+    ).fetchall()
+    return [
+        {
+            "craving": craving,
+            "target_calories": bucket,
+            "plan_goal": goal,
+            "allergens": [item for item in allergens.split(",") if item],
+            "daily_target_calories": daily_bucket or None,
+        }
+        for _, craving, _ in cravings
+        for bucket, goal, allergens, daily_bucket, _ in profiles
+    ]
+
+
+async def warm_once() -> int:
+    """
+    One warming round: fills the negotiator result pool for each popular target, pacing calls
+    and stopping as soon as the LLM budget runs low or off-peak hours end. Returns responses generated.
+    """
+    _stats["rounds"] += 1
+    _stats["last_round_at"] = time.time()
+    generated = 0
+    for target in await asyncio.to_thread(popular_targets):
+        if not await asyncio.to_thread(_acquire_lease):
+            return generated
+        for _ in range(negotiator.NEGOTIATOR_CACHE_VARIANTS):
+            if negotiator.cached_variant_count(**target) >= negotiator.NEGOTIATOR_CACHE_VARIANTS:
+                _stats["skipped_full"] += 1
+                break
+            if not _is_offpeak():
+                return generated
+            if not llm_client.has_spare_capacity(PREWARM_MIN_REMAINING_REQUESTS, PREWARM_MIN_REMAINING_TOKENS):
+                _stats["paused_for_budget"] += 1
+                return generated
+            try:
+                await negotiator.negotiate_craving(**target)
+                generated += 1
+                _stats["warmed"] += 1
+            except Exception as e:
+                _stats["errors"] += 1
+                print(f"Prewarm: erro ao gerar '{target['craving']}' ({e})")
+                break
+            await asyncio.sleep(PREWARM_PACE_SECONDS)
+    return generated
+
+
+def can_start() -> bool:
+    """
+    Warming only pays off when its responses land in a result pool every worker reads; with the pool
+    off (or in one worker's memory) each round would be LLM generations thrown away.
+    """
+    if not PREWARM_ENABLED:
+        return False
+    if not negotiator.result_pool_shared():
+        print(
+            f"Prewarm: desativado, NEGOTIATOR_CACHE_BACKEND={negotiator.NEGOTIATOR_CACHE_BACKEND} "
+            "(é preciso sqlite ou tiered para partilhar as respostas pré-geradas)"
+        )
+        return False
+    return True
+
+
+async def run_forever() -> None:
+    print(f"Prewarm: ativo nas horas {PREWARM_OFFPEAK_HOURS} (worker {_owner})")
+    while True:
+        try:
+            if _is_offpeak() and await asyncio.to_thread(_acquire_lease):
+                generated = await warm_once()
+                if generated:
+                    print(f"Prewarm: {generated} respostas pré-geradas")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"Prewarm: erro no ciclo ({e})")
+        await asyncio.sleep(PREWARM_INTERVAL_SECONDS)
+
+
+def get_stats() -> dict:
+    return {"enabled": PREWARM_ENABLED, "offpeak_hours": PREWARM_OFFPEAK_HOURS, "offpeak_now": _is_offpeak(), "buffered": len(_buffer), **_stats}
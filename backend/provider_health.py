@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from circuit_breaker import CircuitBreaker, CLOSED, OPEN
+from cache_store import CACHE_DIR
+
+PROVIDER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+PROVIDER_RECOVERY_SECONDS = float(os.getenv("PROVIDER_RECOVERY_SECONDS", "30"))
+# Open breakers are published to this file so every uvicorn worker skips a provider another one found down
+PROVIDER_HEALTH_SHARED = os.getenv("PROVIDER_HEALTH_SHARED", "1") == "1"
+PROVIDER_HEALTH_DB_PATH = os.getenv("PROVIDER_HEALTH_DB_PATH", os.path.join(CACHE_DIR, "provider_health.sqlite3"))
+# How often a worker re-reads the shared state of one provider
+_SYNC_INTERVAL_SECONDS = 1.0
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_last_sync: dict[str, float] = {}
+_local = threading.local()
+_stats: dict[str, dict[str, int]] = {}
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+
+def _connect() -> Optional[sqlite3.Connection]:
+    if not PROVIDER_HEALTH_SHARED:
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(PROVIDER_HEALTH_DB_PATH)), exist_ok=True)
+            conn = sqlite3.connect(PROVIDER_HEALTH_DB_PATH, timeout=1, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS provider_state ("
+                "name TEXT PRIMARY KEY, open_until REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Provider health: estado partilhado indisponível ({e})")
+            return None
+        _local.conn = conn
+    return conn
+
+
+def _publish(name: str, open_until: float) -> None:
+    conn = _connect()
+    if conn is None:
+        return
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO provider_state (name, open_until, updated_at) VALUES (?, ?, ?)",
+            (name, open_until, time.time()),
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Provider health: erro ao publicar estado de {name} ({e})")
+
+
+def _sync(name: str, breaker: CircuitBreaker) -> None:
+    # Adopt an outage another worker has already detected, for whatever time it has left
+    now = time.time()
+    if now - _last_sync.get(name, 0.0) < _SYNC_INTERVAL_SECONDS:
+        return
+    _last_sync[name] = now
+    conn = _connect()
+    if conn is None:
+        return
+    try:
+        row = conn.execute("SELECT open_until FROM provider_state WHERE name = ?", (name,)).fetchone()
+    except sqlite3.Error:
+        return
+    if row and row[0] > now and breaker.state != OPEN:
+        breaker.trip(row[0] - now)
+        _provider_stats(name)["shared_trips"] += 1
+
+
+def _provider_stats(name: str) -> dict[str, int]:
+    return _stats.setdefault(name, {"skipped": 0, "shared_trips": 0})
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, PROVIDER_FAILURE_THRESHOLD, PROVIDER_RECOVERY_SECONDS)
+        return _breakers[name]
+
+
+def allow(name: str) -> bool:
+    """
+    False while the provider's breaker is open: the caller should go straight to its fallback.
+    In half-open state exactly one caller gets True and acts as the probe.
+    """
+    provider = breaker(name)
+    _sync(name, provider)
+    if provider.allow_request():
+        return True
+    _provider_stats(name)["skipped"] += 1
+    return False
+
+
+def record_success(name: str) -> None:
+    provider = breaker(name)
+    was_open = provider.state != CLOSED
+    provider.record_success()
+    if was_open:
+        _publish(name, 0.0)
+
+
+def record_failure(name: str) -> None:
+    provider = breaker(name)
+    was_open = provider.state == OPEN
+    provider.record_failure()
+    snapshot = provider.snapshot()
+    if snapshot["state"] == OPEN and not was_open:
+        print(f"Provider health: {name} marcado como indisponível durante {snapshot['retry_in_seconds']}s")
+        _publish(name, time.time() + snapshot["retry_in_seconds"])
+
+
+@contextmanager
+def guard(name: str, is_failure=lambda error: True):
+    """
+    Wraps one call to a provider: raises ProviderUnavailable without calling it while the breaker
+    is open, and records the outcome. Exceptions for which `is_failure` is False (e.g. a 404)
+    still count as the provider being up.
+    """
+    if not allow(name):
+        raise ProviderUnavailable(f"{name} indisponível")
+    try:
+        yield
+    except Exception as e:
+        if is_failure(e):
+            record_failure(name)
+        else:
+            record_success(name)
+        raise
+    record_success(name)
+
+
+def get_health() -> dict:
+    with _breakers_lock:
+        names = list(_breakers)
+    return {
+        "shared": PROVIDER_HEALTH_SHARED,
+        "providers": {name: {**breaker(name).snapshot(), **_provider_stats(name)} for name in sorted(names)},
+    }
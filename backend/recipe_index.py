@@ -0,0 +1,239 @@
+import os
+import json
+import re
+import shutil
+import sys
+import threading
+import time
+from typing import Optional
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize as l2_normalize
+import mealdb_mirror
+from cache_store import CACHE_DIR
+from meal_matcher import extract_meal_ingredients, normalize_text
+
+RECIPE_INDEX_DIR = os.getenv("RECIPE_INDEX_DIR", os.path.join(CACHE_DIR, "recipe_index"))
+RECIPE_INDEX_TOP_K = int(os.getenv("RECIPE_INDEX_TOP_K", "20"))
+# Cosine below this is treated as noise rather than a candidate
+RECIPE_INDEX_MIN_SIMILARITY = float(os.getenv("RECIPE_INDEX_MIN_SIMILARITY", "0.08"))
+
+# Character n-grams (within word boundaries) tolerate plurals, accents and small typos.
+# Hashing keeps the vocabulary out of the persisted files, so query-time vectors need no fitted state.
+_vectorizer = HashingVectorizer(
+    analyzer="char_wb",
+    ngram_range=(3, 4),
+    n_features=2 ** 18,
+    alternate_sign=False,
+    norm=None,
+    preprocessor=normalize_text,
+)
+
+_ARRAYS = ("data", "indices", "indptr", "idf", "ids")
+# Text file naming the current version directory; replacing it is the atomic publish step
+_CURRENT_FILE = "CURRENT"
+_RECIPE_PREFIX = "recipe-"
+# Old versions kept on disk so a worker that just read CURRENT can still open its files
+_KEEP_VERSIONS = 2
+_lock = threading.Lock()
+_loaded: Optional[dict] = None
+
+
+def _meal_document(meal: dict) -> str:
+    # Name counted twice so it outweighs a long ingredient list
+    name = str(meal.get("strMeal", ""))
+    parts = [name, name, str(meal.get("strCategory") or ""), str(meal.get("strArea") or "")]
+    parts.extend(re.sub(r"^[\d\s/.,]+", "", item) for item in extract_meal_ingredients(meal))
+    return " ".join(part for part in parts if part)
+
+
+def _recipe_as_meal(recipe) -> dict:
+    """
+    Shapes a row from the recipes table like a MealDB meal so the negotiator can score and build it the same way.
+    """
+    lines = [line.strip(" -•\t") for line in re.split(r"[\n;,]+", recipe.ingredients or "") if line.strip(" -•\t")]
+    meal = {
+        "idMeal": f"recipe-{recipe.id}",
+        "strMeal": recipe.name or "",
+        "strInstructions": recipe.instructions or "",
+    }
+    for i, line in enumerate(lines[:20], start=1):
+        meal[f"strIngredient{i}"] = line
+        meal[f"strMeasure{i}"] = ""
+    return meal
+
+
+def _load_recipes_table(ids: Optional[list[int]] = None) -> list[dict]:
+    try:
+        from database import SessionLocal
+        import models
+        db = SessionLocal()
+        try:
+            query = db.query(models.Recipe)
+            if ids is not None:
+                query = query.filter(models.Recipe.id.in_(ids))
+            return [_recipe_as_meal(recipe) for recipe in query.all()]
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Recipe index: tabela recipes indisponível ({e})")
+        return []
+
+
+def _resolve_meals(meal_ids: list[str]) -> dict[str, dict]:
+    """
+    Full meals for index hits: MealDB ids from the mirror, recipe-<id> rows from the recipes table.
+    """
+    recipe_ids = [int(meal_id[len(_RECIPE_PREFIX):]) for meal_id in meal_ids if meal_id.startswith(_RECIPE_PREFIX)]
+    meals = {meal["idMeal"]: meal for meal in _load_recipes_table(recipe_ids)} if recipe_ids else {}
+    for meal_id in meal_ids:
+        if not meal_id.startswith(_RECIPE_PREFIX):
+            meal = mealdb_mirror.get_meal(meal_id)
+            if meal:
+                meals[meal_id] = meal
+    return meals
+
+
+def _weigh(counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+    counts = counts.tocsr().astype(np.float32)
+    counts.data = 1.0 + np.log(counts.data)
+    weighted = counts @ sparse.diags(idf.astype(np.float32))
+    return l2_normalize(weighted.tocsr(), norm="l2", copy=False)
+
+
+def build_index(include_recipes_table: bool = True) -> int:
+    """
+    Builds the TF-IDF matrix over the MealDB mirror (plus the recipes table) and writes it to a new
+    version directory under RECIPE_INDEX_DIR as .npy arrays that every worker memory-maps.
+    Returns the document count.
+    """
+    meals = list(mealdb_mirror.iter_meals())
+    if include_recipes_table:
+        meals.extend(_load_recipes_table())
+    if not meals:
+        print("Recipe index: sem documentos (corre primeiro 'python mealdb_mirror.py sync').")
+        return 0
+
+    counts = _vectorizer.transform([_meal_document(meal) for meal in meals]).tocsr()
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1 + len(meals)) / (1 + document_frequency)) + 1.0
+    matrix = _weigh(counts, idf)
+
+    # Each build goes to its own directory and CURRENT is switched last, so a worker never pairs
+    # a new matrix with old ids. Only ids are stored: meals are resolved from the mirror per hit.
+    build_id = f"{int(time.time() * 1000)}-{os.getpid()}"
+    version_dir = os.path.join(RECIPE_INDEX_DIR, f"v-{build_id}")
+    os.makedirs(version_dir, exist_ok=True)
+    arrays = {
+        "data": matrix.data,
+        "indices": matrix.indices,
+        "indptr": matrix.indptr,
+        "idf": idf.astype(np.float32),
+        "ids": np.array([str(meal.get("idMeal", "")) for meal in meals], dtype=np.str_),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(version_dir, f"{name}.npy"), array)
+    with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"shape": list(matrix.shape), "built_at": time.time(), "build_id": build_id}, f)
+    current_tmp = os.path.join(RECIPE_INDEX_DIR, f"{_CURRENT_FILE}.{build_id}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(build_id)
+    os.replace(current_tmp, os.path.join(RECIPE_INDEX_DIR, _CURRENT_FILE))
+    _prune_versions(build_id)
+
+    print(f"Recipe index: {len(meals)} documentos indexados em {version_dir}")
+    return len(meals)
+
+
+def _prune_versions(current_build: str) -> None:
+    versions = sorted(name for name in os.listdir(RECIPE_INDEX_DIR) if name.startswith("v-"))
+    for name in versions[:-_KEEP_VERSIONS]:
+        if name != f"v-{current_build}":
+            shutil.rmtree(os.path.join(RECIPE_INDEX_DIR, name), ignore_errors=True)
+
+
+def _current_build() -> Optional[str]:
+    try:
+        with open(os.path.join(RECIPE_INDEX_DIR, _CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _load() -> Optional[dict]:
+    global _loaded
+    build_id = _current_build()
+    if build_id is None:
+        return None
+    with _lock:
+        if _loaded is not None and _loaded["build_id"] == build_id:
+            return _loaded
+        version_dir = os.path.join(RECIPE_INDEX_DIR, f"v-{build_id}")
+        try:
+            with open(os.path.join(version_dir, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+            matrix = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(meta["shape"]), copy=False)
+        except Exception as e:
+            print(f"Recipe index: erro ao carregar ({e})")
+            return None
+        _loaded = {
+            "build_id": build_id, "matrix": matrix, "idf": np.asarray(arrays["idf"]),
+            "ids": arrays["ids"], "built_at": meta.get("built_at"),
+        }
+        return _loaded
+
+
+def is_available() -> bool:
+    return _load() is not None
+
+
+def search_many(queries: list[str], k: int = RECIPE_INDEX_TOP_K) -> list[list[tuple[float, dict]]]:
+    """
+    Cosine top-k for several queries with a single sparse matrix product.
+    Returns, per query, (similarity, meal) pairs best first.
+    """
+    index = _load()
+    if index is None or not queries or index["matrix"].shape[0] == 0:
+        return [[] for _ in queries]
+    query_matrix = _weigh(_vectorizer.transform(queries), index["idf"])
+    similarities = (query_matrix @ index["matrix"].T).toarray()
+
+    hits = []
+    k = min(k, similarities.shape[1])
+    for row in similarities:
+        top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+        top = top[np.argsort(-row[top])]
+        hits.append([(float(row[i]), str(index["ids"][i])) for i in top if row[i] >= RECIPE_INDEX_MIN_SIMILARITY])
+
+    # Meals deleted since the build are silently dropped
+    meals = _resolve_meals(list(dict.fromkeys(meal_id for row in hits for _, meal_id in row)))
+    return [[(similarity, meals[meal_id]) for similarity, meal_id in row if meal_id in meals] for row in hits]
+
+
+def search(query: str, k: int = RECIPE_INDEX_TOP_K) -> list[tuple[float, dict]]:
+    return search_many([query], k)[0]
+
+
+def stats() -> dict:
+    index = _load()
+    if index is None:
+        return {"available": False, "path": RECIPE_INDEX_DIR}
+    return {
+        "available": True,
+        "path": RECIPE_INDEX_DIR,
+        "build_id": index["build_id"],
+        "documents": index["matrix"].shape[0],
+        "nonzeros": int(index["matrix"].nnz),
+        "age_seconds": round(time.time() - index["built_at"], 1) if index.get("built_at") else None,
+    }
+
+
+if __name__ == "__main__":
+    # Uso: python recipe_index.py [build|stats]
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "stats":
+        print(json.dumps(stats(), indent=2))
+    else:
+        build_index()
@@ -139,12 +139,35 @@ class FoodSearchItem(BaseModel):
     fat_per_100g: float
     source: str
 
+class FoodSuggestResponse(BaseModel):
+    query: str
+    items: list[FoodSearchItem]
+    remote_pending: bool = False
+
+class FoodSearchBatchRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1)
+    page_size: int = Field(3, ge=1, le=10)
+
+class FoodSearchBatchItem(BaseModel):
+    query: str
+    results: list[FoodSearchItem] = []
+    error: Optional[str] = None
+
+class FoodSearchBatchResponse(BaseModel):
+    items: list[FoodSearchBatchItem]
+
+class RecipeIngredientQuantity(BaseModel):
+    name: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+
 class NegotiatorRecipe(BaseModel):
     title: str
     calories: int
     time_minutes: int
     ingredients: list[str]
     ingredients_en: Optional[list[str]] = None
+    ingredient_quantities: Optional[list[RecipeIngredientQuantity]] = None
     steps: list[str]
 
 class NegotiatorRequest(BaseModel):
@@ -163,6 +186,7 @@ class NegotiatorResponse(BaseModel):
     message: str
     recipe: NegotiatorRecipe | None = None
     restaurant_search_term: Optional[str] = None
+    skipped_stages: Optional[list[str]] = None
 
 class NutritionAnalysisRequest(BaseModel):
     food_text: str
@@ -178,6 +202,17 @@ class NutritionAnalysisResponse(BaseModel):
     fat: float
     estimated_grams: int
 
+class NutritionBatchRequest(BaseModel):
+    food_texts: list[str] = Field(..., min_length=1)
+
+class NutritionBatchItem(BaseModel):
+    food_text: str
+    result: Optional[NutritionAnalysisResponse] = None
+    error: Optional[str] = None
+
+class NutritionBatchResponse(BaseModel):
+    items: list[NutritionBatchItem]
+
 class DiaryGoalUpdate(BaseModel):
     goal: int = Field(..., ge=1000, le=6000)
 
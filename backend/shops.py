@@ -3,7 +3,9 @@ import math
 import requests
 import re
 from typing import List, Dict, Optional
-from openai import OpenAI
+from urllib.parse import urlparse
+from llm_client import get_chat_completion
+import provider_health
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -32,23 +34,9 @@ def get_shop_type(ingredients: List[str], api_key: Optional[str] = None) -> str:
     if final_api_key:
         final_api_key = final_api_key.strip()
 
-    base_url = os.getenv("OPENAI_BASE_URL")
-    model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
-
     if not final_api_key:
         return "supermarket"
 
-    # Auto-detect Groq key
-    if final_api_key.startswith("gsk_"):
-        if not base_url or "openai.com" in base_url:
-            base_url = "https://api.groq.com/openai/v1"
-            model = "llama-3.3-70b-versatile"
-
-    client = OpenAI(
-        api_key=final_api_key,
-        base_url=base_url
-    )
-
     ingredients_str = ", ".join(ingredients)
     prompt = (
         f"Analyze this query: {ingredients_str}. "
@@ -62,15 +50,16 @@ def get_shop_type(ingredients: List[str], api_key: Optional[str] = None) -> str:
     )
 
     try:
-        response = client.chat.completions.create(
-            model=model,
+        # "classify" profile: small/fast model tier, tiny token cap and a short timeout
+        response = get_chat_completion(
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that maps ingredients to OpenStreetMap tags."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
             max_tokens=10,
-            timeout=10
+            profile="classify",
+            api_key=final_api_key
         )
         # Clean the response: lowercase, strip punctuation and extra spaces
         tag = response.choices[0].message.content.strip().lower()
@@ -100,10 +89,15 @@ def find_nearby_shops(tag_value: str, lat: float, lon: float, radius: int = 3000
     query = f'[out:json][timeout:90];nwr["{key}"="{tag_value}"](around:{radius},{lat},{lon});out center;'
 
     for url in overpass_urls:
+        # Each mirror has its own breaker, so a dead mirror is skipped instead of waiting 95s on it
+        provider = f"overpass:{urlparse(url).netloc}"
+        if not provider_health.allow(provider):
+            continue
         try:
             response = requests.get(url, params={'data': query}, timeout=95)
             response.raise_for_status()
             data = response.json()
+            provider_health.record_success(provider)
             
             shops = []
             # ... (rest of the processing)
@@ -141,6 +135,12 @@ def find_nearby_shops(tag_value: str, lat: float, lon: float, radius: int = 3000
             return shops[:50]
 
         except Exception as e:
+            if isinstance(e, requests.exceptions.RequestException) and not (
+                isinstance(e, requests.exceptions.HTTPError) and e.response is not None and e.response.status_code < 500
+            ):
+                provider_health.record_failure(provider)
+            else:
+                provider_health.record_success(provider)
             print(f"Error in find_nearby_shops with {url}: {e}")
             continue # Try next server
             
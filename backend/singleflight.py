@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+_groups: list["SingleFlight"] = []
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one upstream call.
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait for it and receive the same result or exception.
+    Nothing is kept once the call finishes, so this is not a cache.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._tasks: dict[Hashable, tuple[asyncio.Task, list[int]]] = {}
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0}
+        _groups.append(self)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            self._stats["calls"] += 1
+            entry = self._tasks.get(key)
+            if entry is not None:
+                self._stats["coalesced"] += 1
+            else:
+                task = asyncio.ensure_future(fn())
+                entry = (task, [0])
+                self._tasks[key] = entry
+                self._stats["executed"] += 1
+                task.add_done_callback(lambda _t, k=key, e=entry: self._forget(k, e))
+            task, waiters = entry
+            waiters[0] += 1
+
+        try:
+            # Shielded so one cancelled caller does not cancel the shared call for everyone else
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            waiters[0] -= 1
+            if waiters[0] <= 0 and not task.done():
+                task.cancel()
+            raise
+
+    def _forget(self, key: Hashable, entry) -> None:
+        with self._lock:
+            if self._tasks.get(key) is entry:
+                del self._tasks[key]
+        task = entry[0]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter was cancelled
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": len(self._calls) + len(self._tasks),
+        }
+
+
+def get_stats() -> dict:
+    return {group.name: group.stats() for group in _groups}
@@ -0,0 +1,61 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Optional
+from meal_matcher import normalize_text
+
+
+def search_tokens(value: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", normalize_text(value))
+
+
+def fts_match(tokens: list[str]) -> str:
+    # Every word must match, each as a prefix ("frang" finds "frango")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def like_clauses(column: str, tokens: list[str]) -> tuple[str, list[str]]:
+    return " AND ".join(f"{column} LIKE ?" for _ in tokens), [f"%{token}%" for token in tokens]
+
+
+class LocalSearchDB:
+    """
+    One SQLite file read by many threads (one WAL connection each), with an optional FTS5 table.
+    Shared by the local MealDB mirror and the nutrition DB.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fts_enabled: Optional[bool] = None
+        self._local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_fts(self, conn: sqlite3.Connection, table: str, columns: str) -> bool:
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({columns})")
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: callers fall back to LIKE over the normalized name
+            self.fts_enabled = False
+        return self.fts_enabled
+
+    def has_rows(self, table: str, ensure_schema) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            conn = self.connect()
+            if self.fts_enabled is None:
+                ensure_schema(conn)
+            return conn.execute(f"SELECT EXISTS (SELECT 1 FROM {table})").fetchone()[0] == 1
+        except sqlite3.Error:
+            return False
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Stop nginx/Render proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def _hex(digits: str):
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def format_event(event: str, data: Any) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class PartialJsonField:
+    """
+    Pulls the value of one top-level string field (e.g. "message") out of a JSON
+    document that is still being streamed, so its text can be forwarded before
+    the object is complete. feed() returns only the newly decoded characters.
+    """
+
+    def __init__(self, field: str):
+        self._pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._start = None
+        self._pos = 0
+        self.value = ""
+        self.complete = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self.complete:
+            return ""
+        if self._start is None:
+            match = self._pattern.search(self._buffer)
+            if not match:
+                return ""
+            self._start = self._pos = match.end()
+
+        decoded = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.complete = True
+                pos += 1
+                break
+            if char == "\\":
+                if pos + 1 >= len(buffer):
+                    break
+                escape = buffer[pos + 1]
+                if escape == "u":
+                    if pos + 6 > len(buffer):
+                        break
+                    code = _hex(buffer[pos + 2:pos + 6])
+                    if code is not None and 0xD800 <= code < 0xDC00:
+                        # High surrogate (emoji etc.): decode it together with its low half, since
+                        # a lone surrogate cannot be encoded as UTF-8 when the delta is sent
+                        following = buffer[pos + 6:pos + 12]
+                        if len(following) < 6 and "\\u".startswith(following[:2]):
+                            break
+                        low = _hex(following[2:]) if following.startswith("\\u") else None
+                        if low is not None and 0xDC00 <= low < 0xE000:
+                            decoded.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                            pos += 12
+                            continue
+                        code = None
+                    if code is not None and not 0xDC00 <= code < 0xE000:
+                        decoded.append(chr(code))
+                    pos += 6
+                    continue
+                decoded.append(_ESCAPES.get(escape, escape))
+                pos += 2
+                continue
+            decoded.append(char)
+            pos += 1
+
+        self._pos = pos
+        delta = "".join(decoded)
+        self.value += delta
+        return delta
+
+
+async def run_with_events(producer: Callable[[Callable[[str, Any], None]], Awaitable[Any]]) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Runs `producer(emit)` as a task and yields every (event, data) it emits while it runs,
+    followed by ("result", return value). Exceptions from the producer are re-raised here.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def emit(event: str, data: Any = None) -> None:
+        queue.put_nowait((event, data))
+
+    async def runner():
+        try:
+            return await producer(emit)
+        finally:
+            queue.put_nowait(done)
+
+    task = asyncio.ensure_future(runner())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        yield "result", await task
+    finally:
+        if not task.done():
+            task.cancel()
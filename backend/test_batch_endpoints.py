@@ -0,0 +1,96 @@
+import re
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+import auth
+import food_data
+import main
+import models
+import negotiator
+
+
+@pytest.fixture
+def client():
+    main.app.dependency_overrides[auth.get_current_user] = lambda: models.User(id=1, username="teste")
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """
+    Stands in for the model: answers every numbered item of the prompt except ones containing
+    "ignorar", and marks "pedra" as not food. Records the items of each call.
+    """
+    calls = []
+
+    async def completion(messages, **kwargs):
+        lines = re.findall(r"^(\d+)\. (.+)$", messages[-1]["content"], re.M)
+        calls.append([text for _, text in lines])
+        items = [
+            {"index": int(index), "is_food": "pedra" not in text, "error_message": "Não é comida." if "pedra" in text else None,
+             "name": text.title(), "calories": 100 * int(index), "protein": 1, "carbs": 2, "fat": 3, "estimated_grams": 100}
+            for index, text in lines if "ignorar" not in text
+        ]
+        content = str({"items": items}).replace("None", "null").replace("True", "true").replace("False", "false")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    monkeypatch.setattr(negotiator, "get_chat_completion_async", completion)
+    monkeypatch.setattr(negotiator, "_nutrition_cache", None)
+    return calls
+
+
+def test_nutrition_batch_answers_every_item_in_order(client, fake_llm):
+    texts = ["Banana", " banana ", "pedra", "ignorar isto", "  ", "200g arroz"]
+    response = client.post("/negotiator/nutrition/batch", json={"food_texts": texts})
+    assert response.status_code == 200
+    items = response.json()["items"]
+
+    assert [item["food_text"] for item in items] == texts
+    assert items[0]["result"]["calories"] == items[1]["result"]["calories"]
+    assert items[2]["error"] == "Não é comida."
+    assert items[3]["error"] == "O modelo não devolveu resultado para este item."
+    assert items[4]["error"] == "Item vazio."
+    assert items[5]["result"]["name"] == "200G Arroz"
+    # Spelling variants and blanks are not sent to the model
+    assert fake_llm == [["Banana", "pedra", "ignorar isto", "200g arroz"]]
+
+
+def test_nutrition_batch_is_chunked(client, fake_llm, monkeypatch):
+    monkeypatch.setattr(negotiator, "NUTRITION_BATCH_CHUNK_SIZE", 2)
+    response = client.post("/negotiator/nutrition/batch", json={"food_texts": ["a", "b", "c"]})
+    assert all(item["result"] for item in response.json()["items"])
+    assert sorted(fake_llm) == [["a", "b"], ["c"]]
+
+
+def test_nutrition_batch_rejects_too_many_items(client, fake_llm, monkeypatch):
+    monkeypatch.setattr(negotiator, "NUTRITION_BATCH_MAX_ITEMS", 2)
+    assert client.post("/negotiator/nutrition/batch", json={"food_texts": ["a", "b", "c"]}).status_code == 400
+    assert fake_llm == []
+
+
+def test_food_search_batch(client, monkeypatch):
+    searched = []
+
+    def search(query, page_size=3):
+        searched.append(query)
+        if query == "erro":
+            raise RuntimeError("OFF em baixo")
+        return [{"name": query.title(), "calories_per_100g": 50, "protein_per_100g": 1, "carbs_per_100g": 2, "fat_per_100g": 3, "source": "teste"}]
+
+    monkeypatch.setattr(food_data, "search_foods", search)
+    response = client.post("/foods/search/batch", json={"queries": ["Maçã", "maçã", "erro", " "], "page_size": 2})
+    assert response.status_code == 200
+    items = response.json()["items"]
+
+    assert [item["query"] for item in items] == ["Maçã", "maçã", "erro", " "]
+    assert items[0]["results"][0]["name"] == "Maçã"
+    assert items[1]["results"] == items[0]["results"]
+    assert items[2]["error"].startswith("Erro na pesquisa")
+    assert items[3]["error"] == "Pesquisa vazia."
+    assert sorted(searched) == ["Maçã", "erro"]
+
+
+def test_food_search_batch_rejects_too_many_queries(client, monkeypatch):
+    monkeypatch.setattr(food_data, "FOOD_SEARCH_BATCH_MAX_ITEMS", 1)
+    assert client.post("/foods/search/batch", json={"queries": ["a", "b"]}).status_code == 400
@@ -0,0 +1,62 @@
+import time
+import cache_store
+from cache_store import MemoryCache, SQLiteCache, TieredCache, build_cache
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(default_ttl=60)
+    cache.set("short", "x", ttl=0.01)
+    cache.set("long", "y")
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.get("long") == "y"
+    assert cache.stats()["expired"] == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    writer = SQLiteCache(path, table="llm")
+    writer.set("key", {"content": "olá"})
+    reader = SQLiteCache(path, table="llm")
+    assert reader.get("key") == {"content": "olá"}
+    assert reader.get("missing") is None
+
+
+def test_sqlite_cache_prunes_past_max_entries(tmp_path):
+    # Pruning runs every 100 writes
+    cache = SQLiteCache(str(tmp_path / "prune.sqlite3"), max_entries=5)
+    for i in range(100):
+        cache.set(f"k{i}", i)
+    assert len(cache) == 5
+    assert cache.get("k99") == 99
+    assert cache.get("k0") is None
+
+
+def test_tiered_cache_promotes_shared_hits(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "tiered.sqlite3"))
+    shared.set("key", [1, 2])
+    cache = TieredCache(MemoryCache(), shared, memory_ttl=60)
+    assert cache.get("key") == [1, 2]
+    assert cache.memory.get("key") == [1, 2]
+
+
+def test_build_cache_backends(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_store, "CACHE_DIR", str(tmp_path))
+    assert build_cache("off", "x", 10) is None
+    assert isinstance(build_cache("memory", "x", 10), MemoryCache)
+    assert isinstance(build_cache("sqlite", "x", 10), SQLiteCache)
+    tiered = build_cache("tiered", "y", 10, memory_entries=2)
+    assert isinstance(tiered, TieredCache)
+    assert tiered.memory.max_entries == 2
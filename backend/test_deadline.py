@@ -0,0 +1,48 @@
+import asyncio
+import time
+import pytest
+from deadline import Deadline, DeadlineExceeded
+import food_data
+import llm_client
+
+
+def test_budget_runs_down():
+    deadline = Deadline(0.05)
+    assert deadline.allows(0.01)
+    assert not deadline.allows(1)
+    assert deadline.cap(10) <= 0.05
+    assert deadline.cap(0.01) == 0.01
+    assert deadline.cap(None) <= 0.05
+    time.sleep(0.06)
+    assert deadline.expired()
+    assert deadline.remaining() == 0.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("llm")
+
+
+def test_skips_are_recorded_once():
+    deadline = Deadline(1)
+    deadline.skip("off_lookup")
+    deadline.skip("off_lookup")
+    assert deadline.skipped == ["off_lookup"]
+
+
+def test_child_shares_expiry_but_not_skips():
+    deadline = Deadline(1)
+    branch = deadline.child()
+    branch.skip("translation")
+    assert branch.expires_at == deadline.expires_at
+    assert deadline.skipped == []
+
+
+def test_ai_estimate_is_skipped_without_enough_budget():
+    deadline = Deadline(food_data.AI_CALORIES_MIN_SECONDS / 2)
+    assert food_data.estimate_recipe_calories_with_ai(["200g arroz"], deadline) == 0
+    assert deadline.skipped == ["ai_calorie_estimate"]
+
+
+def test_llm_call_fails_fast_once_expired(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    deadline = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(llm_client.get_chat_completion_async([{"role": "user", "content": "olá"}], deadline=deadline))
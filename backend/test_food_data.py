@@ -0,0 +1,136 @@
+import threading
+import time
+import numpy as np
+import pytest
+import requests
+import food_data
+from cache_store import SQLiteCache
+from deadline import Deadline
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    """At most two lookups of one call in flight; `state["in_flight"]` / `state["peak"]` track them."""
+    monkeypatch.setattr(food_data, "FOOD_RESOLVE_PER_CALL_CONCURRENCY", 2)
+    monkeypatch.setattr(food_data, "_resolve_stats", dict.fromkeys(food_data._resolve_stats, 0))
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0, "started": []}
+
+    def tracked(delay, result=None):
+        def run(item):
+            with lock:
+                state["started"].append(item)
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(delay)
+            with lock:
+                state["in_flight"] -= 1
+            return result(item) if result else item
+        return run
+
+    state["tracked"] = tracked
+    return state
+
+
+def test_map_bounded_caps_in_flight_items(resolver):
+    done, not_done = food_data._map_bounded(resolver["tracked"](0.02), [str(i) for i in range(6)], None)
+    assert sorted(future.result() for future in done) == [str(i) for i in range(6)]
+    assert not_done == []
+    assert resolver["peak"] == 2
+
+
+def test_map_bounded_stops_submitting_past_the_budget(resolver):
+    done, not_done = food_data._map_bounded(resolver["tracked"](0.2), list("abcdef"), 0.05)
+    assert done == {}
+    assert sorted(not_done) == list("abcdef")
+    time.sleep(0.25)
+    assert resolver["started"] == ["a", "b"]
+    assert food_data._resolve_stats["not_submitted"] == 4
+
+
+def test_resolve_looks_up_only_non_staples(resolver, monkeypatch):
+    def lookup(term):
+        if term == "falha":
+            raise ValueError("sem dados")
+        return None if term == "desconhecido" else np.array([100.0, 1.0, 2.0, 3.0])
+
+    monkeypatch.setattr(food_data, "_lookup_macros", lambda term, remote: resolver["tracked"](0.01, lookup)(term))
+    resolved = food_data.resolve_ingredient_macros(["arroz", "tofu", "falha", "desconhecido", "tofu", ""])
+    assert sorted(resolved) == ["arroz", "tofu"]
+    assert resolved["arroz"][0] == 130
+    assert sorted(resolver["started"]) == ["desconhecido", "falha", "tofu"]
+    assert food_data._resolve_stats["unresolved"] == 2
+
+
+def test_resolve_goes_local_only_without_budget_for_off(monkeypatch):
+    remotes = []
+    monkeypatch.setattr(food_data, "_lookup_macros", lambda term, remote: remotes.append(remote))
+    deadline = Deadline(food_data.OFF_TIMEOUT_SECONDS / 2)
+    food_data.resolve_ingredient_macros(["tofu"], deadline)
+    assert remotes == [False]
+    assert deadline.skipped == ["off_lookup"]
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    """
+    Food search cache backed by one SQLite file; `workers()` returns a fresh cache on the same file,
+    as another uvicorn worker would see it. OFF answers come from `state["answers"]`.
+    """
+    path = str(tmp_path / "food_search.sqlite3")
+    state = {"answers": {}, "calls": []}
+
+    def remote(query, page_size):
+        state["calls"].append(query)
+        answer = state["answers"][query]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def new_worker():
+        monkeypatch.setattr(food_data, "_search_cache", SQLiteCache(path, table="food_search"))
+
+    monkeypatch.setattr(food_data, "_search_foods_remote", remote)
+    monkeypatch.setattr(food_data, "_search_cache_stats", dict.fromkeys(food_data._search_cache_stats, 0))
+    new_worker()
+    state["new_worker"] = new_worker
+    return state
+
+
+RICE = ({"name": "Arroz", "calories_per_100g": 130.0, "protein_per_100g": 2.7, "carbs_per_100g": 28.2, "fat_per_100g": 0.3, "source": "openfoodfacts"},)
+
+
+def test_search_results_are_shared_between_workers(shared_cache):
+    shared_cache["answers"] = {"arroz": RICE}
+    assert food_data._search_foods_cached(" arroz ", 3) == RICE
+    shared_cache["new_worker"]()
+    assert food_data._search_foods_cached("ARROZ", 3) == RICE
+    assert food_data._search_foods_cached("arroz", 5) == RICE
+    assert shared_cache["calls"] == ["arroz", "arroz"]
+
+
+def test_empty_answers_and_timeouts_are_cached_briefly(shared_cache):
+    shared_cache["answers"] = {"xyz": (), "lento": requests.exceptions.Timeout("OFF")}
+    for _ in range(2):
+        assert food_data._search_foods_cached("xyz", 3) == ()
+        with pytest.raises(requests.exceptions.Timeout):
+            food_data._search_foods_cached("lento", 3)
+    assert shared_cache["calls"] == ["xyz", "lento"]
+    assert food_data._search_cache_stats == {"negative_hits": 1, "empty_stored": 1, "timeouts_stored": 1}
+
+
+def test_expired_negative_entries_are_retried(shared_cache):
+    shared_cache["answers"] = {"xyz": ()}
+    food_data._search_foods_cached("xyz", 3)
+    # The expiry stored in the entry is checked even while the backend still holds it
+    key = "xyz|3"
+    food_data._search_cache.set(key, {**food_data._search_cache.get(key), "until": time.time() - 1})
+    shared_cache["answers"] = {"xyz": RICE}
+    assert food_data._search_foods_cached("xyz", 3) == RICE
+
+
+def test_transient_failures_are_not_cached(shared_cache):
+    shared_cache["answers"] = {"arroz": None}
+    assert food_data._search_foods_cached("arroz", 3) == ()
+    shared_cache["answers"] = {"arroz": RICE}
+    assert food_data._search_foods_cached("arroz", 3) == RICE
@@ -0,0 +1,63 @@
+import pytest
+import food_suggest
+from food_suggest import SuggestIndex
+
+POPULAR = [
+    {"name": "Frango grelhado", "calories_per_100g": 165},
+    {"name": "Arroz branco cozido", "calories_per_100g": 130},
+    {"name": "Peito de frango", "calories_per_100g": 120},
+    {"name": "Arroz de pato", "calories_per_100g": 200},
+    {"name": "Maçã", "calories_per_100g": 52},
+]
+
+
+@pytest.fixture
+def popular(monkeypatch):
+    monkeypatch.setattr(food_suggest, "_popular_index", SuggestIndex(POPULAR))
+
+
+def _names(result):
+    return [item["name"] for item in result["items"]]
+
+
+def test_prefix_beats_word_prefix(popular):
+    assert _names(food_suggest.suggest("fran", remote=False)) == ["Frango grelhado", "Peito de frango"]
+
+
+def test_typos_still_match(popular):
+    assert "Frango grelhado" in _names(food_suggest.suggest("frnago grel", remote=False))
+
+
+def test_accents_are_ignored(popular):
+    assert _names(food_suggest.suggest("maca", remote=False)) == ["Maçã"]
+
+
+def test_history_ranks_first_and_dedupes(popular):
+    history = [{"name": "Arroz de pato", "calories_per_100g": 210}, {"name": "Arroz doce", "calories_per_100g": 180}]
+    names = _names(food_suggest.suggest("arroz", history=history, remote=False))
+    assert names[:2] == ["Arroz de pato", "Arroz doce"]
+    assert names.count("Arroz de pato") == 1
+
+
+def test_limit_and_empty_query(popular):
+    assert len(food_suggest.suggest("a", limit=1, remote=False)["items"]) <= 1
+    assert food_suggest.suggest("  ", remote=False) == {"query": "  ", "items": [], "remote_pending": False}
+
+
+def test_remote_results_are_merged(popular, monkeypatch):
+    monkeypatch.setattr(food_suggest, "_remote_foods", lambda query, limit: [{"name": "Frango do churrasco", "calories_per_100g": 200}])
+    result = food_suggest.suggest("frango")
+    assert _names(result)[-1] == "Frango do churrasco"
+    assert not result["remote_pending"]
+
+
+def test_pending_remote_results_are_reported(popular, monkeypatch):
+    monkeypatch.setattr(food_suggest, "_remote_foods", lambda query, limit: None)
+    assert food_suggest.suggest("frango")["remote_pending"]
+
+
+def test_etag_follows_history_version(popular):
+    first = food_suggest.etag("arroz", 8, False, (3, 10))
+    assert food_suggest.etag("Arroz ", 8, False, (3, 10)) == first
+    assert food_suggest.etag("arroz", 8, False, (4, 11)) != first
+    assert food_suggest.etag("arroz", 5, False, (3, 10)) != first
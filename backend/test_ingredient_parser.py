@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from ingredient_parser import STAPLE_MACROS, ParsedIngredient, line_macros, parse_line, staple_macros
+
+
+@pytest.mark.parametrize(
+    "line, term, grams",
+    [
+        ("200g arroz", "arroz", 200.0),
+        ("200 g de arroz", "arroz", 200.0),
+        ("1,5 kg de batatas", "batatas", 1500.0),
+        ("0.5 l leite", "leite", 500.0),
+        ("250 ml de leite magro", "leite", 250.0),
+        ("1/2 chávena de leite", "leite", 120.0),
+        ("1 1/2 chávenas de farinha", "farinha", 360.0),
+        ("½ chávena de açúcar", "açúcar", 120.0),
+        ("2 colheres de sopa de azeite", "azeite", 30.0),
+        ("1 colher de chá de canela", "canela", 5.0),
+        ("1 tbs olive oil", "olive oil", 15.0),
+        ("2 tbsp olive oil", "olive oil", 30.0),
+        ("1 tsp salt", "salt", 5.0),
+        ("3 dentes de alho", "alho", 15.0),
+        ("2 ovos", "ovos", 160.0),
+        ("2 ovos batidos", "ovos batidos", 160.0),
+        ("1 fatia de pão", "pão", 80.0),
+        ("2 unidades de tomate", "tomate", 160.0),
+        ("2 x 100g iogurte", "iogurte", 200.0),
+        ("2x125g iogurte natural", "iogurte", 250.0),
+        ("meia chávena de arroz", "arroz", 120.0),
+        ("duas colheres de sopa de mel", "mel", 30.0),
+        ("2 bananas", "bananas", 100.0),
+        ("banana", "banana", 100.0),
+        ("Frango (peito) sem pele", "frango peito", 100.0),
+    ],
+)
+def test_parse_line(line, term, grams):
+    assert parse_line(line) == ParsedIngredient(term, grams, False)
+
+
+@pytest.mark.parametrize("line, term", [("sal q.b.", "sal"), ("pimenta qb", "pimenta"), ("salsa a gosto", "salsa"), ("salt to taste", "salt")])
+def test_parse_line_to_taste(line, term):
+    assert parse_line(line) == ParsedIngredient(term, 0.0, True)
+
+
+@pytest.mark.parametrize(
+    "term, staple",
+    [
+        ("mel", "mel"),
+        ("mel de rosmaninho", "mel"),
+        ("cebolas", "cebola"),
+        ("tomates cherry", "tomate"),
+        ("pães", "pao"),
+        ("ovos batidos", "ovo"),
+        ("azeite virgem", "azeite"),
+        ("peito de frango", "frango"),
+        ("Salmão fumado", "salmao"),
+    ],
+)
+def test_staple_macros_matches_whole_words(term, staple):
+    assert staple_macros(term) == pytest.approx(np.array(STAPLE_MACROS[staple]))
+
+
+@pytest.mark.parametrize("term", ["melancia", "massapão", "arrozal", "cogumelos", ""])
+def test_staple_macros_ignores_substrings(term):
+    assert staple_macros(term) is None
+
+
+def test_line_macros_scales_by_grams():
+    parsed = [parse_line("200g arroz"), parse_line("sal q.b."), parse_line("100g desconhecido")]
+    table = line_macros(parsed, {"arroz": np.array([130.0, 2.7, 28.2, 0.3]), "sal": np.array([0.0, 0.0, 0.0, 0.0])})
+    assert table.shape == (3, 4)
+    assert table[0] == pytest.approx([260.0, 5.4, 56.4, 0.6])
+    assert not table[1:].any()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import auth
+import llm_client
+import main
+import models
+import negotiator
+import provider_health
+from model_router import ModelRouter
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-teste", "object": "chat.completion", "created": 0, "model": "modelo",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    }
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """
+    Pooled async clients talk to an in-process transport that answers after 100 ms with whatever
+    `state["reply"]` returns for the request body. Records the peak number of overlapping requests.
+    """
+    state = {"in_flight": 0, "peak": 0, "requests": [], "reply": lambda body: json.dumps({"ok": True})}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        state["requests"].append(body)
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.1)
+        state["in_flight"] -= 1
+        return httpx.Response(200, json=_completion(state["reply"](body)))
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://llm.local/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "modelo")
+    monkeypatch.setattr(llm_client, "_build_async_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm_client, "_async_client_registry", {})
+    monkeypatch.setattr(llm_client, "_response_cache", None)
+    monkeypatch.setattr(llm_client, "_router", ModelRouter())
+    monkeypatch.setattr(provider_health, "PROVIDER_HEALTH_SHARED", False)
+    monkeypatch.setattr(provider_health, "_breakers", {})
+    return state
+
+
+def test_concurrent_calls_overlap_on_one_event_loop(fake_api):
+    async def ask(text):
+        response = await llm_client.get_chat_completion_async([{"role": "user", "content": text}], profile="chat")
+        return response.choices[0].message.content
+
+    async def run():
+        return await asyncio.gather(*(ask(f"pergunta {i}") for i in range(4)))
+
+    assert asyncio.run(run()) == ['{"ok": true}'] * 4
+    # All four were waiting on the model at once instead of holding a worker thread each
+    assert fake_api["peak"] == 4
+    assert {body["max_tokens"] for body in fake_api["requests"]} == {llm_client.DEFAULT_LLM_PROFILES["chat"]["max_tokens"]}
+
+
+def test_analyze_mood_awaits_the_model(fake_api):
+    fake_api["reply"] = lambda body: json.dumps({
+        "mood_type": "stress", "empathy_message": "Compreendo.", "explanation": "x", "eating_strategy": "y",
+    })
+    result = asyncio.run(negotiator.analyze_mood("chocolate", "cansado"))
+    assert result.mood_type == "stress"
+    assert "chocolate" in fake_api["requests"][0]["messages"][-1]["content"]
+
+
+@pytest.fixture
+def api():
+    main.app.dependency_overrides[auth.get_current_user] = lambda: models.User(id=1, username="teste")
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def test_assistant_chat_endpoint(fake_api, api):
+    fake_api["reply"] = lambda body: json.dumps({"content": "Olá! Como posso ajudar?"})
+    response = api.post("/assistant/chat", json={"messages": [{"role": "user", "content": "olá"}]})
+    assert response.status_code == 200
+    assert response.json()["content"] == "Olá! Como posso ajudar?"
+
+
+def test_assistant_chat_reports_invalid_model_output(fake_api, api):
+    fake_api["reply"] = lambda body: "isto não é JSON"
+    response = api.post("/assistant/chat", json={"messages": [{"role": "user", "content": "olá"}]})
+    assert response.status_code == 500
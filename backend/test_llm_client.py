@@ -0,0 +1,173 @@
+from types import SimpleNamespace
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+import auth
+import llm_client
+import main
+import models
+import provider_health
+from cache_store import MemoryCache
+from model_router import ModelRouter
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(llm_client, "_client_registry", {})
+    monkeypatch.setattr(llm_client, "_async_client_registry", {})
+    monkeypatch.setattr(llm_client, "_client_stats", dict.fromkeys(llm_client._client_stats, 0))
+    yield
+    llm_client.close_clients()
+
+
+def test_clients_are_reused_per_base_url_and_key(registry):
+    first = llm_client.get_client("sk-a", "http://llm.local/v1")
+    assert llm_client.get_client("sk-a", "http://llm.local/v1/") is first
+    assert llm_client.get_client("sk-b", "http://llm.local/v1") is not first
+    assert llm_client.get_async_client("sk-a", "http://llm.local/v1") is llm_client.get_async_client("sk-a", "http://llm.local/v1")
+
+    stats = llm_client.get_client_stats()
+    assert stats["clients_created"] == 3
+    assert stats["client_reuses"] == 2
+    assert stats["pooled_clients"] == 3
+
+
+def test_client_config_shares_the_pooled_client(registry, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://llm.local/v1")
+    monkeypatch.setenv("OPENAI_MODEL", "modelo")
+    client, model = llm_client.get_client_config()
+    assert model == "modelo"
+    assert llm_client.get_client_config()[0] is client
+    assert client.max_retries == llm_client.LLM_MAX_RETRIES
+
+
+@pytest.fixture
+def api():
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def _login_as(username):
+    main.app.dependency_overrides[auth.get_current_user] = lambda: models.User(id=1, username=username)
+
+
+@pytest.mark.parametrize("path", ["/metrics/llm", "/health/providers", "/metrics/coalescing", "/metrics/foods"])
+def test_metrics_require_login(api, path):
+    assert api.get(path).status_code == 401
+
+
+def test_metrics_allow_list(api, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_ALLOWED_USERS", {"admin"})
+    _login_as("teste")
+    assert api.get("/metrics/coalescing").status_code == 403
+    _login_as("admin")
+    assert api.get("/metrics/coalescing").status_code == 200
+
+
+def test_metrics_open_to_any_user_without_allow_list(api, monkeypatch):
+    monkeypatch.setattr(auth, "METRICS_ALLOWED_USERS", set())
+    _login_as("teste")
+    response = api.get("/metrics/llm")
+    assert response.status_code == 200
+    assert "clients_created" in response.json()
+
+
+def _client_for(base_url):
+    return SimpleNamespace(base_url=httpx.URL(base_url))
+
+
+OPENAI = _client_for("https://api.openai.com/v1")
+GROQ = _client_for(llm_client.GROQ_BASE_URL)
+
+
+@pytest.mark.parametrize(
+    "profile, client, expected",
+    [
+        ("classify", OPENAI, {"model": "padrao", "max_tokens": 16, "timeout": 10}),
+        ("classify", GROQ, {"model": "llama-3.1-8b-instant", "max_tokens": 16, "timeout": 10}),
+        ("vision", GROQ, {"model": "meta-llama/llama-4-scout-17b-16e-instruct", "max_tokens": 1200, "timeout": 60}),
+        ("chat", GROQ, {"model": "padrao", "max_tokens": 500, "timeout": 30}),
+        ("desconhecido", GROQ, {"model": "padrao", "max_tokens": None, "timeout": None}),
+    ],
+)
+def test_resolve_profile(profile, client, expected, monkeypatch):
+    monkeypatch.setattr(llm_client, "_tier_models", {})
+    assert llm_client.resolve_profile(profile, client, "padrao") == expected
+
+
+def test_profiles_env_overrides(monkeypatch):
+    monkeypatch.setenv("LLM_PROFILE_EXTRACT_JSON_MAX_TOKENS", "42")
+    monkeypatch.setenv("LLM_TIER_FAST_MODEL", "mini")
+    profiles, tiers = llm_client._load_profiles()
+    assert profiles["extract-json"]["max_tokens"] == 42
+    assert tiers["fast"] == "mini"
+    monkeypatch.setattr(llm_client, "_profiles", profiles)
+    monkeypatch.setattr(llm_client, "_tier_models", tiers)
+    assert llm_client.resolve_profile("classify", OPENAI, "padrao")["model"] == "mini"
+
+
+@pytest.mark.parametrize("requested, expected", [(500, 16), (None, 16), (8, 8)])
+def test_prepare_call_caps_max_tokens(requested, expected, monkeypatch):
+    monkeypatch.setattr(llm_client, "_tier_models", {})
+    assert llm_client._prepare_call(OPENAI, "padrao", "classify", requested) == ("padrao", expected, 10)
+    assert llm_client._prepare_call(OPENAI, "padrao", None, requested) == ("padrao", requested, None)
+
+
+def test_images_count_per_image_and_skip_text_fallbacks(monkeypatch):
+    monkeypatch.setattr(provider_health, "PROVIDER_HEALTH_SHARED", False)
+    monkeypatch.setattr(llm_client, "_router", ModelRouter())
+    image = {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 400_000}}
+    messages = [{"role": "user", "content": [{"type": "text", "text": "o que é isto?"}, image]}]
+
+    estimate = llm_client._estimate_tokens(messages, 100)
+    assert llm_client.LLM_IMAGE_TOKEN_ESTIMATE + 100 < estimate < llm_client.LLM_IMAGE_TOKEN_ESTIMATE + 200
+
+    models, _, _ = llm_client._route(GROQ, "llama-3.3-70b-versatile", messages, 100)
+    assert models == ["llama-3.3-70b-versatile"]
+    text_only, _, _ = llm_client._route(GROQ, "llama-3.3-70b-versatile", [{"role": "user", "content": "olá"}], 100)
+    assert text_only[0] == "llama-3.3-70b-versatile" and len(text_only) == 3
+
+
+def test_cache_key_ignores_dict_order_but_not_content():
+    messages = [{"role": "user", "content": "olá"}]
+    key = llm_client._cache_key("modelo", messages, {"type": "json_object"}, 100)
+    assert key == llm_client._cache_key("modelo", [{"content": "olá", "role": "user"}], {"type": "json_object"}, 100)
+    assert key != llm_client._cache_key("outro", messages, {"type": "json_object"}, 100)
+    assert key != llm_client._cache_key("modelo", messages, {"type": "json_object"}, 200)
+    assert key != llm_client._cache_key("modelo", messages, {"type": "json_object"}, 100, {"seed": 1})
+
+
+@pytest.mark.parametrize(
+    "temperature, cache, expected",
+    [(0.2, None, True), (0.9, None, False), (0.9, True, True), (0.0, False, False)],
+)
+def test_should_cache_policy(temperature, cache, expected, monkeypatch):
+    monkeypatch.setattr(llm_client, "_response_cache", MemoryCache())
+    monkeypatch.setattr(llm_client, "LLM_CACHE_MAX_TEMPERATURE", 0.3)
+    assert llm_client._should_cache(temperature, cache) is expected
+
+
+def test_deterministic_completion_is_served_from_cache(registry, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={
+            "id": "chatcmpl-teste", "object": "chat.completion", "created": 0, "model": "modelo",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "42"}}],
+        })
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://llm.local/v1")
+    monkeypatch.setattr(llm_client, "_build_http_client", lambda: httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm_client, "_response_cache", MemoryCache())
+    monkeypatch.setattr(llm_client, "_router", ModelRouter())
+    monkeypatch.setattr(provider_health, "PROVIDER_HEALTH_SHARED", False)
+
+    messages = [{"role": "user", "content": "quanto é 6 x 7?"}]
+    for _ in range(2):
+        assert llm_client.get_chat_completion(messages, temperature=0).choices[0].message.content == "42"
+    assert len(calls) == 1
+    llm_client.get_chat_completion(messages, temperature=0.9)
+    assert len(calls) == 2
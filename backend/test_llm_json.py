@@ -0,0 +1,78 @@
+import pytest
+import llm_json
+from llm_json import coerce_nutrition, coerce_recipe, parse_object, repair_json
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ("```\n{\"a\": 1}", {"a": 1}),
+        ('Aqui está a receita: {"a": 1} Bom apetite!', {"a": 1}),
+        ("{'title': 'Bacalhau', 'ok': True, 'x': None}", {"title": "Bacalhau", "ok": True, "x": None}),
+        ("{'title': 'Arroz d'avó'}", {"title": "Arroz d'avó"}),
+        ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+        ('{"steps": ["Cortar", "Cozer"], "title": "Sopa', {"steps": ["Cortar", "Cozer"], "title": None}),
+        ('{"ingredients": ["100g arroz", "50g fei', {"ingredients": ["100g arroz"]}),
+        ('{"a": 1, "b": {"c": [1, 2', {"a": 1, "b": {"c": [1, 2]}}),
+        ('{"a": 1, "b":', {"a": 1, "b": None}),
+        ('{"message": "linha 1\nlinha 2"}', {"message": "linha 1\nlinha 2"}),
+        ('[{"a": 1}, {"a": 2', [{"a": 1}, {"a": 2}]),
+        ('{"a": "x"} {"b": 2}', {"a": "x"}),
+    ],
+)
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "sem json nenhum", "```\n```"])
+def test_repair_json_gives_up(text):
+    assert repair_json(text) is None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("{message: Olá mundo}", None),
+        ('{"a": é}', None),
+        ('{"a": 1, b: ção}', {"a": 1}),
+        ('{"a": "x", "b": Não}', {"a": "x"}),
+    ],
+)
+def test_unquoted_non_ascii_words_do_not_raise(text, expected):
+    # None sends the caller to its strict retry instead of a 500
+    assert parse_object(text, "test_unicode") == expected
+
+
+def test_repair_json_drops_a_cut_off_key():
+    assert repair_json('{"a') == {}
+
+
+def test_parse_object_counts_clean_and_repaired_replies():
+    assert parse_object('{"a": 1}', "test_site") == {"a": 1}
+    assert parse_object("{'a': 1,}", "test_site") == {"a": 1}
+    assert parse_object("nada", "test_site") is None
+    stats = llm_json.get_stats()["test_site"]
+    assert (stats["clean"], stats["repaired"], stats["unrepairable"]) == (1, 1, 1)
+
+
+def test_coerce_recipe_flattens_model_shapes():
+    recipe = coerce_recipe({
+        "name": "Frango grelhado",
+        "calories": "450 kcal",
+        "time_minutes": "25 min",
+        "ingredients": [{"nome": "frango", "quantidade": "200g"}, "1 limão"],
+        "steps": [{"passo": "Temperar"}, {"descricao": "Grelhar"}],
+    })
+    assert recipe["title"] == "Frango grelhado"
+    assert recipe["calories"] == 450
+    assert recipe["time_minutes"] == 25
+    assert recipe["ingredients"] == ["200g frango", "1 limão"]
+    assert recipe["steps"] == ["Temperar", "Grelhar"]
+
+
+def test_coerce_nutrition_clamps_numbers():
+    assert coerce_nutrition({"calories": "-10", "protein": "12,5 g", "fat": True}, "Refeição") == {
+        "name": "Refeição", "calories": 0, "protein": 12.5, "carbs": 0.0, "fat": 0.0, "estimated_grams": 0,
+    }
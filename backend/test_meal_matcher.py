@@ -0,0 +1,40 @@
+from meal_matcher import PatternMatcher, prepare_meal, score_meals
+
+
+def _meal(meal_id, name, *ingredients):
+    meal = {"idMeal": meal_id, "strMeal": name}
+    for i, ingredient in enumerate(ingredients, start=1):
+        meal[f"strIngredient{i}"] = ingredient
+        meal[f"strMeasure{i}"] = "1 cup"
+    return meal
+
+
+def test_pattern_matcher_finds_overlapping_patterns():
+    matcher = PatternMatcher(["he", "she", "hers", "his", ""])
+    assert matcher.find("ushers") == {"he", "she", "hers"}
+    assert matcher.find("xyz") == set()
+
+
+def test_mealdb_meals_are_prepared_once():
+    first = prepare_meal(_meal("52772", "Teriyaki Chicken", "chicken"))
+    assert prepare_meal(_meal("52772", "Teriyaki Chicken", "chicken")) is first
+
+
+def test_edited_user_recipes_are_not_served_stale():
+    before = prepare_meal(_meal("recipe-7", "Sopa de legumes", "cenoura"))
+    after = prepare_meal(_meal("recipe-7", "Sopa de legumes", "cenoura", "abobora"))
+    assert before.ingredients == ["1 cup cenoura"]
+    assert after.ingredients == ["1 cup cenoura", "1 cup abobora"]
+
+
+def test_score_meals_ranks_and_filters_allergens():
+    meals = [
+        _meal("1", "Chicken Curry", "chicken", "rice"),
+        _meal("2", "Chicken Soup", "chicken"),
+        _meal("3", "Peanut Chicken", "chicken", "peanut butter"),
+        _meal("4", "Beef Stew", "beef"),
+    ]
+    scored = score_meals(meals, ["chicken", "rice"], ["peanut"], query="chicken curry", boosts={"2": 0.5})
+    assert [prepared.meal_id for _, _, prepared in scored] == ["1", "2"]
+    assert scored[0][0] == 23
+    assert score_meals(meals, [], []) == []
@@ -0,0 +1,84 @@
+import pytest
+import mealdb_mirror
+from sqlite_fts import LocalSearchDB
+
+
+def _meal(meal_id, name, *ingredients):
+    meal = {"idMeal": meal_id, "strMeal": name}
+    for i, ingredient in enumerate(ingredients, start=1):
+        meal[f"strIngredient{i}"] = ingredient
+    return meal
+
+
+CATALOGUE = {
+    "b": [_meal("1", "Beef Stew", "Beef", "Olive Oil")],
+    "c": [_meal("2", "Chicken Curry", "Chicken Breast", "Rice"), _meal("3", "Crème Brûlée", "Cream", "Sugar")],
+    "t": [_meal("4", "Teriyaki Chicken", "Chicken", "Soy Sauce")],
+}
+
+
+def _fetch(catalogue, fail_on=None):
+    def fetch_json(url):
+        letter = url.rsplit("=", 1)[1]
+        if letter == fail_on:
+            raise OSError("timeout")
+        return {"meals": catalogue.get(letter)}
+    return fetch_json
+
+
+def _names(meals):
+    return sorted(meal["strMeal"] for meal in meals)
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    path = str(tmp_path / "mirror.sqlite3")
+    monkeypatch.setattr(mealdb_mirror, "MEALDB_MIRROR_PATH", path)
+    monkeypatch.setattr(mealdb_mirror, "_db", LocalSearchDB(path))
+    return mealdb_mirror
+
+
+def test_sync_and_search(mirror):
+    assert not mirror.is_available()
+    assert mirror.sync_mirror(_fetch(CATALOGUE)) == 4
+    assert mirror.is_available()
+    assert _names(mirror.search_by_name("chicken")) == ["Chicken Curry", "Teriyaki Chicken"]
+    assert _names(mirror.search_by_name("chick cur")) == ["Chicken Curry"]
+    assert _names(mirror.search_by_name("creme brulee")) == ["Crème Brûlée"]
+    assert mirror.search_by_name("  ") == []
+    assert mirror.get_meal("3")["strMeal"] == "Crème Brûlée"
+    assert mirror.get_meal("99") is None
+    assert mirror.stats()["meals"] == 4
+
+
+@pytest.mark.parametrize(
+    "term, names",
+    [
+        ("chicken", ["Chicken Curry", "Teriyaki Chicken"]),
+        ("olive oil", ["Beef Stew"]),
+        ("oil olive", ["Beef Stew"]),
+        ("olive rice", []),
+        ("tofu", []),
+    ],
+)
+def test_search_by_ingredient(mirror, term, names):
+    mirror.sync_mirror(_fetch(CATALOGUE))
+    assert _names(mirror.search_by_ingredient(term)) == names
+
+
+def test_name_search_without_fts(mirror):
+    mirror.sync_mirror(_fetch(CATALOGUE))
+    mirror._db.fts_enabled = False
+    assert _names(mirror.search_by_name("chicken")) == ["Chicken Curry", "Teriyaki Chicken"]
+    assert _names(mirror.search_by_name("brulee")) == ["Crème Brûlée"]
+
+
+def test_failed_letter_keeps_existing_mirror(mirror):
+    mirror.sync_mirror(_fetch(CATALOGUE))
+    smaller = {"b": CATALOGUE["b"]}
+    assert mirror.sync_mirror(_fetch(smaller, fail_on="m")) == 0
+    assert mirror.stats()["meals"] == 4
+    assert mirror.sync_mirror(_fetch({})) == 0
+    assert mirror.stats()["meals"] == 4
+    assert mirror.sync_mirror(_fetch(smaller)) == 1
+    assert mirror.search_by_name("chicken") == []
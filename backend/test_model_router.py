@@ -0,0 +1,73 @@
+import time
+import pytest
+from circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN
+from model_router import ModelRouter, ModelsUnavailableError, parse_reset_duration
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        ("7.66s", 7.66),
+        ("2m59.56s", 179.56),
+        ("1h2m", 3720.0),
+        ("250ms", 0.25),
+        ("12", 12.0),
+        ("", None),
+        (None, None),
+        ("soon", None),
+    ],
+)
+def test_parse_reset_duration(value, seconds):
+    if seconds is None:
+        assert parse_reset_duration(value) is None
+    else:
+        assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker("x", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker("x", failure_threshold=1, recovery_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_router_skips_a_rate_limited_model():
+    router = ModelRouter()
+    router.record_rate_limited("large", {"retry-after": "30"})
+    assert router.order(["large", "fast"], 100) == ["fast", "large"]
+    assert router.stats()["proactive_skips"] == 1
+
+
+def test_router_prefers_models_with_token_budget():
+    router = ModelRouter()
+    router.record_success("large", {"x-ratelimit-remaining-tokens": "50", "x-ratelimit-reset-tokens": "10s"})
+    assert router.order(["large", "fast"], 500) == ["fast", "large"]
+    assert router.order(["large", "fast"], 10) == ["large", "fast"]
+
+
+def test_router_leaves_out_open_breakers():
+    router = ModelRouter(failure_threshold=1, recovery_timeout=60)
+    router.record_failure("large")
+    assert router.order(["large", "fast"], 10) == ["fast"]
+    router.record_failure("fast")
+    with pytest.raises(ModelsUnavailableError):
+        router.order(["large", "fast"], 10)
+    assert not router.has_headroom(1, 1)
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+import pytest
+import negotiator
+import schemas
+from cache_store import MemoryCache
+from deadline import Deadline
+
+RECIPE = {"title": "Chicken Curry", "calories": 600, "time_minutes": 35, "ingredients": ["1 lb chicken", "2 cups rice"], "steps": ["Cook."]}
+
+
+def _reply(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Replaces the model for the negotiator; `state["content"]` is the reply, calls are recorded."""
+    state = {"calls": [], "content": ""}
+
+    async def completion(messages, **kwargs):
+        state["calls"].append(kwargs.get("profile"))
+        return _reply(state["content"])
+
+    monkeypatch.setattr(negotiator, "get_chat_completion_async", completion)
+    monkeypatch.setattr(negotiator, "_translated_meal_cache", MemoryCache())
+    return state
+
+
+TRANSLATION = json.dumps({
+    "title": "Caril de frango",
+    "ingredients": [{"name": "frango", "quantity": 150, "unit": "g"}, {"name": "arroz", "quantity": 70.5, "unit": "g"}, {"name": "sal", "quantity": None, "unit": "q.b."}],
+    "steps": ["Cozinhar."],
+})
+
+
+def test_translate_and_portion_in_one_call(fake_llm):
+    fake_llm["content"] = TRANSLATION
+    result = asyncio.run(negotiator._translate_and_portion_recipe(dict(RECIPE), "52795"))
+    assert result["title"] == "Caril de frango"
+    assert result["ingredients"] == ["150 g frango", "70.5 g arroz", "sal q.b."]
+    assert result["ingredient_quantities"][0] == {"name": "frango", "quantity": 150.0, "unit": "g"}
+    assert result["calories"] == 600
+    assert fake_llm["calls"] == ["extract-json"]
+
+
+def test_translation_is_cached_per_mealdb_id_only(fake_llm):
+    fake_llm["content"] = TRANSLATION
+    for _ in range(2):
+        asyncio.run(negotiator._translate_and_portion_recipe(dict(RECIPE), "52795"))
+    assert len(fake_llm["calls"]) == 1
+    for _ in range(2):
+        asyncio.run(negotiator._translate_and_portion_recipe(dict(RECIPE), "recipe-3"))
+    assert len(fake_llm["calls"]) == 3
+
+
+@pytest.mark.parametrize("content", ["não é JSON", json.dumps({"title": "x", "ingredients": []})])
+def test_unusable_translation_keeps_the_original(fake_llm, content):
+    fake_llm["content"] = content
+    assert asyncio.run(negotiator._translate_and_portion_recipe(dict(RECIPE), "52795")) == RECIPE
+    assert len(negotiator._translated_meal_cache) == 0
+
+
+def test_translation_skipped_without_budget(fake_llm):
+    deadline = Deadline(negotiator.NEGOTIATOR_TRANSLATE_MIN_SECONDS / 2)
+    assert asyncio.run(negotiator._translate_and_portion_recipe(dict(RECIPE), "52795", deadline)) == RECIPE
+    assert fake_llm["calls"] == []
+    assert deadline.skipped == ["translation", "portion_normalization"]
+
+
+@pytest.fixture
+def fake_mealdb(monkeypatch):
+    """
+    MealDB stand-in for the live fan-out: `state["search"]` / `state["filter"]` map a query to meal ids,
+    `state["slow"]` holds queries that answer after 0.5 s. Records every lookup.php id.
+    """
+    state = {"search": {}, "filter": {}, "slow": set(), "lookups": []}
+
+    def fetch(url):
+        kind, query = ("search" if "search.php" in url else "filter"), url.rsplit("=", 1)[1].replace("+", " ")
+        if query in state["slow"]:
+            time.sleep(0.5)
+        return {"meals": [{"idMeal": meal_id, "strMeal": f"{kind} {meal_id}"} for meal_id in state[kind].get(query, [])] or None}
+
+    def details(meal_id):
+        state["lookups"].append(meal_id)
+        return {"idMeal": meal_id, "strMeal": f"lookup {meal_id}"}
+
+    monkeypatch.setattr(negotiator, "_safe_fetch_json", fetch)
+    monkeypatch.setattr(negotiator, "_get_meal_details", details)
+    return state
+
+
+def test_fanout_keeps_sequential_order(fake_mealdb):
+    fake_mealdb["search"] = {"frango": ["1"], "chicken": ["2", "1"]}
+    fake_mealdb["filter"] = {"frango": [], "chicken": ["3", "2", "4"]}
+    meals = negotiator._live_candidate_meals(["frango", "chicken"], ["frango", "chicken"])
+    assert [meal["strMeal"] for meal in meals] == ["search 1", "search 2", "lookup 3", "lookup 4"]
+    # Filter hits already returned in full by search.php are not looked up again
+    assert sorted(fake_mealdb["lookups"]) == ["3", "4"]
+
+
+def test_fanout_caps_lookups(fake_mealdb):
+    fake_mealdb["filter"] = {"rice": [str(i) for i in range(40)]}
+    meals = negotiator._live_candidate_meals([], ["rice"])
+    assert len(meals) == negotiator.MEALDB_MAX_LOOKUPS
+    assert len(fake_mealdb["lookups"]) == negotiator.MEALDB_MAX_LOOKUPS
+
+
+def test_fanout_returns_what_arrived_within_budget(fake_mealdb, monkeypatch):
+    monkeypatch.setattr(negotiator, "MEALDB_SEARCH_BUDGET_SECONDS", 0.2)
+    fake_mealdb["search"] = {"lento": ["1"], "rapido": ["2"]}
+    fake_mealdb["slow"] = {"lento"}
+    started = time.perf_counter()
+    meals = negotiator._live_candidate_meals(["lento", "rapido"], [])
+    assert time.perf_counter() - started < 0.45
+    assert [meal["idMeal"] for meal in meals] == ["2"]
+    last = negotiator.get_mealdb_stats()["last"]
+    assert last["timed_out"] and last["unfinished"] == 1
+
+
+def test_fanout_budget_follows_the_request_deadline(fake_mealdb):
+    fake_mealdb["search"] = {"lento": ["1"]}
+    fake_mealdb["slow"] = {"lento"}
+    deadline = Deadline(0.1)
+    assert negotiator._live_candidate_meals(["lento"], [], deadline) == []
+    assert deadline.skipped == ["mealdb_search"]
+
+
+@pytest.fixture
+def http_cache(monkeypatch):
+    """Fresh MealDB HTTP cache whose network fetch answers from `state["answers"]` and counts calls."""
+    state = {"answers": {}, "fetches": []}
+
+    def fetch(url):
+        state["fetches"].append(url)
+        answer = state["answers"][url]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(negotiator, "_fetch_json_limited", fetch)
+    monkeypatch.setattr(negotiator, "_http_cache", MemoryCache())
+    monkeypatch.setattr(negotiator, "_http_stats", dict.fromkeys(negotiator._http_stats, 0))
+    return state
+
+
+LOOKUP_URL = f"{negotiator.MEALDB_BASE_URL}/lookup.php?i=1"
+SEARCH_URL = f"{negotiator.MEALDB_BASE_URL}/search.php?s=frango"
+
+
+def test_http_ttl_per_endpoint():
+    assert negotiator._http_ttl(LOOKUP_URL, {"meals": [{}]}) == negotiator.MEALDB_HTTP_LOOKUP_TTL_SECONDS
+    assert negotiator._http_ttl(SEARCH_URL, {"meals": [{}]}) == negotiator.MEALDB_HTTP_SEARCH_TTL_SECONDS
+    assert negotiator._http_ttl(SEARCH_URL, {"meals": None}) == negotiator.MEALDB_HTTP_NEGATIVE_TTL_SECONDS
+
+
+def test_http_cache_serves_fresh_and_empty_answers(http_cache):
+    http_cache["answers"] = {LOOKUP_URL: {"meals": [{"idMeal": "1"}]}, SEARCH_URL: {"meals": None}}
+    for _ in range(2):
+        assert negotiator._safe_fetch_json(LOOKUP_URL) == {"meals": [{"idMeal": "1"}]}
+        assert negotiator._safe_fetch_json(SEARCH_URL) == {"meals": None}
+    assert len(http_cache["fetches"]) == 2
+    assert negotiator._http_stats["fresh_hits"] == 2
+    assert negotiator._http_stats["negative_stored"] == 1
+
+
+def test_http_errors_are_not_cached(http_cache):
+    http_cache["answers"] = {SEARCH_URL: OSError("sem rede")}
+    assert negotiator._safe_fetch_json(SEARCH_URL) == {}
+    http_cache["answers"] = {SEARCH_URL: {"meals": [{"idMeal": "2"}]}}
+    assert negotiator._safe_fetch_json(SEARCH_URL) == {"meals": [{"idMeal": "2"}]}
+    assert len(http_cache["fetches"]) == 2
+
+
+def test_stale_entry_is_served_while_revalidating(http_cache):
+    old = {"meals": [{"idMeal": "1", "strMeal": "antigo"}]}
+    new = {"meals": [{"idMeal": "1", "strMeal": "novo"}]}
+    negotiator._http_cache.set(LOOKUP_URL, {"data": old, "fetched_at": time.time() - 10, "ttl": 5})
+    http_cache["answers"] = {LOOKUP_URL: new}
+
+    assert negotiator._safe_fetch_json(LOOKUP_URL) == old
+    for _ in range(50):
+        if negotiator._http_stats["revalidated"]:
+            break
+        time.sleep(0.01)
+    assert negotiator._http_stats["stale_hits"] == 1
+    assert negotiator._safe_fetch_json(LOOKUP_URL) == new
+    assert http_cache["fetches"] == [LOOKUP_URL]
+
+
+def _response(title, craving="frango"):
+    recipe = schemas.NegotiatorRecipe(title=title, calories=500, time_minutes=30, ingredients=["frango"], steps=["Cozinhar."])
+    return schemas.NegotiatorResponse(original_craving=craving, message="ok", recipe=recipe)
+
+
+@pytest.fixture
+def race(monkeypatch):
+    """
+    Both negotiator paths replaced by fakes: each waits `state[<path>]["delay"]`, records the skips in
+    `state[<path>]["skip"]` on its deadline, then returns its recipe (None/exception for MealDB if set).
+    """
+    state = {
+        "mealdb": {"delay": 0, "result": _response("Receita MealDB"), "skip": [], "cancelled": False},
+        "generated": {"delay": 0, "result": _response("Receita gerada"), "skip": [], "cancelled": False},
+    }
+
+    async def run(name, deadline):
+        branch = state[name]
+        try:
+            await asyncio.sleep(branch["delay"])
+        except asyncio.CancelledError:
+            branch["cancelled"] = True
+            raise
+        for stage in branch["skip"]:
+            deadline.skip(stage)
+        if isinstance(branch["result"], Exception):
+            raise branch["result"]
+        return branch["result"]
+
+    async def api_first(craving, target_calories, allergens, plan_goal, on_stage=None, deadline=None):
+        return await run("mealdb", deadline)
+
+    async def generate(craving, target_calories, mood, favorite_recipes, allergens, plan_goal, daily_target_calories, deadline=None):
+        return await run("generated", deadline)
+
+    monkeypatch.setattr(negotiator, "_try_recipe_api_first", api_first)
+    monkeypatch.setattr(negotiator, "_generate_recipe_response", generate)
+    monkeypatch.setattr(negotiator, "NEGOTIATOR_MEALDB_WINDOW_SECONDS", 0.1)
+    monkeypatch.setattr(negotiator, "_speculation_stats", dict.fromkeys(negotiator._speculation_stats, 0))
+    return state
+
+
+def _speculate(deadline=None):
+    async def run():
+        response = await negotiator._negotiate_speculative("frango", 600, None, [], [], None, None, deadline or Deadline(5))
+        # Let the cancelled branch observe its cancellation
+        await asyncio.sleep(0.01)
+        return response
+    return asyncio.run(run())
+
+
+def test_mealdb_within_window_cancels_generation(race):
+    race["generated"]["delay"] = 1
+    race["mealdb"]["skip"] = ["translation"]
+    race["generated"]["skip"] = ["ai_calorie_estimate"]
+    deadline = Deadline(5)
+    assert _speculate(deadline).recipe.title == "Receita MealDB"
+    assert race["generated"]["cancelled"]
+    assert deadline.skipped == ["translation"]
+    assert negotiator._speculation_stats["mealdb_wins"] == 1
+    assert negotiator._speculation_stats["cancelled_generated"] == 1
+
+
+def test_slow_mealdb_is_cancelled_for_generation(race):
+    race["mealdb"]["delay"] = 1
+    race["mealdb"]["skip"] = ["translation"]
+    deadline = Deadline(5)
+    assert _speculate(deadline).recipe.title == "Receita gerada"
+    assert race["mealdb"]["cancelled"]
+    assert deadline.skipped == []
+    assert negotiator._speculation_stats["mealdb_timeouts"] == 1
+    assert negotiator._speculation_stats["cancelled_mealdb"] == 1
+
+
+@pytest.mark.parametrize("result", [None, RuntimeError("MealDB em baixo")])
+def test_mealdb_miss_or_error_falls_back_to_generation(race, result):
+    race["mealdb"]["result"] = result
+    race["generated"]["delay"] = 0.05
+    assert _speculate().recipe.title == "Receita gerada"
+    assert not race["generated"]["cancelled"]
+    assert negotiator._speculation_stats["generated_wins"] == 1
+
+
+def test_result_cache_key_buckets():
+    key = negotiator._result_cache_key("Frango Assado!", 640, None, ["Leite", "amendoim", ""], 2130)
+    assert key == "frango assado|600|maintain|amendoim,leite|2250"
+    assert negotiator._result_cache_key("frango  assado", 560, "maintain", ["amendoim", "leite"], 2200) == key
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Result pool of two variants in memory; generation returns the titles of `titles` in turn."""
+    titles = []
+
+    async def uncached(craving, *args):
+        deadline = args[-1]
+        title = titles.pop(0)
+        if title == "degradada":
+            deadline.skip("translation")
+        return _response(title, craving)
+
+    monkeypatch.setattr(negotiator, "_negotiate_uncached", uncached)
+    monkeypatch.setattr(negotiator, "_result_cache", MemoryCache())
+    monkeypatch.setattr(negotiator, "NEGOTIATOR_CACHE_VARIANTS", 2)
+    monkeypatch.setattr(negotiator, "NEGOTIATOR_CACHE_ROTATION", "round_robin")
+    monkeypatch.setattr(negotiator, "_result_cache_stats", dict.fromkeys(negotiator._result_cache_stats, 0))
+    return titles
+
+
+def _negotiate(craving="frango", **kwargs):
+    response = asyncio.run(negotiator.negotiate_craving(craving, 600, **kwargs))
+    return response.recipe.title
+
+
+def test_pool_fills_with_distinct_variants_then_rotates(pool):
+    pool.extend(["Frango assado", "FRANGO ASSADO", "degradada", "Caril de frango"])
+    assert [_negotiate() for _ in range(4)] == ["Frango assado", "FRANGO ASSADO", "degradada", "Caril de frango"]
+    assert negotiator._result_cache_stats["duplicates_skipped"] == 1
+    assert negotiator.cached_variant_count("frango", 600, None, []) == 2
+
+    assert [_negotiate() for _ in range(3)] == ["Frango assado", "Caril de frango", "Frango assado"]
+    assert asyncio.run(negotiator.negotiate_craving("Frango!", 620)).original_craving == "Frango!"
+    assert pool == []
+
+
+def test_personalised_requests_bypass_the_pool(pool):
+    pool.extend(["A", "B", "C", "D", "E"])
+    _negotiate(mood="triste")
+    _negotiate(favorite_recipes=[schemas.Recipe(id=1, name="Sopa", ingredients="", instructions="")])
+    assert negotiator.cached_variant_count("frango", 600, None, []) == 0
+    assert negotiator._result_cache_stats["personalised_bypass"] == 2
+    _negotiate()
+    _negotiate()
+    assert _negotiate() == "C"
+    assert _negotiate(mood="feliz") == "E"
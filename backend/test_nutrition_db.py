@@ -0,0 +1,74 @@
+import gzip
+import json
+import pytest
+import food_data
+import nutrition_db
+from sqlite_fts import LocalSearchDB
+
+PRODUCTS = [
+    {"code": "1", "product_name": "Arroz agulha", "brands": "Cigala,Outra", "unique_scans_n": 50,
+     "countries_tags": ["en:portugal"], "nutriments": {"energy-kcal_100g": 350, "proteins_100g": 7}},
+    {"code": "2", "product_name_pt": "Arroz carolino", "product_name": "Carolino rice", "unique_scans_n": 500,
+     "countries_tags": ["en:portugal"], "nutriments": {"energy_100g": 1464.4}},
+    {"code": "3", "product_name": "Rice crackers", "countries_tags": ["en:spain"], "nutriments": {"energy-kcal_100g": 390}},
+    {"code": "4", "product_name": "", "countries_tags": ["en:portugal"], "nutriments": {"energy-kcal_100g": 100}},
+    {"code": "5", "product_name": "Arroz estragado", "countries_tags": ["en:portugal"], "nutriments": {"energy-kcal_100g": 5000}},
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "nutrition.sqlite3")
+    monkeypatch.setattr(nutrition_db, "NUTRITION_DB_PATH", path)
+    monkeypatch.setattr(nutrition_db, "_db", LocalSearchDB(path))
+    return tmp_path
+
+
+def _dump(tmp_path):
+    path = str(tmp_path / "off.jsonl.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("não é json\n")
+        for product in PRODUCTS:
+            f.write(json.dumps(product) + "\n")
+    return path
+
+
+def _names(foods):
+    return [food["name"] for food in foods]
+
+
+def test_generics_come_from_the_csv_without_an_imported_db(db):
+    assert not nutrition_db.is_available()
+    assert nutrition_db.search("arroz") == []
+    foods = nutrition_db.popular_foods(10)
+    assert "Arroz branco cozido" in _names(foods)
+    assert {food["source"] for food in foods} == {nutrition_db.GENERIC_SOURCE}
+
+
+def test_off_import_filters_and_converts(db):
+    assert nutrition_db.import_off_dump(_dump(db), country="portugal") == 2
+    foods = {food["name"]: food for food in nutrition_db.search("arroz")}
+    assert set(foods) == {"Arroz agulha (Cigala)", "Arroz carolino"}
+    assert foods["Arroz carolino"]["calories_per_100g"] == 350.0
+    assert nutrition_db.import_off_dump(_dump(db)) == 3
+
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_search_ranks_generics_then_popularity(db, fts):
+    nutrition_db.import_off_dump(_dump(db), country="portugal")
+    assert nutrition_db.import_generic_foods() == nutrition_db.import_generic_foods()
+    nutrition_db._db.fts_enabled = fts
+    names = _names(nutrition_db.search("arroz", limit=10))
+    generics = [name for name in names if name.startswith("Arroz") and "(" not in name and name != "Arroz carolino"]
+    assert names[:len(generics)] == generics and len(generics) >= 3
+    assert names.index("Arroz carolino") < names.index("Arroz agulha (Cigala)")
+    assert _names(nutrition_db.search("arroz integ")) == ["Arroz integral cozido"]
+    assert nutrition_db.stats()["foods"][nutrition_db.OFF_SOURCE] == 2
+
+
+def test_food_search_answers_locally_first(db, monkeypatch):
+    nutrition_db.import_generic_foods()
+    monkeypatch.setattr(food_data, "_search_foods_remote", lambda *args: pytest.fail("OFF must not be called"))
+    results = food_data.search_foods("frango assado", page_size=3)
+    assert results[0]["name"] == "Frango assado com pele"
+    assert results[0]["source"] == nutrition_db.GENERIC_SOURCE
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+import cache_store
+import negotiator
+import prewarm
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(prewarm, "PREWARM_ENABLED", True)
+    monkeypatch.setattr(prewarm, "PREWARM_DB_PATH", str(tmp_path / "prewarm.sqlite3"))
+    monkeypatch.setattr(prewarm, "_local", type(prewarm._local)())
+    monkeypatch.setattr(cache_store, "CACHE_DIR", str(tmp_path))
+    prewarm._buffer.clear()
+    yield
+    prewarm._buffer.clear()
+
+
+@pytest.mark.parametrize("backend, shared", [("off", False), ("memory", False), ("sqlite", True), ("tiered", True)])
+def test_worker_only_starts_with_a_shared_result_pool(enabled, monkeypatch, backend, shared):
+    monkeypatch.setattr(negotiator, "_result_cache", cache_store.build_cache(backend, "negotiator_results", 10))
+    assert prewarm.can_start() is shared
+
+
+def test_worker_stays_off_when_disabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(prewarm, "PREWARM_ENABLED", False)
+    monkeypatch.setattr(negotiator, "_result_cache", cache_store.SQLiteCache(str(tmp_path / "pool.sqlite3")))
+    assert not prewarm.can_start()
+
+
+def test_requests_are_not_logged_without_a_shared_pool(enabled, monkeypatch):
+    monkeypatch.setattr(negotiator, "_result_cache", None)
+    prewarm.record_request("bacalhau", 600, "lose", [])
+    assert len(prewarm._buffer) == 0
+
+
+def test_logged_requests_become_popular_targets(enabled, monkeypatch, tmp_path):
+    monkeypatch.setattr(negotiator, "_result_cache", cache_store.SQLiteCache(str(tmp_path / "pool.sqlite3")))
+    for _ in range(3):
+        prewarm.record_request("Bacalhau à Brás", 640, "lose", ["gluten"], 1800)
+    prewarm.record_request("pizza", 640, "lose", ["gluten"], 1800)
+    targets = prewarm.popular_targets()
+    assert len(prewarm._buffer) == 0
+    assert targets[0]["craving"] == "Bacalhau à Brás"
+    assert targets[0]["allergens"] == ["gluten"]
+    assert {target["craving"] for target in targets} == {"Bacalhau à Brás", "pizza"}
+
+
+def test_only_one_worker_holds_the_lease(enabled, monkeypatch):
+    assert prewarm._acquire_lease()
+    monkeypatch.setattr(prewarm, "_owner", "outro-worker")
+    assert not prewarm._acquire_lease()
+
+
+def test_warm_round_stops_when_the_pool_is_full(enabled, monkeypatch, tmp_path):
+    monkeypatch.setattr(negotiator, "_result_cache", cache_store.SQLiteCache(str(tmp_path / "pool.sqlite3")))
+    monkeypatch.setattr(prewarm, "popular_targets", lambda: [{"craving": "sopa", "target_calories": 500, "plan_goal": None, "allergens": [], "daily_target_calories": None}])
+    monkeypatch.setattr(negotiator, "cached_variant_count", lambda **target: negotiator.NEGOTIATOR_CACHE_VARIANTS)
+
+    async def fail(**target):
+        raise AssertionError("não devia gerar")
+
+    monkeypatch.setattr(negotiator, "negotiate_craving", fail)
+    assert asyncio.run(prewarm.warm_once()) == 0
@@ -0,0 +1,82 @@
+import time
+import pytest
+import food_data
+import provider_health
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(provider_health, "PROVIDER_HEALTH_SHARED", False)
+    monkeypatch.setattr(provider_health, "PROVIDER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(provider_health, "PROVIDER_RECOVERY_SECONDS", 0.05)
+    monkeypatch.setattr(provider_health, "_breakers", {})
+    monkeypatch.setattr(provider_health, "_stats", {})
+
+
+class FakeResponse:
+    ok = True
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def _open_breaker(name):
+    for _ in range(provider_health.PROVIDER_FAILURE_THRESHOLD):
+        provider_health.record_failure(name)
+    assert provider_health.breaker(name).state == OPEN
+
+
+def test_guard_skips_open_provider_and_counts_it():
+    _open_breaker("mealdb")
+    with pytest.raises(provider_health.ProviderUnavailable):
+        with provider_health.guard("mealdb"):
+            pytest.fail("provider must not be called while the breaker is open")
+    assert provider_health.get_health()["providers"]["mealdb"]["skipped"] == 1
+
+
+def test_guard_not_failure_errors_keep_provider_up():
+    for _ in range(3):
+        with pytest.raises(LookupError):
+            with provider_health.guard("mealdb", is_failure=lambda e: not isinstance(e, LookupError)):
+                raise LookupError("404")
+    assert provider_health.breaker("mealdb").state == CLOSED
+
+
+def test_half_open_allows_a_single_probe():
+    _open_breaker("openai")
+    time.sleep(0.06)
+    assert provider_health.breaker("openai").state == HALF_OPEN
+    assert provider_health.allow("openai")
+    assert not provider_health.allow("openai")
+    provider_health.record_success("openai")
+    assert provider_health.breaker("openai").state == CLOSED
+
+
+@pytest.mark.parametrize("payload", [{"products": ["not a product"]}, ["unexpected", "list"]])
+def test_malformed_off_payload_fails_the_probe(monkeypatch, payload):
+    monkeypatch.setattr(food_data.requests, "get", lambda *args, **kwargs: FakeResponse(payload))
+    _open_breaker("openfoodfacts")
+    time.sleep(0.06)
+
+    with pytest.raises(AttributeError):
+        food_data._search_foods_remote("arroz", 5)
+    # The probe was resolved as a failure: the breaker reopens instead of staying half-open or closing
+    assert provider_health.breaker("openfoodfacts").state == OPEN
+    assert food_data._search_foods_remote("arroz", 5) is None
+
+
+def test_valid_off_payload_closes_the_breaker(monkeypatch):
+    payload = {"products": [{"product_name": "Arroz", "nutriments": {"energy-kcal_100g": 130}}]}
+    monkeypatch.setattr(food_data.requests, "get", lambda *args, **kwargs: FakeResponse(payload))
+    _open_breaker("openfoodfacts")
+    time.sleep(0.06)
+
+    results = food_data._search_foods_remote("arroz", 5)
+    assert results[0]["name"] == "Arroz"
+    assert results[0]["calories_per_100g"] == 130
+    assert provider_health.breaker("openfoodfacts").state == CLOSED
@@ -0,0 +1,79 @@
+import os
+import time
+from types import SimpleNamespace
+import pytest
+import mealdb_mirror
+import recipe_index
+from sqlite_fts import LocalSearchDB
+from test_mealdb_mirror import CATALOGUE, _fetch, _meal
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    """Mirror with the test catalogue, an empty index dir and a recipes table held in `recipes`."""
+    monkeypatch.setattr(mealdb_mirror, "_db", LocalSearchDB(str(tmp_path / "mirror.sqlite3")))
+    mealdb_mirror.sync_mirror(_fetch(CATALOGUE))
+    monkeypatch.setattr(recipe_index, "RECIPE_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(recipe_index, "_loaded", None)
+    recipes = {}
+
+    def load_recipes(ids=None):
+        return [recipe_index._recipe_as_meal(recipe) for recipe in recipes.values() if ids is None or recipe.id in ids]
+
+    monkeypatch.setattr(recipe_index, "_load_recipes_table", load_recipes)
+    return recipes
+
+
+def _build():
+    # Build ids are millisecond timestamps
+    time.sleep(0.002)
+    return recipe_index.build_index()
+
+
+def _titles(hits):
+    return [meal["strMeal"] for _, meal in hits]
+
+
+def test_recipe_rows_are_shaped_like_meals():
+    recipe = SimpleNamespace(id=7, name="Sopa", instructions="Ferver.", ingredients="- 2 cenouras\n1 batata; sal")
+    meal = recipe_index._recipe_as_meal(recipe)
+    assert meal["idMeal"] == "recipe-7"
+    assert [meal[f"strIngredient{i}"] for i in (1, 2, 3)] == ["2 cenouras", "1 batata", "sal"]
+
+
+def test_missing_index_returns_nothing(index):
+    assert not recipe_index.is_available()
+    assert recipe_index.search("chicken") == []
+    assert recipe_index.stats()["available"] is False
+
+
+def test_search_tolerates_typos_and_resolves_both_sources(index):
+    index[1] = SimpleNamespace(id=1, name="Sopa de cenoura", instructions="", ingredients="cenoura\nbatata")
+    assert _build() == 5
+    assert _titles(recipe_index.search("chiken curry"))[0] == "Chicken Curry"
+    assert _titles(recipe_index.search("sopa cenouras"))[0] == "Sopa de cenoura"
+    first, second = recipe_index.search_many(["beef stew", "zzzz"])
+    assert _titles(first)[0] == "Beef Stew"
+    assert second == []
+
+
+def test_deleted_meals_are_dropped_from_hits(index):
+    index[1] = SimpleNamespace(id=1, name="Sopa de cenoura", instructions="", ingredients="cenoura")
+    _build()
+    del index[1]
+    assert "Sopa de cenoura" not in _titles(recipe_index.search("sopa de cenoura"))
+
+
+def test_rebuild_is_picked_up_and_old_versions_pruned(index):
+    _build()
+    first = recipe_index.stats()["build_id"]
+    assert recipe_index.search("sopa de cenoura") == []
+
+    index[1] = SimpleNamespace(id=1, name="Sopa de cenoura", instructions="", ingredients="cenoura")
+    _build()
+    _build()
+    assert recipe_index.stats()["build_id"] != first
+    assert _titles(recipe_index.search("sopa de cenoura"))[0] == "Sopa de cenoura"
+    versions = [name for name in os.listdir(recipe_index.RECIPE_INDEX_DIR) if name.startswith("v-")]
+    assert len(versions) == 2
+    assert f"v-{first}" not in versions
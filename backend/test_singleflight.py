@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+import pytest
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test_threads")
+    runs = []
+
+    def slow():
+        runs.append(1)
+        time.sleep(0.1)
+        return "resultado"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["resultado"] * 5
+    assert len(runs) == 1
+    assert flight.stats() == {"calls": 5, "executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    flight = SingleFlight("test_errors")
+
+    def failing():
+        raise ValueError("falhou")
+
+    with pytest.raises(ValueError):
+        flight.do("key", failing)
+    assert flight.do("key", lambda: "ok") == "ok"
+
+
+def test_async_calls_share_one_task():
+    flight = SingleFlight("test_async")
+    runs = []
+
+    async def slow():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", slow) for _ in range(4)))
+
+    assert asyncio.run(main()) == [42] * 4
+    assert len(runs) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = SingleFlight("test_cancel")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do_async("key", slow))
+        second = asyncio.ensure_future(flight.do_async("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "ok"
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import pytest
+from sse import PartialJsonField, format_event, run_with_events
+
+DOCUMENT = json.dumps(
+    {"intent": "chat", "message": 'Olá! Uma "tosta" leve:\n- pão\t\\ queijo é 🥗 fim', "recipe": None},
+    ensure_ascii=True,
+)
+
+
+def _stream(document: str, size: int) -> list[str]:
+    return [document[i:i + size] for i in range(0, len(document), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, len(DOCUMENT)])
+def test_partial_field_matches_full_parse(size):
+    field = PartialJsonField("message")
+    deltas = [field.feed(chunk) for chunk in _stream(DOCUMENT, size)]
+    assert "".join(deltas) == field.value
+    assert field.complete
+    assert field.value == json.loads(DOCUMENT)["message"]
+    # Every delta must be sendable on its own, so no lone surrogate halves
+    for delta in deltas:
+        delta.encode("utf-8")
+
+
+def test_partial_field_waits_for_the_key():
+    field = PartialJsonField("message")
+    assert field.feed('{"intent": "chat", "mess') == ""
+    assert field.feed('age": "Ol') == "Ol"
+    assert field.feed('á"') == "á"
+    assert field.complete
+    assert field.feed(' , "message": "outra"}') == ""
+
+
+def test_partial_field_missing_key():
+    field = PartialJsonField("message")
+    assert field.feed('{"intent": "recipe"}') == ""
+    assert not field.complete
+
+
+def test_partial_field_drops_unpaired_surrogates():
+    field = PartialJsonField("message")
+    assert field.feed('{"message": "a\\ud83eb\\udd57c"}') == "abc"
+
+
+def test_format_event():
+    assert format_event("delta", {"text": "olá"}) == 'event: delta\ndata: {"text": "olá"}\n\n'
+
+
+def test_run_with_events_yields_events_then_result():
+    async def producer(emit):
+        emit("stage", "a")
+        await asyncio.sleep(0)
+        emit("stage", "b")
+        return "feito"
+
+    async def collect():
+        return [item async for item in run_with_events(producer)]
+
+    assert asyncio.run(collect()) == [("stage", "a"), ("stage", "b"), ("result", "feito")]
+
+
+def test_run_with_events_reraises_producer_errors():
+    async def producer(emit):
+        emit("stage", "a")
+        raise RuntimeError("falhou")
+
+    async def collect():
+        return [item async for item in run_with_events(producer)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect())
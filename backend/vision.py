@@ -1,16 +1,16 @@
 import os
-import json
+import asyncio
 import base64
 import random
 from typing import List, Optional
-from openai import OpenAI
 import schemas
 import food_data
+import llm_json
 from fastapi import HTTPException, status
-from llm_client import get_client_config
+from llm_client import get_async_client_config, get_chat_completion_async, resolve_profile
 
-def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api_key: Optional[str] = None, favorite_recipes: List[schemas.Recipe] = [], allergens: List[str] = []) -> schemas.VisionResponse:
-    client, model = get_client_config()
+async def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api_key: Optional[str] = None, favorite_recipes: List[schemas.Recipe] = [], allergens: List[str] = []) -> schemas.VisionResponse:
+    client, model = get_async_client_config(api_key)
     cuisine_focus = random.choice(["mediterrânica", "asiática leve", "mexicana equilibrada", "portuguesa moderna", "levantina"])
     technique_focus = random.choice(["forno", "grelhar", "saltear rápido", "estufar leve", "air fryer"])
     format_focus = random.choice(["bowl", "wrap", "prato no prato", "salada morna", "tosta aberta"])
@@ -18,9 +18,8 @@ def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api
     # Check if we are using Groq
     is_groq = "groq" in str(client.base_url)
     
-    # Override model for Groq Vision if needed
-    if is_groq:
-         model = "meta-llama/llama-4-scout-17b-16e-instruct"
+    # "vision" profile picks the multimodal model tier (llama-4-scout on Groq)
+    model = resolve_profile("vision", client, model)["model"]
 
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
@@ -76,12 +75,10 @@ def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api
     try:
         # Groq might have issues with response_format={"type": "json_object"} for some vision models
         # We'll rely on the prompt instruction for Groq if needed, but let's try strict mode if not Groq
-        extra_args = {}
-        if not is_groq:
-            extra_args["response_format"] = {"type": "json_object"}
+        response_format = None if is_groq else {"type": "json_object"}
 
-        response = client.chat.completions.create(
-            model=model,
+        # Routed like every other LLM call: model budget, provider breaker and profile limits
+        response = await get_chat_completion_async(
             messages=[
                 {"role": "system", "content": "És um Chef Michelin e Nutricionista PT-PT que prioriza variedade alta, pouca repetição e quantidades realistas por ingrediente. Quinoa/qinoa é proibida."},
                 {"role": "user", "content": [
@@ -90,30 +87,30 @@ def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api
                 ]}
             ],
             temperature=1.08,
-            presence_penalty=0.9,
-            frequency_penalty=0.8,
-            **extra_args
+            response_format=response_format,
+            max_tokens=None,
+            profile="vision",
+            api_key=api_key,
+            extra={"presence_penalty": 0.9, "frequency_penalty": 0.8},
         )
         
         content = response.choices[0].message.content
-        # Clean up possible markdown code blocks
-        if content.startswith("```json"):
-            content = content.replace("```json", "", 1).replace("```", "", 1).strip()
-        elif content.startswith("```"):
-            content = content.replace("```", "", 1).replace("```", "", 1).strip()
-            
-        data = json.loads(content)
+        # Code fences, single quotes, trailing commas and truncation are repaired locally
+        data = llm_json.parse_object(content, "vision")
+        if data is None:
+            raise ValueError("resposta do modelo não é JSON reparável")
         
         # Calcular calorias reais via "food_data" (que usa a IA como DB)
-        raw_recipe = data.get('recipe', {})
+        raw_recipe = data.get('recipe')
+        raw_recipe = llm_json.coerce_recipe(raw_recipe) if isinstance(raw_recipe, dict) and raw_recipe else None
         if raw_recipe:
-            real_calories = food_data.calculate_recipe_calories(raw_recipe.get('ingredients', []))
+            real_calories = await asyncio.to_thread(food_data.calculate_recipe_calories, raw_recipe.get('ingredients', []))
             if real_calories > 0:
                 raw_recipe['calories'] = real_calories
 
         return schemas.VisionResponse(
-            detected_ingredients=data.get('detected_ingredients', []),
-            message=data.get('message', ''),
+            detected_ingredients=llm_json.coerce_text_list(data.get('detected_ingredients')),
+            message=str(data.get('message') or ''),
             recipe=schemas.NegotiatorRecipe(**raw_recipe) if raw_recipe else None
         )
     except Exception as e:
@@ -134,12 +131,10 @@ def analyze_image_ingredients(image_bytes: bytes, mode: str = "ingredients", api
         raise HTTPException(status_code=500, detail=f"Erro na análise visual: {str(e)}")
 
 
-def analyze_image_nutrition(image_bytes: bytes) -> schemas.NutritionAnalysisResponse:
-    client, model = get_client_config()
+async def analyze_image_nutrition(image_bytes: bytes) -> schemas.NutritionAnalysisResponse:
+    client, model = get_async_client_config()
     is_groq = "groq" in str(client.base_url)
-
-    if is_groq:
-        model = "meta-llama/llama-4-scout-17b-16e-instruct"
+    model = resolve_profile("vision", client, model)["model"]
 
     base64_image = base64.b64encode(image_bytes).decode('utf-8')
 
@@ -161,12 +156,7 @@ def analyze_image_nutrition(image_bytes: bytes) -> schemas.NutritionAnalysisResp
     )
 
     try:
-        extra_args = {}
-        if not is_groq:
-            extra_args["response_format"] = {"type": "json_object"}
-
-        response = client.chat.completions.create(
-            model=model,
+        response = await get_chat_completion_async(
             messages=[
                 {
                     "role": "system",
@@ -181,16 +171,15 @@ def analyze_image_nutrition(image_bytes: bytes) -> schemas.NutritionAnalysisResp
                 },
             ],
             temperature=0.25,
-            **extra_args,
+            response_format=None if is_groq else {"type": "json_object"},
+            max_tokens=None,
+            profile="vision",
         )
 
         content = response.choices[0].message.content
-        if content.startswith("```json"):
-            content = content.replace("```json", "", 1).replace("```", "", 1).strip()
-        elif content.startswith("```"):
-            content = content.replace("```", "", 1).replace("```", "", 1).strip()
-
-        data = json.loads(content)
+        data = llm_json.parse_object(content, "vision_nutrition")
+        if data is None:
+            raise ValueError("resposta do modelo não é JSON reparável")
 
         if not data.get("is_food", True):
             raise HTTPException(
@@ -201,12 +190,7 @@ def analyze_image_nutrition(image_bytes: bytes) -> schemas.NutritionAnalysisResp
         return schemas.NutritionAnalysisResponse(
             food_text="análise por foto",
             is_food=True,
-            name=str(data.get("name", "Refeição analisada")).strip(),
-            calories=max(0, int(data.get("calories", 0) or 0)),
-            protein=max(0.0, float(data.get("protein", 0) or 0)),
-            carbs=max(0.0, float(data.get("carbs", 0) or 0)),
-            fat=max(0.0, float(data.get("fat", 0) or 0)),
-            estimated_grams=max(0, int(data.get("estimated_grams", 0) or 0)),
+            **llm_json.coerce_nutrition(data, "Refeição analisada"),
         )
     except HTTPException:
         raise